@@ -0,0 +1,670 @@
+#!/usr/bin/env python3
+"""hfd 的 Python 下载引擎（hfd.sh --tool python）
+
+- 大文件按块并行 Range 下载，块按顺序到达时立即计算 SHA-256（LFS）或 git blob SHA-1，校验不再额外读一遍文件
+- 按块断点续传：已写入的块记录在 .chunks 文件中，中断后只下载缺失的块
+- 内容寻址的 blob 缓存：校验通过的文件按摘要存入缓存并硬链接到目标目录，
+  不同 revision 或模型变体之间相同的文件不会重复下载
+- 同步模式（--sync）：按 revision 缓存元数据并用 ETag 重新验证，把远端文件列表（大小、oid）与本地目录对比，
+  只下载新增或变化的文件，删除（或用 --keep-stale 保留）不再属于该 revision 的文件
+
+只依赖标准库，任何支持 Range 的 HTTP 服务都可以作为测试用的替身（不支持 Range 时退化为整文件下载）。
+"""
+import argparse
+import hashlib
+import http.client
+import json
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+RED, GREEN, YELLOW, NC = "\033[0;31m", "\033[0;32m", "\033[1;33m", "\033[0m"
+
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+DEFAULT_CACHE_DIR = os.environ.get("HFD_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "hfd"))
+RETRIES = 5
+READ_SIZE = 1024 * 1024
+
+
+class VerificationError(Exception):
+    """下载完成的文件大小或摘要与元数据不符"""
+
+
+class RangeNotSupported(Exception):
+    """服务端忽略了 Range 请求头"""
+
+
+def parse_size(text):
+    """把 8M、512K、1G 这样的大小转换为字节数"""
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+    text = text.strip().upper().rstrip("B")
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+def glob_regex(patterns):
+    """与 hfd.sh 相同的通配符转换：. 转义，* 匹配任意字符，多个模式取并集"""
+    if not patterns:
+        return None
+    return re.compile("|".join(p.replace(".", "\\.").replace("*", ".*") for p in patterns))
+
+
+def select_files(siblings, include=None, exclude=None):
+    include_regex, exclude_regex = glob_regex(include), glob_regex(exclude)
+    return [s for s in siblings if s.get("rfilename")
+            and (include_regex is None or include_regex.search(s["rfilename"]))
+            and (exclude_regex is None or not exclude_regex.search(s["rfilename"]))]
+
+
+def expected_digest(sibling):
+    """元数据中的摘要：LFS 文件为 sha256:<hex>，普通文件为 git blob 的 git-sha1:<hex>；没有时返回 None"""
+    lfs = sibling.get("lfs")
+    if lfs and (lfs.get("sha256") or lfs.get("oid")):
+        return "sha256:" + (lfs.get("sha256") or lfs["oid"])
+    if sibling.get("blobId"):
+        return "git-sha1:" + sibling["blobId"]
+    return None
+
+
+def file_size(sibling):
+    lfs = sibling.get("lfs")
+    return lfs["size"] if lfs and "size" in lfs else sibling.get("size")
+
+
+def new_hasher(digest, size):
+    """创建与 digest 同类的增量哈希；git blob 的 SHA-1 需要先写入 'blob <size>\\0' 头"""
+    if digest is None:
+        return None
+    algo = digest.split(":", 1)[0]
+    if algo == "git-sha1":
+        hasher = hashlib.sha1()
+        hasher.update(b"blob %d\0" % size)
+        return hasher
+    return hashlib.sha256()
+
+
+def open_url(url, headers, timeout=60):
+    """发送 GET 请求，429 和 5xx 以及网络错误时按指数退避重试，其余 HTTP 错误直接抛出"""
+    for attempt in range(RETRIES):
+        try:
+            return urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=timeout)
+        except urllib.error.HTTPError as e:
+            if (e.code < 500 and e.code != 429) or attempt == RETRIES - 1:
+                raise
+        except (urllib.error.URLError, OSError, http.client.HTTPException):
+            if attempt == RETRIES - 1:
+                raise
+        time.sleep(2 ** attempt)
+
+
+class ChunkedDownload:
+    """一个文件的分块并行下载
+
+    threads 个线程按块序号顺序领取缺失的块，用 Range 请求下载后写入 .part 文件的对应偏移；
+    主线程按顺序把到达的块送入哈希，已送入哈希的块记录到 .chunks 文件。
+    领先哈希进度超过 window 块的线程会等待，因此内存中最多缓存 window 个块。
+    恢复时，之前已完成的块从磁盘读回计算哈希（hashlib 的状态无法保存），其余的块重新下载。
+    """
+
+    def __init__(self, url, part_path, size, digest, headers, threads, chunk_size):
+        self.url = url
+        self.part_path = part_path
+        self.state_path = part_path + ".chunks"
+        self.size = size
+        self.digest = digest
+        self.headers = headers
+        self.threads = threads
+        self.chunk_size = chunk_size
+        self.chunks = max(1, -(-size // chunk_size))
+        self.window = threads * 2
+        self.downloaded = 0
+
+    def chunk_range(self, index):
+        start = index * self.chunk_size
+        return start, min(self.size, start + self.chunk_size)
+
+    def load_state(self):
+        if not (os.path.exists(self.state_path) and os.path.exists(self.part_path)):
+            return set()
+        with open(self.state_path) as f:
+            return {int(line) for line in f if line.strip()}
+
+    def fetch_chunk(self, index):
+        start, end = self.chunk_range(index)
+        for attempt in range(RETRIES):
+            try:
+                with open_url(self.url, {**self.headers, "Range": f"bytes={start}-{end - 1}"}) as response:
+                    if response.status != 206 and self.chunks > 1:
+                        raise RangeNotSupported(self.url)
+                    data = response.read()
+                if len(data) == end - start:
+                    return data
+                error = IOError(f"Chunk {index} of {self.url}: expected {end - start} bytes, got {len(data)}")
+            except (OSError, http.client.HTTPException) as e:
+                if isinstance(e, urllib.error.HTTPError):
+                    raise
+                error = e
+            time.sleep(2 ** attempt)
+        raise error
+
+    def run(self):
+        """下载并返回实际摘要（digest 为 None 时返回 None），失败时保留已完成的块以便续传"""
+        completed = self.load_state()
+        if not completed:
+            for path in (self.part_path, self.state_path):
+                if os.path.exists(path):
+                    os.remove(path)
+        hasher = new_hasher(self.digest, self.size)
+        missing = iter([i for i in range(self.chunks) if i not in completed])
+        missing_lock = threading.Lock()
+        condition = threading.Condition()
+        ready = {}
+        errors = []
+        next_hash = 0
+
+        fd = os.open(self.part_path, os.O_RDWR | os.O_CREAT, 0o644)
+        state_file = open(self.state_path, "a")
+
+        def worker():
+            while True:
+                with missing_lock:
+                    index = next(missing, None)
+                if index is None:
+                    return
+                with condition:
+                    condition.wait_for(lambda: index - next_hash < self.window or errors)
+                    if errors:
+                        return
+                try:
+                    data = self.fetch_chunk(index)
+                    os.pwrite(fd, data, index * self.chunk_size)
+                except Exception as e:
+                    with condition:
+                        errors.append(e)
+                        condition.notify_all()
+                    return
+                with condition:
+                    ready[index] = data
+                    self.downloaded += len(data)
+                    condition.notify_all()
+
+        workers = [threading.Thread(target=worker, daemon=True)
+                   for _ in range(min(self.threads, self.chunks - len(completed)))]
+        for t in workers:
+            t.start()
+        try:
+            for index in range(self.chunks):
+                if index in completed:
+                    start, end = self.chunk_range(index)
+                    data = os.pread(fd, end - start, start)
+                else:
+                    with condition:
+                        condition.wait_for(lambda: index in ready or errors)
+                        if index not in ready:
+                            raise errors[0]
+                        data = ready.pop(index)
+                    state_file.write(f"{index}\n")
+                    state_file.flush()
+                with condition:
+                    next_hash = index + 1
+                    condition.notify_all()
+                if hasher is not None:
+                    hasher.update(data)
+        finally:
+            with condition:
+                if not errors and next_hash < self.chunks:
+                    errors.append(RuntimeError("interrupted"))
+                condition.notify_all()
+            for t in workers:
+                t.join()
+            state_file.close()
+            os.close(fd)
+        return hasher.hexdigest() if hasher is not None else None
+
+    def finish(self):
+        if os.path.exists(self.state_path):
+            os.remove(self.state_path)
+
+
+def stream_download(url, part_path, size, digest, headers):
+    """不支持 Range 或大小未知时整文件顺序下载，同样边下载边计算哈希"""
+    hasher = new_hasher(digest, size) if size is not None else None
+    downloaded = 0
+    with open_url(url, headers) as response, open(part_path, "wb") as f:
+        while True:
+            data = response.read(READ_SIZE)
+            if not data:
+                break
+            f.write(data)
+            downloaded += len(data)
+            if hasher is not None:
+                hasher.update(data)
+    return (hasher.hexdigest() if hasher is not None else None), downloaded
+
+
+def place(src, dest):
+    """把 src 硬链接到 dest（跨文件系统时复制），先链接到临时名再替换，避免留下半个文件"""
+    os.makedirs(os.path.dirname(dest) or ".", exist_ok=True)
+    tmp = dest + ".hfd-link"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    try:
+        os.link(src, tmp)
+    except OSError:
+        shutil.copy2(src, tmp)
+    os.replace(tmp, dest)
+
+
+class BlobCache:
+    """按摘要存放文件的本地缓存：<root>/blobs/<算法>/<前两位>/<摘要>
+
+    blob 与模型目录中的文件是同一个 inode，所以存入时设为只读，防止就地修改模型文件时连带改坏缓存。
+    每个 blob 旁边的 <摘要>.verified 记录校验时的大小和修改时间，链接前比对；
+    不一致（或没有记录）时重新计算摘要，不匹配的 blob 直接删除，改为重新下载。
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, digest):
+        algo, hexdigest = digest.split(":", 1)
+        return os.path.join(self.root, "blobs", algo, hexdigest[:2], hexdigest)
+
+    def seal(self, blob):
+        """设为只读并记录校验时的状态"""
+        os.chmod(blob, 0o444)
+        stat = os.stat(blob)
+        with open(blob + ".verified.tmp", "w") as f:
+            json.dump({"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}, f)
+        os.replace(blob + ".verified.tmp", blob + ".verified")
+
+    def is_intact(self, blob, digest, size):
+        stat = os.stat(blob)
+        if stat.st_size != size:
+            return False
+        try:
+            with open(blob + ".verified") as f:
+                record = json.load(f)
+            if record["size"] == stat.st_size and record["mtime_ns"] == stat.st_mtime_ns and not stat.st_mode & 0o222:
+                return True
+        except (OSError, ValueError, KeyError):
+            pass
+        if hash_file(blob, digest, size) != digest.split(":", 1)[1]:
+            return False
+        self.seal(blob)
+        return True
+
+    def discard(self, blob):
+        for path in (blob, blob + ".verified"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def link(self, digest, size, dest):
+        """缓存中有同样且完好的 blob 时硬链接到 dest 并返回 True"""
+        blob = self.path(digest)
+        if not os.path.exists(blob):
+            return False
+        if not self.is_intact(blob, digest, size):
+            print(f"{YELLOW}[Warning] Cached blob {blob} was modified; downloading it again{NC}")
+            self.discard(blob)
+            return False
+        place(blob, dest)
+        return True
+
+    def store(self, digest, src, dest):
+        """把校验通过的文件移入缓存，再链接到 dest"""
+        blob = self.path(digest)
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        try:
+            os.replace(src, blob)
+        except OSError:
+            # 缓存与目标目录不在同一文件系统
+            shutil.move(src, blob)
+        self.seal(blob)
+        place(blob, dest)
+
+
+class VerifiedRegistry:
+    """记录本地目录中已校验过的文件（.hfd/verified.json），大小和修改时间不变时跳过重新下载与校验"""
+
+    def __init__(self, local_dir):
+        self.path = os.path.join(local_dir, ".hfd", "verified.json")
+        self.lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.entries = json.load(f)
+
+    def is_current(self, name, dest, digest, size):
+        entry = self.entries.get(name)
+        if entry is None or not os.path.exists(dest):
+            return False
+        stat = os.stat(dest)
+        return entry["digest"] == digest and entry["size"] == size == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns
+
+    def add(self, name, dest, digest):
+        stat = os.stat(dest)
+        with self.lock:
+            self.entries[name] = {"digest": digest, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+            self.save()
+
+    def remove(self, name):
+        with self.lock:
+            if self.entries.pop(name, None) is not None:
+                self.save()
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.entries, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.path)
+
+
+def download_file(sibling, args, cache, registry, headers):
+    """下载单个文件，返回 (状态, 实际下载的字节数)；状态为 verified / cached / downloaded"""
+    name = sibling["rfilename"]
+    dest = os.path.join(args.local_dir, name)
+    digest = expected_digest(sibling)
+    size = file_size(sibling)
+    url = args.url_prefix + name
+    if digest is not None and registry.is_current(name, dest, digest, size):
+        return "verified", 0
+    if digest is not None and cache is not None and cache.link(digest, size, dest):
+        registry.add(name, dest, digest)
+        return "cached", 0
+
+    os.makedirs(os.path.dirname(dest) or ".", exist_ok=True)
+    part_path = dest + ".part"
+    chunked = None
+    if size is not None and size > 0:
+        chunked = ChunkedDownload(url, part_path, size, digest, headers, args.threads, args.chunk_size)
+        try:
+            actual = chunked.run()
+            downloaded = chunked.downloaded
+        except RangeNotSupported:
+            chunked.finish()
+            chunked = None
+            actual, downloaded = stream_download(url, part_path, size, digest, headers)
+    else:
+        actual, downloaded = stream_download(url, part_path, size, digest, headers)
+
+    actual_size = os.path.getsize(part_path)
+    if size is not None and actual_size != size:
+        os.remove(part_path)
+        if chunked is not None:
+            chunked.finish()
+        raise VerificationError(f"expected {size} bytes, got {actual_size}")
+    if digest is not None and actual != digest.split(":", 1)[1]:
+        os.remove(part_path)
+        if chunked is not None:
+            chunked.finish()
+        raise VerificationError(f"{digest.split(':', 1)[0]} mismatch, expected {digest.split(':', 1)[1]}, got {actual}")
+    if chunked is not None:
+        chunked.finish()
+
+    if digest is not None and cache is not None:
+        cache.store(digest, part_path, dest)
+    else:
+        os.replace(part_path, dest)
+    if digest is not None:
+        registry.add(name, dest, digest)
+    return "downloaded", downloaded
+
+
+def format_bytes(n):
+    for unit in ("B", "KB", "MB", "GB"):
+        if n < 1024 or unit == "GB":
+            return f"{n:.1f}{unit}" if unit != "B" else f"{n}B"
+        n /= 1024
+
+
+def fetch_metadata(api_url, local_dir, revision, headers):
+    """获取元数据并按 revision 缓存在 .hfd/metadata/ 下
+
+    revision 是完整的 commit sha 时元数据不会变化，直接使用缓存；
+    否则带 If-None-Match 重新验证，服务端返回 304 时使用缓存。返回 (元数据, 来源)。
+    """
+    cache_dir = os.path.join(local_dir, ".hfd", "metadata")
+    base = os.path.join(cache_dir, urllib.parse.quote(revision, safe=""))
+    cache_path, etag_path = base + ".json", base + ".etag"
+    if os.path.exists(cache_path):
+        with open(cache_path) as f:
+            cached = json.load(f)
+        if re.fullmatch(r"[0-9a-f]{40}", revision):
+            return cached, "cached"
+        if os.path.exists(etag_path):
+            with open(etag_path) as f:
+                headers = {**headers, "If-None-Match": f.read().strip()}
+    try:
+        with open_url(api_url, headers) as response:
+            body = response.read()
+            etag = response.headers.get("ETag")
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return cached, "not modified"
+        raise
+    metadata = json.loads(body)
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(cache_path + ".tmp", "wb") as f:
+        f.write(body)
+    os.replace(cache_path + ".tmp", cache_path)
+    if etag:
+        with open(etag_path, "w") as f:
+            f.write(etag)
+    elif os.path.exists(etag_path):
+        os.remove(etag_path)
+    return metadata, "fetched"
+
+
+def hash_file(path, digest, size):
+    hasher = new_hasher(digest, size)
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(READ_SIZE)
+            if not data:
+                break
+            hasher.update(data)
+    return hasher.hexdigest()
+
+
+def plan_sync(files, siblings, args, registry):
+    """把选中的远端文件与本地目录对比，返回 {"unchanged", "added", "changed", "stale"}
+
+    已校验且未改动的文件直接算作未变化；本地已有但没有校验记录的文件（如 aria2c 下载的），
+    大小相同时读一遍计算摘要与远端 oid 比对，一致则登记为已校验。没有摘要的文件只能比较大小。
+    stale 是此前由 hfd.py 校验过、但已不在远端版本中的文件，不会动用户自己放入的文件。
+    stale 按过滤前的完整文件列表 siblings 计算，--include/--exclude 只决定下载哪些文件。
+    """
+    plan = {"unchanged": [], "added": [], "changed": [], "stale": []}
+    to_hash = []
+    for sibling in files:
+        name = sibling["rfilename"]
+        dest = os.path.join(args.local_dir, name)
+        digest, size = expected_digest(sibling), file_size(sibling)
+        if not os.path.exists(dest):
+            plan["added"].append(sibling)
+        elif digest is not None and registry.is_current(name, dest, digest, size):
+            plan["unchanged"].append(sibling)
+        elif size is not None and os.path.getsize(dest) != size:
+            plan["changed"].append(sibling)
+        elif digest is None:
+            plan["unchanged"].append(sibling)
+        else:
+            to_hash.append(sibling)
+
+    if to_hash:
+        print(f"{YELLOW}Hashing {len(to_hash)} existing files without a verification record...{NC}")
+
+        def check(sibling):
+            name, digest = sibling["rfilename"], expected_digest(sibling)
+            dest = os.path.join(args.local_dir, name)
+            if hash_file(dest, digest, file_size(sibling)) != digest.split(":", 1)[1]:
+                return False
+            registry.add(name, dest, digest)
+            return True
+
+        with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+            for sibling, same in zip(to_hash, executor.map(check, to_hash)):
+                plan["unchanged" if same else "changed"].append(sibling)
+
+    remote = {s["rfilename"] for s in siblings}
+    for name in sorted(set(registry.entries) - remote):
+        dest = os.path.join(args.local_dir, name)
+        plan["stale"].append({"rfilename": name, "size": os.path.getsize(dest) if os.path.exists(dest) else 0})
+    return plan
+
+
+def remove_stale(stale, args, registry):
+    """删除过期文件及其残留的 .part，并清理因此变空的目录"""
+    root = os.path.abspath(args.local_dir)
+    for entry in stale:
+        dest = os.path.join(root, entry["rfilename"])
+        for path in (dest, dest + ".part", dest + ".part.chunks"):
+            if os.path.exists(path):
+                os.remove(path)
+        registry.remove(entry["rfilename"])
+        parent = os.path.dirname(dest)
+        while parent != root and os.path.isdir(parent) and not os.listdir(parent):
+            os.rmdir(parent)
+            parent = os.path.dirname(parent)
+
+
+def print_sync_plan(plan, keep_stale):
+    def total(key):
+        return sum(file_size(s) or 0 for s in plan[key])
+
+    stale_action = "kept" if keep_stale else "to remove"
+    print(f"{YELLOW}Sync plan: {len(plan['added'])} added ({format_bytes(total('added'))}), "
+          f"{len(plan['changed'])} changed ({format_bytes(total('changed'))}), "
+          f"{len(plan['unchanged'])} unchanged ({format_bytes(total('unchanged'))}), "
+          f"{len(plan['stale'])} stale {stale_action} ({format_bytes(total('stale'))}).{NC}")
+    for key in ("added", "changed", "stale"):
+        for s in plan[key]:
+            print(f"  {key:8s} {s['rfilename']}")
+
+
+def load_siblings(metadata_path):
+    with open(metadata_path) as f:
+        metadata = json.load(f)
+    return metadata_siblings(metadata)
+
+
+def metadata_siblings(metadata):
+    siblings = metadata.get("siblings") or []
+    if siblings and not any("size" in s or "lfs" in s for s in siblings):
+        print(f"{YELLOW}[Warning] Metadata has no sizes or hashes (fetched without ?blobs=true); files will not be verified.{NC}")
+    return siblings
+
+
+def run_downloads(files, args, registry=None):
+    """并行下载 files（每次最多 jobs 个文件），返回 {"failures", "downloaded_bytes", "saved_bytes"}"""
+    headers = {"Authorization": f"Bearer {args.token}"} if args.token else {}
+    cache = None if args.no_cache else BlobCache(args.cache_dir)
+    registry = registry or VerifiedRegistry(args.local_dir)
+    totals = {"verified": 0, "cached": 0, "downloaded": 0}
+    saved_bytes = downloaded_bytes = 0
+    failures = []
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        futures = {executor.submit(download_file, s, args, cache, registry, headers): s for s in files}
+        for future in as_completed(futures):
+            sibling = futures[future]
+            name = sibling["rfilename"]
+            try:
+                status, nbytes = future.result()
+            except Exception as e:
+                failures.append(name)
+                print(f"{RED}[Error] {name}: {e}{NC}")
+                continue
+            totals[status] += 1
+            downloaded_bytes += nbytes
+            if status != "downloaded":
+                saved_bytes += file_size(sibling) or 0
+            label = {"verified": "already verified", "cached": "linked from cache", "downloaded": "downloaded and verified"
+                     if expected_digest(sibling) else "downloaded (no checksum)"}[status]
+            print(f"{GREEN}{name}{NC}: {label}")
+
+    elapsed = time.perf_counter() - start
+    rate = downloaded_bytes / elapsed if elapsed > 0 else 0
+    print(f"{GREEN}Downloaded {totals['downloaded']} files ({format_bytes(downloaded_bytes)}, {format_bytes(rate)}/s), "
+          f"linked {totals['cached']} from cache, {totals['verified']} already up to date; "
+          f"{format_bytes(saved_bytes)} not downloaded.{NC}")
+    if failures:
+        print(f"{RED}{len(failures)} files failed. Re-run to resume: {', '.join(sorted(failures))}{NC}")
+    return {"failures": failures, "downloaded_bytes": downloaded_bytes, "saved_bytes": saved_bytes}
+
+
+def run_sync(files, siblings, args):
+    """同步模式：只下载新增或变化的文件，处理过期文件，返回是否全部成功"""
+    registry = VerifiedRegistry(args.local_dir)
+    plan = plan_sync(files, siblings, args, registry)
+    print_sync_plan(plan, args.keep_stale)
+    if args.dry_run:
+        return True
+    if plan["stale"] and not args.keep_stale:
+        remove_stale(plan["stale"], args, registry)
+    result = run_downloads(plan["added"] + plan["changed"], args, registry)
+    unchanged_bytes = sum(file_size(s) or 0 for s in plan["unchanged"])
+    total_bytes = sum(file_size(s) or 0 for s in files)
+    saved = unchanged_bytes + result["saved_bytes"]
+    print(f"{GREEN}Sync saved {format_bytes(saved)} of {format_bytes(total_bytes)} "
+          f"({saved / total_bytes * 100 if total_bytes else 0:.1f}%); downloaded {format_bytes(result['downloaded_bytes'])}.{NC}")
+    return not result["failures"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Verified, resumable parallel downloader used by hfd.sh --tool python")
+    parser.add_argument("--metadata", help="Repo metadata JSON from the Hugging Face API (?blobs=true)")
+    parser.add_argument("--api-url", help="Fetch the metadata from this API URL instead, cached per revision under <local-dir>/.hfd/metadata/")
+    parser.add_argument("--revision", default="main", help="Revision the metadata belongs to (cache key for --api-url)")
+    parser.add_argument("--url-prefix", required=True, help="URL prefix of the files, e.g. https://huggingface.co/org/repo/resolve/main/")
+    parser.add_argument("--local-dir", default=".", help="Directory to download into")
+    parser.add_argument("--include", nargs="*", default=[], help="Patterns of files to include")
+    parser.add_argument("--exclude", nargs="*", default=[], help="Patterns of files to exclude")
+    parser.add_argument("--token", default=os.environ.get("HF_TOKEN"), help="Bearer token")
+    parser.add_argument("-x", "--threads", type=int, default=4, help="Parallel chunk downloads per file")
+    parser.add_argument("-j", "--jobs", type=int, default=5, help="Files downloaded in parallel")
+    parser.add_argument("--chunk-size", type=parse_size, default=DEFAULT_CHUNK_SIZE, help="Chunk size (default: 8M)")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="Content-addressed blob cache (default: ~/.cache/hfd, or $HFD_CACHE_DIR)")
+    parser.add_argument("--no-cache", action="store_true", help="Do not use the blob cache")
+    parser.add_argument("--sync", action="store_true", help="Download only added or changed files and remove stale ones")
+    parser.add_argument("--keep-stale", action="store_true", help="With --sync, keep files that are no longer in the revision")
+    parser.add_argument("--dry-run", action="store_true", help="With --sync, print the plan without changing anything")
+    args = parser.parse_args(argv)
+    if args.threads < 1 or args.jobs < 1 or args.chunk_size < 1:
+        parser.error("-x, -j and --chunk-size must be positive")
+    if bool(args.metadata) == bool(args.api_url):
+        parser.error("exactly one of --metadata and --api-url is required")
+    if (args.keep_stale or args.dry_run) and not args.sync:
+        parser.error("--keep-stale and --dry-run require --sync")
+
+    if args.api_url:
+        headers = {"Authorization": f"Bearer {args.token}"} if args.token else {}
+        try:
+            metadata, source = fetch_metadata(args.api_url, args.local_dir, args.revision, headers)
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            print(f"{RED}[Error] Failed to fetch metadata from {args.api_url}: {e}{NC}")
+            return 1
+        print(f"{GREEN}Metadata for revision {args.revision}: {source}{NC}")
+        siblings = metadata_siblings(metadata)
+    else:
+        siblings = load_siblings(args.metadata)
+    files = select_files(siblings, args.include, args.exclude)
+    if args.sync:
+        print(f"{YELLOW}Syncing {len(files)} files to {args.local_dir} with {args.jobs} jobs x {args.threads} threads...{NC}")
+        return 0 if run_sync(files, siblings, args) else 1
+    print(f"{YELLOW}Downloading {len(files)} files to {args.local_dir} with {args.jobs} jobs x {args.threads} threads...{NC}")
+    return 0 if not run_downloads(files, args)["failures"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,7 +7,7 @@ trap 'printf "${YELLOW}\nDownload interrupted. You can resume by re-running the
 display_help() {
     cat << EOF
 Usage:
-  hfd <REPO_ID> [--include include_pattern1 include_pattern2 ...] [--exclude exclude_pattern1 exclude_pattern2 ...] [--hf_username username] [--hf_token token] [--tool aria2c|wget] [-x threads] [-j jobs] [--dataset] [--local-dir path] [--revision rev]
+  hfd <REPO_ID> [--include include_pattern1 include_pattern2 ...] [--exclude exclude_pattern1 exclude_pattern2 ...] [--hf_username username] [--hf_token token] [--tool aria2c|wget|python] [-x threads] [-j jobs] [--dataset] [--local-dir path] [--revision rev] [--sync [--keep-stale]]
 
 Description:
   Downloads a model or dataset from Hugging Face using the provided repo ID.
@@ -22,14 +22,22 @@ Options:
   --exclude       (Optional) Patterns to exclude files from downloading (supports multiple patterns).
   --hf_username   (Optional) Hugging Face username for authentication (not email).
   --hf_token      (Optional) Hugging Face token for authentication.
-  --tool          (Optional) Download tool to use: aria2c (default) or wget.
-  -x              (Optional) Number of download threads for aria2c (default: 4).
-  -j              (Optional) Number of concurrent downloads for aria2c (default: 5).
+  --tool          (Optional) Download tool to use: aria2c (default), wget or python.
+                             python (hfd.py) verifies every file against the SHA-256/git oid in the
+                             metadata while downloading, resumes per chunk and keeps a blob cache
+                             (\$HFD_CACHE_DIR, default ~/.cache/hfd) shared between revisions.
+  -x              (Optional) Number of download threads per file for aria2c/python (default: 4).
+  -j              (Optional) Number of concurrent downloads for aria2c/python (default: 5).
   --dataset       (Optional) Flag to indicate downloading a dataset.
   --local-dir     (Optional) Directory path to store the downloaded data.
                              Defaults to the current directory with a subdirectory named 'repo_name'
                              if REPO_ID is is composed of 'org_name/repo_name'.
   --revision      (Optional) Model/Dataset revision to download (default: main).
+  --sync          (Optional) Update an existing local dir to the revision with the python tool: the metadata
+                             is cached per revision and revalidated with its ETag, files are diffed
+                             against the local dir by size and oid, only added or changed files are
+                             downloaded and files no longer in the revision are removed.
+  --keep-stale    (Optional) With --sync, keep files that are no longer in the revision.
 
 Example:
   hfd gpt2
@@ -37,6 +45,8 @@ Example:
   hfd meta-llama/Llama-2-7b --hf_username myuser --hf_token mytoken -x 4
   hfd lavita/medical-qa-shared-task-v1-toy --dataset
   hfd bartowski/Phi-3.5-mini-instruct-exl2 --revision 5_0
+  hfd Qwen/Qwen2.5-7B-Instruct-AWQ --tool python -x 8
+  hfd Qwen/Qwen2.5-7B-Instruct-AWQ --revision v2 --sync
 EOF
     exit 1
 }
@@ -46,6 +56,8 @@ EOF
 REPO_ID=$1
 shift
 
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+
 # Default values
 TOOL="aria2c"
 THREADS=4
@@ -68,11 +80,11 @@ while [[ $# -gt 0 ]]; do
         --hf_token) HF_TOKEN="$2"; shift 2 ;;
         --tool)
             case $2 in
-                aria2c|wget)
+                aria2c|wget|python)
                     TOOL="$2"
                     ;;
                 *)
-                    printf "%b[Error] Invalid tool. Use 'aria2c' or 'wget'.%b\n" "$RED" "$NC"
+                    printf "%b[Error] Invalid tool. Use 'aria2c', 'wget' or 'python'.%b\n" "$RED" "$NC"
                     exit 1
                     ;;
             esac
@@ -83,10 +95,19 @@ while [[ $# -gt 0 ]]; do
         --dataset) DATASET=1; shift ;;
         --local-dir) LOCAL_DIR="$2"; shift 2 ;;
         --revision) REVISION="$2"; shift 2 ;;
+        --sync) SYNC=1; shift ;;
+        --keep-stale) KEEP_STALE=1; shift ;;
         *) display_help ;;
     esac
 done
 
+if [[ "$SYNC" == 1 ]]; then
+    TOOL="python"
+elif [[ "$KEEP_STALE" == 1 ]]; then
+    printf "%b[Error] --keep-stale requires --sync.%b\n" "$RED" "$NC"
+    exit 1
+fi
+
 # Generate current command string
 generate_command_string() {
     local cmd_string="REPO_ID=$REPO_ID"
@@ -109,7 +130,8 @@ check_command() {
     fi
 }
 
-check_command curl; check_command "$TOOL"
+check_command curl
+if [[ "$TOOL" == "python" ]]; then check_command python3; else check_command "$TOOL"; fi
 
 LOCAL_DIR="${LOCAL_DIR:-${REPO_ID#*/}}"
 mkdir -p "$LOCAL_DIR/.hfd"
@@ -128,7 +150,8 @@ fi
 if [[ "$REVISION" != "main" ]]; then
     METADATA_API_PATH="$METADATA_API_PATH/revision/$REVISION"
 fi
-API_URL="$HF_ENDPOINT/api/$METADATA_API_PATH"
+# blobs=true 使元数据包含每个文件的大小和 LFS sha256 / git oid，用于下载后校验
+API_URL="$HF_ENDPOINT/api/$METADATA_API_PATH?blobs=true"
 
 METADATA_FILE="$LOCAL_DIR/.hfd/repo_metadata.json"
 
@@ -162,7 +185,10 @@ check_authentication() {
     fi
 }
 
-if [[ ! -f "$METADATA_FILE" ]]; then
+if [[ "$SYNC" == 1 ]]; then
+    # 同步模式由 hfd.py 按 revision 缓存并重新验证元数据
+    :
+elif [[ ! -f "$METADATA_FILE" ]]; then
     printf "%bFetching repo metadata...%b\n" "$YELLOW" "$NC"
     RESPONSE=$(fetch_and_save_metadata) || exit 1
     check_authentication "$RESPONSE"
@@ -200,7 +226,10 @@ should_regenerate_filelist() {
 
 fileslist_file=".hfd/${TOOL}_urls.txt"
 
-if should_regenerate_filelist; then
+if [[ "$TOOL" == "python" ]]; then
+    # hfd.py 直接读取元数据并自行过滤文件，不需要 URL 列表
+    :
+elif should_regenerate_filelist; then
     # Remove existing file list if it exists
     [[ -f "$LOCAL_DIR/$fileslist_file" ]] && rm "$LOCAL_DIR/$fileslist_file"
     
@@ -314,7 +343,18 @@ fi
 printf "${YELLOW}Starting download with $TOOL to $LOCAL_DIR...\n${NC}"
 
 cd "$LOCAL_DIR"
-if [[ "$TOOL" == "aria2c" ]]; then
+if [[ "$TOOL" == "python" ]]; then
+    PY_ARGS=(--url-prefix "$HF_ENDPOINT/$DOWNLOAD_API_PATH/resolve/$REVISION/" --local-dir . -x "$THREADS" -j "$CONCURRENT")
+    if [[ "$SYNC" == 1 ]]; then
+        PY_ARGS+=(--api-url "$API_URL" --revision "$REVISION" --sync)
+        [[ "$KEEP_STALE" == 1 ]] && PY_ARGS+=(--keep-stale)
+    else
+        PY_ARGS+=(--metadata ".hfd/repo_metadata.json")
+    fi
+    ((${#INCLUDE_PATTERNS[@]})) && PY_ARGS+=(--include "${INCLUDE_PATTERNS[@]}")
+    ((${#EXCLUDE_PATTERNS[@]})) && PY_ARGS+=(--exclude "${EXCLUDE_PATTERNS[@]}")
+    HF_TOKEN="$HF_TOKEN" python3 "$SCRIPT_DIR/hfd.py" "${PY_ARGS[@]}"
+elif [[ "$TOOL" == "aria2c" ]]; then
     aria2c --console-log-level=error --file-allocation=none -x "$THREADS" -j "$CONCURRENT" -s "$THREADS" -k 1M -c -i "$fileslist_file" --save-session="$fileslist_file"
 elif [[ "$TOOL" == "wget" ]]; then
     wget -x -nH --cut-dirs="$CUT_DIRS" ${HF_TOKEN:+--header="Authorization: Bearer $HF_TOKEN"} --input-file="$fileslist_file" --continue
@@ -0,0 +1,108 @@
+import random
+from typing import Dict, Any, Optional
+
+from workloads import sample_length, validate_length
+
+# abort 配置的默认值
+DEFAULT_ABORT = {
+    "fraction": 0.0,        # 中途断开的请求比例
+    "baseline": False,      # 是否先以相同配置（不断开）运行一次作为对照
+    "seed": None,
+}
+
+
+def validate_abort_config(abort: Dict[str, Any]) -> None:
+    """检查 abort 配置，错误时抛出 ValueError
+
+    after_tokens 为收到多少个内容块后断开（整数或 workloads 的长度分布），
+    after_seconds 为发出请求多少秒后断开（数字或 {"min": ..., "max": ...} 均匀分布），二者取其一。
+    """
+    if not isinstance(abort, dict):
+        raise ValueError(f"'abort' must be an object, got {abort!r}")
+    unknown = set(abort) - set(DEFAULT_ABORT) - {"after_tokens", "after_seconds"}
+    if unknown:
+        raise ValueError(f"Unknown abort options: {', '.join(sorted(unknown))}")
+    if not 0 < abort.get("fraction", 0) <= 1:
+        raise ValueError("'abort.fraction' must be in (0, 1]")
+    if ("after_tokens" in abort) == ("after_seconds" in abort):
+        raise ValueError("'abort' requires exactly one of 'after_tokens' and 'after_seconds'")
+    if "after_tokens" in abort:
+        validate_length(abort["after_tokens"], "abort.after_tokens")
+    else:
+        seconds = abort["after_seconds"]
+        low, high = (seconds, seconds) if isinstance(seconds, (int, float)) else (seconds.get("min"), seconds.get("max"))
+        if low is None or high is None or not 0 < low <= high:
+            raise ValueError("'abort.after_seconds' must be a positive number or {\"min\": ..., \"max\": ...} with 0 < min <= max")
+
+
+class AbortPlan:
+    """为每个请求决定是否中途断开，以及在第几个内容块或第几秒断开"""
+
+    def __init__(self, config: Dict[str, Any]):
+        self.config = config
+        self.fraction = config["fraction"]
+        self.rng = random.Random(config.get("seed"))
+
+    def sample(self) -> Optional[Dict[str, float]]:
+        """返回 {"after_tokens": n} 或 {"after_seconds": s}，不断开时返回 None"""
+        if self.rng.random() >= self.fraction:
+            return None
+        if "after_tokens" in self.config:
+            return {"after_tokens": sample_length(self.config["after_tokens"], self.rng)}
+        seconds = self.config["after_seconds"]
+        if isinstance(seconds, (int, float)):
+            return {"after_seconds": float(seconds)}
+        return {"after_seconds": self.rng.uniform(seconds["min"], seconds["max"])}
+
+
+def build_abort_plan(abort: Optional[Dict[str, Any]]) -> Optional[AbortPlan]:
+    return AbortPlan(abort) if abort else None
+
+
+def summarize_abort_run(result: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """汇总断开对服务端容量的影响
+
+    - useful_throughput_ratio：客户端实际收到的 token（完成请求加上断开前收到的部分）的吞吐与对照运行的比值，
+      服务端立即回收断开请求的槽位时接近 1，继续为已断开的客户端生成时明显低于 1
+    - ttft_after_abort：闭环模式下紧跟在断开之后发出的请求的 TTFT，槽位没有回收时这些请求需要排队
+    - wasted_tokens：服务端生成的 token 数（/metrics 的 generation_tokens 增量）减去客户端收到的 token 数
+    """
+    aborted = result.get("aborted") or {}
+    # 稳态模式的吞吐按测量窗口计算，断开前收到的 token 也只统计窗口内的请求
+    elapsed = result.get("measurement_window") or result.get("total_time") or result.get("actual_duration")
+    received = result["total_output_tokens"] + aborted.get("output_tokens", 0)
+    summary = {
+        "aborted_requests": aborted.get("requests", 0),
+        "completed_requests": result["successful_requests"],
+        "tokens_received_before_abort": aborted.get("output_tokens", 0),
+        "received_tokens_per_second": result["output_tokens_per_second"] + (
+            aborted.get("output_tokens", 0) / elapsed if elapsed else 0),
+        "abort_latency": aborted.get("abort_latency"),
+        "ttft_after_abort": aborted.get("ttft_after_abort"),
+        "wasted_tokens": None,
+    }
+    generated = ((result.get("server_metrics") or {}).get("summary") or {}).get("generation_tokens")
+    if generated is not None:
+        summary["wasted_tokens"] = max(0.0, generated - received)
+        summary["wasted_fraction"] = summary["wasted_tokens"] / generated if generated else 0.0
+
+    if baseline is not None:
+        def ratio(value: Optional[float], reference: Optional[float]) -> Optional[float]:
+            return value / reference if value is not None and reference else None
+
+        ttft, base_ttft = result["time_to_first_token"], baseline["time_to_first_token"]
+        tpot, base_tpot = result["time_per_output_token"], baseline["time_per_output_token"]
+        summary["baseline"] = {
+            "requests_per_second": baseline["requests_per_second"],
+            "output_tokens_per_second": baseline["output_tokens_per_second"],
+            "ttft_p50": base_ttft["p50"],
+            "ttft_p99": base_ttft["p99"],
+            "tpot_p50": base_tpot["p50"],
+        }
+        summary["useful_throughput_ratio"] = ratio(summary["received_tokens_per_second"], baseline["output_tokens_per_second"])
+        summary["ttft_p50_ratio"] = ratio(ttft["p50"], base_ttft["p50"])
+        summary["ttft_p99_ratio"] = ratio(ttft["p99"], base_ttft["p99"])
+        summary["tpot_p50_ratio"] = ratio(tpot["p50"], base_tpot["p50"])
+        after = summary["ttft_after_abort"] or {}
+        summary["ttft_after_abort_p50_ratio"] = ratio(after.get("p50"), base_ttft["p50"])
+    return summary
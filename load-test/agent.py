@@ -0,0 +1,327 @@
+import asyncio
+import hmac
+import json
+import logging
+import os
+import time
+from typing import List, Dict, Any, Optional, Tuple
+
+import click
+from multiproc import split_load, load_summary
+from profiling import monitored, profile_options
+from records import RecordSink
+from vllm_benchmark import collect_concurrent_results, collect_distributed_results, create_progress
+
+DEFAULT_AGENT_PORT = 9100
+# agent 与协调器共享的令牌也可以通过这个环境变量提供
+AGENT_TOKEN_ENV = "BENCHMARK_AGENT_TOKEN"
+# 需要按时钟偏移校正的记录字段（Unix 时间戳）
+TIMESTAMP_FIELDS = ("send_time", "first_token_time", "end_time")
+CLOCK_SAMPLES = 16          # 估计时钟偏移的往返次数，取往返时间最短的一次
+START_LEAD = 2.0            # 统一开始时间相对下发时刻的提前量（秒），留给 agent 准备
+STREAM_LIMIT = 64 * 1024 * 1024
+
+
+async def send_message(writer: asyncio.StreamWriter, message: Dict[str, Any]) -> None:
+    """协调器与 agent 之间的消息是一行一个 JSON"""
+    writer.write((json.dumps(message, separators=(",", ":"), default=float) + "\n").encode())
+    await writer.drain()
+
+
+async def read_message(reader: asyncio.StreamReader) -> Optional[Dict[str, Any]]:
+    line = await reader.readline()
+    return json.loads(line) if line else None
+
+
+class RecordStream:
+    """agent 端的记录去处：攒批后通过连接回传给协调器，接口与 RecordWriter 相同
+
+    clock_skew 只用于在单机上模拟不同主机的时钟，真实部署时为 0。
+    """
+
+    def __init__(self, writer: asyncio.StreamWriter, clock_skew: float = 0.0,
+                 batch_size: int = 256, flush_interval: float = 0.5):
+        self.writer = writer
+        self.clock_skew = clock_skew
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.buffer: List[Dict[str, Any]] = []
+        self.last_flush = time.monotonic()
+
+    def write(self, record: Dict[str, Any]) -> None:
+        if self.clock_skew:
+            record = {**record, **{f: record[f] + self.clock_skew for f in TIMESTAMP_FIELDS if record.get(f) is not None}}
+        self.buffer.append(record)
+        if len(self.buffer) >= self.batch_size or time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self) -> None:
+        # 只写入传输层的缓冲区，由事件循环在后台发送
+        self.last_flush = time.monotonic()
+        if self.buffer:
+            batch, self.buffer = self.buffer, []
+            self.writer.write((json.dumps({"type": "records", "records": batch}, separators=(",", ":"), default=float) + "\n").encode())
+
+    def close(self) -> None:
+        self.flush()
+
+
+def allowed_path(path: str, allowed: List[str]) -> bool:
+    """path 是否为允许列表中的文件，或位于允许列表中的目录之下（按解析符号链接后的真实路径比较）"""
+    real = os.path.realpath(path)
+    for entry in (os.path.realpath(a) for a in allowed):
+        if real == entry or (os.path.isdir(entry) and real.startswith(entry.rstrip(os.sep) + os.sep)):
+            return True
+    return False
+
+
+class BenchmarkAgent:
+    """在负载机上运行的 agent：响应协调器的时钟探测，按下发的开始时间执行分到的负载并回传原始记录
+
+    run 消息决定了 agent 向哪个 URL 发送什么内容，所以每个连接的第一条消息必须携带共享令牌；
+    数据集类 workload 只能读取运维方在 agent 端用 allowed_workloads 放行的文件。
+    """
+
+    def __init__(self, token: str, allowed_workloads: Optional[List[str]] = None, clock_skew: float = 0.0):
+        self.token = token
+        self.allowed_workloads = allowed_workloads or []
+        self.clock_skew = clock_skew
+
+    def clock(self) -> float:
+        return time.time() + self.clock_skew
+
+    async def authenticate(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> bool:
+        message = await read_message(reader)
+        if (message is None or message.get("type") != "hello"
+                or not hmac.compare_digest(str(message.get("token", "")).encode(), self.token.encode())):
+            await send_message(writer, {"type": "error", "error": "authentication failed"})
+            return False
+        await send_message(writer, {"type": "welcome"})
+        return True
+
+    def check_workload(self, kwargs: Dict[str, Any]) -> Optional[str]:
+        """不允许读取的 workload 返回拒绝原因"""
+        path = (kwargs.get("workload") or {}).get("path")
+        if path is not None and not allowed_path(path, self.allowed_workloads):
+            return f"workload path {path} is not allowed on this agent (see --allow_workload)"
+        return None
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        peer = writer.get_extra_info("peername")
+        try:
+            if not await self.authenticate(reader, writer):
+                logging.warning(f"Rejected connection from {peer}: authentication failed")
+                return
+            while True:
+                message = await read_message(reader)
+                if message is None:
+                    break
+                if message["type"] == "ping":
+                    await send_message(writer, {"type": "pong", "time": self.clock()})
+                elif message["type"] == "run":
+                    await self.run(message, writer)
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError) as e:
+            logging.warning(f"Connection from coordinator {peer} lost: {str(e)}")
+        finally:
+            writer.close()
+
+    async def run(self, message: Dict[str, Any], writer: asyncio.StreamWriter) -> None:
+        """等到统一开始时间（本机时钟）后执行负载，记录边完成边回传，最后发送 done"""
+        index = message["index"]
+        rejected = self.check_workload(message["kwargs"])
+        if rejected is not None:
+            logging.error(f"Agent {index} refused to run: {rejected}")
+            now = time.time() + self.clock_skew
+            await send_message(writer, {"type": "done", "start_time": now, "end_time": now, "start_lag": 0.0,
+                                        "cpu_time": 0.0, "cpu_percent": 0, "loop_lag": None, "error": rejected})
+            return
+        collect = collect_distributed_results if message["mode"] == "distributed" else collect_concurrent_results
+        sink = RecordSink(worker=index, writer=RecordStream(writer, self.clock_skew))
+        logging.info(f"Agent {index}: {message['mode']} share of {message['kwargs']['num_requests']} requests")
+
+        await asyncio.sleep(max(0, message["start_at"] - self.clock()))
+        start_lag = self.clock() - message["start_at"]
+        cpu_start = time.process_time()
+        start_time = end_time = time.time()
+        error = None
+        lag = None
+        try:
+            (_, start_time, end_time), lag = await monitored(collect(**message["kwargs"], sink=sink),
+                                                             message.get("lag_interval"))
+        except Exception as e:
+            error = str(e)
+            end_time = time.time()
+            sink.close()
+            logging.error(f"Agent {index} failed: {error}")
+        cpu_time = time.process_time() - cpu_start
+        await send_message(writer, {
+            "type": "done",
+            "start_time": start_time + self.clock_skew,
+            "end_time": end_time + self.clock_skew,
+            "start_lag": start_lag,
+            "cpu_time": cpu_time,
+            "cpu_percent": cpu_time / (end_time - start_time) * 100 if end_time > start_time else 0,
+            "loop_lag": lag.stats() if lag is not None else None,
+            "error": error,
+        })
+
+
+def parse_agents(spec: str, token: Optional[str]) -> List[Tuple[str, int, str]]:
+    """--agents 为逗号分隔的 host:port，省略端口时使用 DEFAULT_AGENT_PORT；返回 (host, port, 令牌)"""
+    if not token:
+        raise ValueError(f"--agents requires the agents' shared token (--agent_token or {AGENT_TOKEN_ENV})")
+    agents = []
+    for item in (s.strip() for s in spec.split(",")):
+        if not item:
+            continue
+        host, _, port = item.rpartition(":") if ":" in item else (item, "", str(DEFAULT_AGENT_PORT))
+        if not port.isdigit():
+            raise ValueError(f"Invalid agent address '{item}', expected host:port")
+        agents.append((host, int(port), token))
+    if not agents:
+        raise ValueError("--agents requires at least one host:port")
+    return agents
+
+
+async def open_agent(host: str, port: int, token: str) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    """连接 agent 并用共享令牌完成认证"""
+    reader, writer = await asyncio.open_connection(host, port, limit=STREAM_LIMIT)
+    await send_message(writer, {"type": "hello", "token": token})
+    reply = await read_message(reader)
+    if reply is None or reply.get("type") != "welcome":
+        writer.close()
+        raise ConnectionError(f"Agent {host}:{port} rejected the connection: "
+                              f"{(reply or {}).get('error', 'connection closed')}")
+    return reader, writer
+
+
+async def estimate_clock_offset(reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                                samples: int = CLOCK_SAMPLES) -> Dict[str, float]:
+    """NTP 式估计 agent 时钟相对本机的偏移（agent 时间 - 本机时间）
+
+    假设请求和响应的单程延迟相同，agent 时间对应往返的中点；取往返时间最短的一次，误差不超过其一半。
+    """
+    best = None
+    for _ in range(samples):
+        t0 = time.time()
+        await send_message(writer, {"type": "ping"})
+        reply = await read_message(reader)
+        t1 = time.time()
+        if reply is None:
+            raise ConnectionError("Agent closed the connection during clock sync")
+        rtt = t1 - t0
+        if best is None or rtt < best["rtt"]:
+            best = {"offset": reply["time"] - (t0 + t1) / 2, "rtt": rtt}
+    return best
+
+
+async def run_agent_benchmark(
+    config: Dict[str, Any],
+    agents: List[Tuple[str, int, str]],
+    vllm_url: str,
+    api_key: str,
+    use_long_context: bool,
+    model: str
+) -> Dict[str, Any]:
+    """协调多台负载机执行一个测试配置
+
+    先逐个估计各 agent 的时钟偏移，再按 agent 数拆分负载（开环模式拆分同一个发送计划），
+    下发换算到各自时钟的统一开始时间。记录回传后按偏移校正时间戳，由协调器统一计算全局分位数。
+    """
+    connections = await asyncio.gather(*(open_agent(host, port, token) for host, port, token in agents))
+    names = [f"{host}:{port}" for host, port, _ in agents]
+    try:
+        clocks = [await estimate_clock_offset(reader, writer) for reader, writer in connections]
+        mode, num_requests, duration, shares = split_load(config, len(agents), vllm_url, api_key, use_long_context, model)
+        start_at = time.time() + START_LEAD + max(c["rtt"] for c in clocks)
+        profile = profile_options(config)
+        lag_interval = profile["interval"] if profile["loop_lag"] else None
+        for i, ((_, writer), clock, kwargs) in enumerate(zip(connections, clocks, shares)):
+            await send_message(writer, {"type": "run", "index": i, "mode": mode, "kwargs": kwargs,
+                                        "start_at": start_at + clock["offset"], "lag_interval": lag_interval})
+
+        sink = RecordSink(config.get("record_file"), config.get("slo"))
+        with create_progress() as progress:
+            task = progress.add_task(f"[cyan]Processing {num_requests} requests on {len(agents)} agents", total=num_requests)
+
+            async def receive(i: int, reader: asyncio.StreamReader, offset: float) -> Dict[str, Any]:
+                successful = 0
+                while True:
+                    message = await read_message(reader)
+                    if message is None:
+                        raise ConnectionError(f"Agent {names[i]} closed the connection before finishing")
+                    if message["type"] == "records":
+                        for record in message["records"]:
+                            for field in TIMESTAMP_FIELDS:
+                                if record.get(field) is not None:
+                                    record[field] -= offset
+                            successful += record["status"] == "ok"
+                            sink.add(record)
+                        progress.update(task, advance=len(message["records"]))
+                    elif message["type"] == "done":
+                        message["start_time"] -= offset
+                        message["end_time"] -= offset
+                        return {**message, "successful_requests": successful}
+
+            reports = await asyncio.gather(*(receive(i, reader, clock["offset"])
+                                             for i, ((reader, _), clock) in enumerate(zip(connections, clocks))))
+        sink.close()
+    finally:
+        for _, writer in connections:
+            writer.close()
+
+    start_time = min(r["start_time"] for r in reports)
+    elapsed = max(r["end_time"] for r in reports) - start_time
+    summary = load_summary(config, num_requests, duration, elapsed, use_long_context, model)
+    if config.get("record_file"):
+        summary["record_file"] = config["record_file"]
+    summary.update(sink.summary(elapsed, num_requests))
+    # start_spread 是校正后各 agent 实际开始时间的最大差值，反映同步精度
+    summary["start_spread"] = max(r["start_time"] for r in reports) - start_time
+    summary["agents"] = [
+        {
+            "agent": name,
+            "clock_offset": clock["offset"],
+            "rtt": clock["rtt"],
+            "start_lag": report["start_lag"],
+            "successful_requests": report["successful_requests"],
+            "cpu_percent": report["cpu_percent"],
+            "loop_lag": report.get("loop_lag"),
+            "error": report["error"],
+        }
+        for name, clock, report in zip(names, clocks, reports)
+    ]
+    return summary
+
+
+async def serve(host: str, port: int, token: str, allowed_workloads: List[str], clock_skew: float) -> None:
+    agent = BenchmarkAgent(token, allowed_workloads, clock_skew)
+    server = await asyncio.start_server(agent.handle_connection, host, port, limit=STREAM_LIMIT)
+    logging.info(f"Benchmark agent listening on {host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+@click.command()
+@click.option("--host", type=str, default="127.0.0.1", help="Host to bind (use the host's private address to accept remote coordinators)")
+@click.option("--port", type=int, default=DEFAULT_AGENT_PORT, help="Port to bind")
+@click.option("--token", type=str, required=True, envvar=AGENT_TOKEN_ENV, help=f"Shared token coordinators must present (or set {AGENT_TOKEN_ENV})")
+@click.option("--allow_workload", type=click.Path(exists=True), multiple=True, help="Dataset file or directory that workloads may read (repeatable)")
+@click.option("--clock_skew", type=float, default=0.0, help="Seconds added to this agent's clock (to test offset correction on one host)")
+def main(host: str, port: int, token: str, allow_workload: Tuple[str, ...], clock_skew: float) -> None:
+    """Run a load-generator agent that executes its share of a benchmark for a coordinator.
+
+    Start one agent per client host with a shared token, then run run_benchmarks.py with
+    --agents host1:9100,host2:9100 and the same token.
+    """
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    logging.getLogger("openai").setLevel(logging.WARNING)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    try:
+        asyncio.run(serve(host, port, token, list(allow_workload), clock_skew))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
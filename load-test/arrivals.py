@@ -0,0 +1,218 @@
+import json
+import math
+from typing import List, Dict, Any, Optional
+import numpy as np
+
+# 支持的到达模式：前三种按固定请求数在 duration 内分布，后三种为开环到达过程
+SPREAD_MODES = ["uniform", "normal", "exponential", "poisson", "gamma", "trace"]
+
+# 没有配置 duration 的开环测试（回放 trace、只给 num_requests）的单请求超时，与并发模式一致
+DEFAULT_REQUEST_TIMEOUT = 30
+
+# 过载场景（burst）的默认值，时间单位为秒
+DEFAULT_BURST = {
+    "multiplier": 5.0,          # 突发期间到达速率相对基线的倍数
+    "start": 30,                # 突发开始的时间，之前为基线
+    "duration": 30,             # 突发持续时间，之后回到基线
+    "bucket": 1.0,              # 时间序列的分桶宽度
+    "recovery_tolerance": 0.2,  # TTFT p50 回到基线的 (1 + tolerance) 倍以内视为恢复
+    "recovery_window": 5,       # 连续这么多秒满足条件才算恢复
+}
+
+
+def _truncated_normal(rng: np.random.Generator, mean: float, std: float, low: float, high: float, size: int) -> np.ndarray:
+    """拒绝采样生成截断正态分布，避免 clip 把请求堆积在边界上"""
+    samples = np.empty(0)
+    while samples.size < size:
+        draw = rng.normal(mean, std, size * 2)
+        samples = np.concatenate([samples, draw[(draw >= low) & (draw <= high)]])
+    return samples[:size]
+
+
+def _truncated_exponential(rng: np.random.Generator, scale: float, high: float, size: int) -> np.ndarray:
+    """逆变换采样生成 [0, high] 上的截断指数分布"""
+    u = rng.uniform(0, 1, size)
+    return -scale * np.log1p(-u * (1 - math.exp(-high / scale)))
+
+
+def generate_request_times(num_requests: int, duration: float, spread_mode: str, seed: Optional[int] = None) -> np.ndarray:
+    """在 duration 内按分布模式生成 num_requests 个请求时间点（相对开始时间的秒数）"""
+    rng = np.random.default_rng(seed)
+    if spread_mode == 'uniform':
+        request_times = rng.uniform(0, duration, num_requests)
+    elif spread_mode == 'normal':
+        request_times = _truncated_normal(rng, duration / 2, duration / 6, 0, duration, num_requests)
+    elif spread_mode == 'exponential':
+        request_times = _truncated_exponential(rng, duration / 3, duration, num_requests)
+    else:
+        raise ValueError(f"Unknown spread mode: {spread_mode}")
+    return np.sort(request_times)
+
+
+def renewal_arrivals(
+    request_rate: float,
+    duration: Optional[float] = None,
+    num_requests: Optional[int] = None,
+    cv: float = 1.0,
+    seed: Optional[int] = None
+) -> np.ndarray:
+    """生成目标速率的开环到达过程
+
+    到达间隔服从 Gamma 分布，形状参数 k = 1 / cv^2：cv = 1 即泊松过程，
+    cv > 1 为突发流量，cv < 1 比泊松更平滑。到 duration 或 num_requests 先到者为止。
+    """
+    if request_rate <= 0:
+        raise ValueError(f"request_rate must be > 0, got {request_rate}")
+    if cv <= 0:
+        raise ValueError(f"burstiness_cv must be > 0, got {cv}")
+    if duration is None and num_requests is None:
+        raise ValueError("Either duration or num_requests is required for open-loop arrivals")
+
+    rng = np.random.default_rng(seed)
+    shape = 1.0 / (cv * cv)
+    scale = 1.0 / (request_rate * shape)
+    target = num_requests if num_requests is not None else int(request_rate * duration * 1.2) + 16
+
+    # 分批生成间隔直到覆盖 duration，避免逐个采样的 Python 循环
+    times = np.cumsum(rng.gamma(shape, scale, target))
+    while duration is not None and num_requests is None and times[-1] < duration:
+        more = np.cumsum(rng.gamma(shape, scale, target)) + times[-1]
+        times = np.concatenate([times, more])
+    if duration is not None:
+        times = times[times < duration]
+    if num_requests is not None:
+        times = times[:num_requests]
+    return times
+
+
+def burst_arrivals(
+    request_rate: float,
+    duration: float,
+    burst: Dict[str, Any],
+    cv: float = 1.0,
+    seed: Optional[int] = None
+) -> np.ndarray:
+    """基线速率 -> 突发（multiplier 倍速率，从 start 开始持续 duration 秒）-> 回到基线的分段到达过程"""
+    burst = {**DEFAULT_BURST, **burst}
+    burst_start = burst["start"]
+    burst_end = burst_start + burst["duration"]
+    phases = [(0.0, burst_start, request_rate),
+              (burst_start, burst_end, request_rate * burst["multiplier"]),
+              (burst_end, duration, request_rate)]
+    times = [renewal_arrivals(rate, end - start, cv=cv, seed=None if seed is None else seed + i) + start
+             for i, (start, end, rate) in enumerate(phases) if end > start]
+    return np.concatenate(times)
+
+
+def load_trace(path: str, time_scale: float = 1.0) -> np.ndarray:
+    """读取到达时间戳文件，返回相对第一个请求的发送时间
+
+    每行一个时间戳（秒），或者一个包含 timestamp / arrival_time 字段的 JSON 对象。
+    time_scale < 1 会压缩时间轴以回放更高的速率。
+    """
+    timestamps = []
+    with open(path, 'r') as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            try:
+                timestamps.append(float(line))
+                continue
+            except ValueError:
+                pass
+            try:
+                entry = json.loads(line)
+                timestamps.append(float(entry.get("timestamp", entry.get("arrival_time"))))
+            except (json.JSONDecodeError, TypeError, ValueError, AttributeError):
+                raise ValueError(f"Invalid trace entry at {path}:{line_no}: {line[:80]}")
+    if not timestamps:
+        raise ValueError(f"Trace file {path} contains no timestamps")
+    times = np.sort(np.asarray(timestamps, dtype=float))
+    return (times - times[0]) * time_scale
+
+
+def validate_arrival_config(config: Dict[str, Any]) -> None:
+    """检查分布式/开环模式的配置，错误时抛出 ValueError"""
+    mode = config["spread_mode"]
+    if mode not in SPREAD_MODES:
+        raise ValueError(f"Invalid spread_mode '{mode}'. Must be one of: {', '.join(SPREAD_MODES)}")
+    if mode in ("uniform", "normal", "exponential"):
+        if "num_requests" not in config or "duration" not in config:
+            raise ValueError(f"spread_mode '{mode}' requires 'num_requests' and 'duration': {config}")
+    elif mode in ("poisson", "gamma"):
+        if "request_rate" not in config:
+            raise ValueError(f"spread_mode '{mode}' requires 'request_rate': {config}")
+        if "duration" not in config and "num_requests" not in config:
+            raise ValueError(f"spread_mode '{mode}' requires 'duration' or 'num_requests': {config}")
+    elif mode == "trace" and "trace_file" not in config:
+        raise ValueError(f"spread_mode 'trace' requires 'trace_file': {config}")
+    if "burst" in config:
+        validate_burst_config(config)
+
+
+def validate_burst_config(config: Dict[str, Any]) -> None:
+    """检查过载场景的配置：突发前后都要留出基线阶段"""
+    if config["spread_mode"] not in ("poisson", "gamma") or "duration" not in config or "num_requests" in config:
+        raise ValueError(f"'burst' requires spread_mode 'poisson' or 'gamma' with 'duration' and no 'num_requests': {config}")
+    if not isinstance(config["burst"], dict):
+        raise ValueError(f"'burst' must be an object, got {config['burst']!r}")
+    unknown = set(config["burst"]) - set(DEFAULT_BURST)
+    if unknown:
+        raise ValueError(f"Unknown burst options: {', '.join(sorted(unknown))}")
+    burst = {**DEFAULT_BURST, **config["burst"]}
+    if burst["multiplier"] <= 0 or burst["duration"] <= 0 or burst["bucket"] <= 0 or burst["recovery_window"] <= 0:
+        raise ValueError("'burst.multiplier', 'burst.duration', 'burst.bucket' and 'burst.recovery_window' must be > 0")
+    if burst["recovery_tolerance"] < 0:
+        raise ValueError("'burst.recovery_tolerance' must be >= 0")
+    if burst["start"] <= 0 or burst["start"] + burst["duration"] >= config["duration"]:
+        raise ValueError(f"The burst must start after 0 and end before 'duration' ({config['duration']}s), "
+                         "leaving a baseline phase before it and a recovery phase after it")
+    # 恢复从突发结束后的第一个完整桶开始判断，之后至少要有 recovery_window 秒（按桶取整）
+    bucket = burst["bucket"]
+    recovery_start = math.ceil((burst["start"] + burst["duration"]) / bucket) * bucket
+    recovery_needed = math.ceil(burst["recovery_window"] / bucket) * bucket
+    if recovery_start + recovery_needed > config["duration"]:
+        raise ValueError(f"The recovery phase after the burst must be at least 'burst.recovery_window' "
+                         f"({burst['recovery_window']}s) long; the burst ends at "
+                         f"{burst['start'] + burst['duration']}s of {config['duration']}s")
+
+
+def build_arrival_times(config: Dict[str, Any]) -> np.ndarray:
+    """根据配置生成完整的请求发送计划（相对开始时间的秒数，已排序）"""
+    validate_arrival_config(config)
+    mode = config["spread_mode"]
+    seed = config.get("seed")
+    if "burst" in config:
+        return burst_arrivals(config["request_rate"], config["duration"], config["burst"],
+                              config.get("burstiness_cv", 2.0) if mode == "gamma" else 1.0, seed)
+    if mode == "poisson":
+        return renewal_arrivals(config["request_rate"], config.get("duration"), config.get("num_requests"), 1.0, seed)
+    if mode == "gamma":
+        return renewal_arrivals(config["request_rate"], config.get("duration"), config.get("num_requests"),
+                                config.get("burstiness_cv", 2.0), seed)
+    if mode == "trace":
+        times = load_trace(config["trace_file"], config.get("trace_time_scale", 1.0))
+        if "duration" in config:
+            times = times[times < config["duration"]]
+        if "num_requests" in config:
+            times = times[:config["num_requests"]]
+        return times
+    return generate_request_times(config["num_requests"], config["duration"], mode, seed)
+
+
+def planned_duration(config: Dict[str, Any], request_times: List[float]) -> float:
+    """计划的测试时长：优先使用配置中的 duration，否则取最后一个请求的发送时间"""
+    if "duration" in config:
+        return config["duration"]
+    return float(request_times[-1]) if len(request_times) else 0.0
+
+
+def open_loop_timeout(config: Dict[str, Any]) -> float:
+    """开环测试的单请求超时：优先使用 request_timeout，其次是配置中的 duration
+
+    不能退回到由发送计划推出的时长：只有一个请求或最后一个请求在 t=0 附近的计划会得到接近 0 的超时。
+    """
+    if config.get("request_timeout") is not None:
+        return config["request_timeout"]
+    return config.get("duration", DEFAULT_REQUEST_TIMEOUT)
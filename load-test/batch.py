@@ -0,0 +1,299 @@
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import tempfile
+import time
+from typing import Dict, Any, Optional, Tuple, Iterator, List
+
+from openai import AsyncOpenAI
+from profiling import start_lag_window, end_lag_window
+from records import RecordSink
+from routing import EndpointRouter
+from stats import QuantileSketch
+from transport import open_client
+from vllm_benchmark import SHORT_PROMPTS, LONG_PROMPT_PAIRS, classify_error, failed_record, create_progress
+from workloads import build_workload
+
+# 批处理吞吐模式的默认值
+DEFAULT_BATCH = {
+    "num_prompts": 1000,        # 提示集大小
+    "prompts_per_request": 1,   # 每个 /v1/completions 请求携带的提示数（prompt 为列表）
+    "n": 1,                     # 每个提示的采样数
+    "stream": False,            # 是否使用流式响应
+    "max_in_flight": 256,       # 客户端同时在途的请求数，即服务端的队列深度
+    "prompt_file": None,        # 提示集文件：存在时直接复用，不存在时生成后保留
+}
+
+
+def validate_batch_config(config: Dict[str, Any]) -> None:
+    """检查批处理吞吐模式的配置，错误时抛出 ValueError"""
+    batch = config["batch"]
+    if not isinstance(batch, dict):
+        raise ValueError(f"'batch' must be an object, got {batch!r}")
+    unknown = set(batch) - set(DEFAULT_BATCH)
+    if unknown:
+        raise ValueError(f"Unknown batch options: {', '.join(sorted(unknown))}")
+    batch = {**DEFAULT_BATCH, **batch}
+    for key in ("num_prompts", "prompts_per_request", "n", "max_in_flight"):
+        if not isinstance(batch[key], int) or batch[key] < 1:
+            raise ValueError(f"'batch.{key}' must be a positive integer")
+    if any(k in config for k in ("concurrency", "spread_mode", "duration", "conversation", "classes")):
+        raise ValueError(f"'batch' sets its own load; remove concurrency/spread_mode/duration: {config}")
+
+
+def write_prompt_set(path: str, num_prompts: int, workload: Optional[Dict[str, Any]], output_tokens: int,
+                     use_long_context: bool, seed: Optional[int] = None) -> None:
+    """把提示集逐条写入 JSONL 文件，每行 {"prompt", "max_tokens", "extra_body"}
+
+    提示在计时开始前生成完毕，运行时顺序读取，客户端内存与提示集大小无关。
+    多条消息（如 ShareGPT 对话）按内容拼接成一个提示。
+    """
+    source = build_workload(workload, output_tokens, seed)
+    rng = random.Random(seed)
+    with open(path, "w", encoding="utf-8") as f:
+        for _ in range(num_prompts):
+            if source is not None:
+                spec = source.next_request()
+                entry = {"prompt": "\n\n".join(m["content"] for m in spec["messages"]),
+                         "max_tokens": spec["max_tokens"], "extra_body": spec.get("extra_body") or {}}
+            elif use_long_context:
+                pair = rng.choice(LONG_PROMPT_PAIRS)
+                entry = {"prompt": f"{pair['context']}\n\n{pair['prompt']}", "max_tokens": output_tokens, "extra_body": {}}
+            else:
+                entry = {"prompt": rng.choice(SHORT_PROMPTS), "max_tokens": output_tokens, "extra_body": {}}
+            f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+
+
+def prepare_prompt_set(config: Dict[str, Any], use_long_context: bool) -> Tuple[str, bool]:
+    """返回提示集文件路径以及运行后是否删除；prompt_file 已存在且条数足够时直接复用，便于在不同服务配置之间比较"""
+    batch = {**DEFAULT_BATCH, **config["batch"]}
+    path = batch["prompt_file"]
+    if path and os.path.exists(path):
+        with open(path, "rb") as f:
+            available = sum(1 for line in f if line.strip())
+        if available < batch["num_prompts"]:
+            raise ValueError(f"Prompt file {path} has {available} prompts, fewer than num_prompts ({batch['num_prompts']})")
+        return path, False
+    temporary = not path
+    if temporary:
+        fd, path = tempfile.mkstemp(prefix="batch_prompts_", suffix=".jsonl")
+        os.close(fd)
+    write_prompt_set(path, batch["num_prompts"], config.get("workload"), config.get("output_tokens", 100),
+                     use_long_context, (config.get("workload") or {}).get("seed", config.get("seed")))
+    return path, temporary
+
+
+def read_prompts(path: str, num_prompts: int) -> Iterator[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        count = 0
+        for line in f:
+            if count >= num_prompts:
+                return
+            if line.strip():
+                count += 1
+                yield json.loads(line)
+
+
+def group_prompts(entries: Iterator[Dict[str, Any]], per_request: int, max_pending: int) -> Iterator[List[Dict[str, Any]]]:
+    """把 max_tokens 和 extra_body 相同的提示凑成最多 per_request 条一组
+
+    一个请求中的所有提示共用 max_tokens 和 extra_body，不同的提示放在一起会改变输出长度分布。
+    等待凑组的提示超过 max_pending 条时先发出最大的未满组，内存仍与提示集大小无关；
+    每个提示的输出长度都不同的负载（如按参考回复长度的 ShareGPT）基本凑不成组。
+    """
+    pending: Dict[str, List[Dict[str, Any]]] = {}
+    waiting = 0
+    for entry in entries:
+        key = json.dumps([entry["max_tokens"], entry["extra_body"]], sort_keys=True)
+        group = pending.setdefault(key, [])
+        group.append(entry)
+        waiting += 1
+        if len(group) < per_request and waiting <= max_pending:
+            continue
+        if len(group) < per_request:
+            key = max(pending, key=lambda k: len(pending[k]))
+        group = pending.pop(key)
+        waiting -= len(group)
+        yield group
+    yield from pending.values()
+
+
+async def send_batch_request(
+    client,
+    model: str,
+    entries: List[Dict[str, Any]],
+    n: int,
+    stream: bool,
+    request_timeout: float
+) -> Dict[str, Any]:
+    """发送一个 /v1/completions 请求（prompt 为提示列表，max_tokens 和 extra_body 相同），返回请求记录"""
+    prompts = [e["prompt"] for e in entries]
+    max_tokens = entries[0]["max_tokens"]
+    extra_body = entries[0]["extra_body"]
+    if isinstance(client, EndpointRouter):
+        endpoint, target = client.acquire([{"role": "user", "content": prompts[0]}])
+        try:
+            record = await send_batch_request(target, model, entries, n, stream, request_timeout)
+        finally:
+            client.release(endpoint)
+        record["endpoint"] = client.urls[endpoint]
+        return record
+
+    send_time = time.time()
+    start_time = time.perf_counter()
+    first_token = None
+    try:
+        if isinstance(client, AsyncOpenAI):
+            if stream:
+                async def openai_stream():
+                    nonlocal first_token
+                    response = await client.completions.create(
+                        model=model, prompt=prompts, max_tokens=max_tokens, n=n, stream=True,
+                        stream_options={"include_usage": True}, extra_body=extra_body or None)
+                    usage = None
+                    try:
+                        async for chunk in response:
+                            if first_token is None and chunk.choices and chunk.choices[0].text:
+                                first_token = time.perf_counter()
+                            if chunk.usage is not None:
+                                usage = chunk.usage
+                    finally:
+                        await response.close()
+                    return usage
+                usage = await asyncio.wait_for(openai_stream(), timeout=request_timeout)
+            else:
+                response = await asyncio.wait_for(client.completions.create(
+                    model=model, prompt=prompts, max_tokens=max_tokens, n=n, stream=False,
+                    extra_body=extra_body or None), timeout=request_timeout)
+                usage = response.usage
+            prompt_tokens = usage.prompt_tokens if usage else None
+            output_tokens = usage.completion_tokens if usage else None
+        else:
+            payload = {"model": model, "prompt": prompts, "max_tokens": max_tokens, "n": n, "stream": stream, **extra_body}
+            if stream:
+                payload["stream_options"] = {"include_usage": True}
+                sse, timing = await asyncio.wait_for(client.stream("/completions", payload, field="text"), timeout=request_timeout)
+                first_token = sse.chunk_times[0] if sse.chunk_times else None
+                usage = sse.usage
+                prompt_tokens = usage.prompt_tokens if usage else None
+                output_tokens = usage.completion_tokens if usage else len(sse.chunk_times)
+            else:
+                body, timing = await asyncio.wait_for(client.post("/completions", payload), timeout=request_timeout)
+                usage = body.get("usage") or {}
+                prompt_tokens = usage.get("prompt_tokens")
+                output_tokens = usage.get("completion_tokens")
+            start_time = timing["send_start"]
+            send_time += timing["pool_wait"] + timing["connect_time"]
+    except asyncio.TimeoutError:
+        logging.warning(f"Batch request timed out after {request_timeout} seconds")
+        return failed_record("timeout", "Timeout", send_time, start_time, max_tokens, "timeout")
+    except Exception as e:
+        logging.error(f"Error during batch request: {str(e)}")
+        record = failed_record("error", type(e).__name__, send_time, start_time, max_tokens, classify_error(e))
+        if getattr(e, "status_code", None) is not None:
+            record["status_code"] = e.status_code
+        return record
+
+    elapsed_time = time.perf_counter() - start_time
+    ttft = first_token - start_time if first_token is not None else None
+    return {
+        "status": "ok",
+        "send_time": send_time,
+        "first_token_time": send_time + ttft if ttft is not None else None,
+        "end_time": send_time + elapsed_time,
+        "prompts": len(prompts),
+        "sequences": len(prompts) * n,
+        "prompt_tokens": prompt_tokens,
+        "max_tokens": max_tokens,
+        "output_tokens": output_tokens or 0,
+        "latency": elapsed_time,
+        "tokens_per_second": (output_tokens or 0) / elapsed_time if elapsed_time > 0 else 0,
+        "ttft": ttft,
+    }
+
+
+async def run_batch_benchmark(
+    config: Dict[str, Any],
+    vllm_url: str,
+    api_key: str,
+    use_long_context: bool,
+    model: str,
+    transport: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """批处理吞吐测试：max_in_flight 个请求同时在途，直到整个提示集处理完
+
+    吞吐按 time_to_drain（开始到最后一个请求完成）计算；drain_tail 为最后一个请求发出后到全部完成的时间，
+    反映长尾请求拖慢整批的程度。completion_time 为各请求完成时刻相对开始时间的分布。
+    只有 max_tokens 和 extra_body 相同的提示才放进同一个请求，实际请求数可能多于 num_prompts / prompts_per_request。
+    """
+    batch = {**DEFAULT_BATCH, **config["batch"]}
+    num_prompts = batch["num_prompts"]
+    per_request = batch["prompts_per_request"]
+    min_requests = math.ceil(num_prompts / per_request)
+    request_timeout = config.get("request_timeout", 3600)
+    path, temporary = prepare_prompt_set(config, use_long_context)
+    sink = RecordSink(config.get("record_file"), config.get("slo"))
+    completion_times = QuantileSketch()
+    prompts = read_prompts(path, num_prompts)
+    groups = group_prompts(prompts, per_request, per_request * batch["max_in_flight"])
+    client = await open_client(vllm_url, api_key, transport, batch["max_in_flight"])
+    last_send = 0.0
+    sequences = 0
+
+    try:
+        with create_progress() as progress:
+            task = progress.add_task(f"[cyan]Processing {num_prompts} prompts, up to {per_request} per request", total=num_prompts)
+            start_lag_window()
+            start_mono = time.perf_counter()
+
+            async def worker() -> None:
+                nonlocal last_send, sequences
+                while True:
+                    # 顺序读取提示集，同一时刻内存中只有在途请求的提示
+                    entries = next(groups, None)
+                    if entries is None:
+                        return
+                    last_send = time.perf_counter() - start_mono
+                    record = await send_batch_request(client, model, entries, batch["n"], batch["stream"], request_timeout)
+                    record["completion_time"] = time.perf_counter() - start_mono
+                    if record["status"] == "ok":
+                        completion_times.add(record["completion_time"])
+                        sequences += record["sequences"]
+                    sink.add(record)
+                    progress.update(task, advance=len(entries))
+
+            await asyncio.gather(*(worker() for _ in range(min(batch["max_in_flight"], min_requests))))
+            time_to_drain = time.perf_counter() - start_mono
+    finally:
+        end_lag_window()
+        await client.close()
+        prompts.close()
+        sink.close()
+        if temporary:
+            os.remove(path)
+
+    num_requests = sink.count
+    summary = {
+        "total_requests": num_requests,
+        "batch": batch,
+        "max_in_flight": batch["max_in_flight"],
+        "request_timeout": request_timeout,
+        "max_output_tokens": config.get("output_tokens", 100),
+        "use_long_context": use_long_context,
+        "workload": (config.get("workload") or {}).get("type", "builtin"),
+        "model": model,
+        "total_time": time_to_drain,
+        "time_to_drain": time_to_drain,
+        "drain_tail": time_to_drain - last_send,
+        # 提示按 max_tokens / extra_body 分组后实际每个请求的平均提示数
+        "prompts_per_request": num_prompts / num_requests if num_requests else 0,
+    }
+    if config.get("record_file"):
+        summary["record_file"] = config["record_file"]
+    summary.update(sink.summary(time_to_drain, num_requests))
+    summary["sequences_per_second"] = sequences / time_to_drain if time_to_drain > 0 else 0
+    summary["completion_time"] = completion_times.stats()
+    return summary
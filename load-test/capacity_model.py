@@ -0,0 +1,602 @@
+import json
+import logging
+import math
+import os
+import random
+from typing import List, Dict, Any, Optional, Tuple
+
+import click
+import numpy as np
+from rich.console import Console
+from rich.table import Table
+from compare import load_result_set, record_paths
+from workloads import sample_length, validate_length
+
+# 从原始记录中读取的字段，缺失的值为 NaN
+RECORD_FIELDS = ("prompt_tokens", "output_tokens", "ttft", "tpot", "first_token_time", "end_time")
+
+# 预测时报告的分位数
+PREDICT_PERCENTILES = (50, 90, 99)
+
+# 留出运行上比较的指标：(名称, 结果中的路径)
+HOLDOUT_METRICS = [
+    ("output tok/s", ("output_tokens_per_second",)),
+    ("ttft p50", ("time_to_first_token", "p50")),
+    ("ttft p99", ("time_to_first_token", "p99")),
+    ("tpot p50", ("time_per_output_token", "p50")),
+    ("tpot p99", ("time_per_output_token", "p99")),
+]
+
+# 分桶拟合时每个桶至少需要的样本数
+MIN_BIN_SAMPLES = 5
+
+
+def load_run_arrays(paths: List[str]) -> Optional[Dict[str, np.ndarray]]:
+    """把一次运行的原始记录（成功且在测量窗口内）读成按字段的 numpy 数组"""
+    columns: Dict[str, List[Any]] = {field: [] for field in RECORD_FIELDS}
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if record.get("status", "ok") != "ok" or not record.get("in_window", True):
+                    continue
+                for field in RECORD_FIELDS:
+                    columns[field].append(record.get(field))
+    if not columns["end_time"]:
+        return None
+    # None 转为 NaN
+    return {field: np.array(values, dtype=np.float64) for field, values in columns.items()}
+
+
+def decode_batch_sizes(first: np.ndarray, end: np.ndarray) -> np.ndarray:
+    """每个请求解码期间（第一个 token 到结束）同时在解码的请求数的时间平均，包括它自己
+
+    在解码的请求数是阶梯函数，其累积面积是分段线性函数，用 np.interp 即可精确求出任意区间的积分，
+    整个计算对百万条记录也只是几次排序和累加。
+    """
+    valid = ~np.isnan(first) & ~np.isnan(end) & (end > first)
+    times = np.concatenate([first[valid], end[valid]])
+    steps = np.concatenate([np.ones(valid.sum()), -np.ones(valid.sum())])
+    order = np.argsort(times, kind="stable")
+    times, levels = times[order], np.cumsum(steps[order])
+    area = np.concatenate([[0.0], np.cumsum(levels[:-1] * np.diff(times))])
+    batch = np.full(len(first), np.nan)
+    batch[valid] = (np.interp(end[valid], times, area) - np.interp(first[valid], times, area)) / (end[valid] - first[valid])
+    return batch
+
+
+def quantile_bins(values: np.ndarray, max_bins: int = 20) -> Tuple[np.ndarray, np.ndarray]:
+    """按分位数分桶，取值较少时每个取值一个桶；返回 (桶下标, 桶数)"""
+    unique = np.unique(values)
+    if len(unique) <= max_bins:
+        return np.searchsorted(unique, values), len(unique)
+    edges = np.unique(np.quantile(values, np.linspace(0, 1, max_bins + 1)))
+    index = np.clip(np.searchsorted(edges, values, side="right") - 1, 0, len(edges) - 2)
+    return index, len(edges) - 1
+
+
+def binned(x: np.ndarray, y: np.ndarray, percentile: float) -> Dict[str, np.ndarray]:
+    """按 x 分桶，返回每个桶 x 的中位数、y 的 percentile 分位数和样本数（样本过少的桶丢弃）"""
+    index, size = quantile_bins(x)
+    order = np.argsort(index, kind="stable")
+    bounds = np.searchsorted(index[order], np.arange(size + 1))
+    xs, ys, counts = [], [], []
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        if hi - lo >= MIN_BIN_SAMPLES:
+            members = order[lo:hi]
+            xs.append(np.median(x[members]))
+            ys.append(np.percentile(y[members], percentile))
+            counts.append(hi - lo)
+    return {"x": np.array(xs), "y": np.array(ys), "count": np.array(counts)}
+
+
+def nonnegative_fit(x: np.ndarray, y: np.ndarray, weights: np.ndarray, terms: List[str]) -> Dict[str, float]:
+    """按样本数加权的最小二乘，依次尝试 terms 的前缀直到所有系数非负
+
+    terms 为 "const"、"linear"、"quadratic" 的组合；桶数少于参数个数的组合直接跳过。
+    """
+    columns = {"const": np.ones_like(x), "linear": x, "quadratic": x * x}
+    sqrt_w = np.sqrt(weights)
+    for k in range(len(terms), 0, -1):
+        candidate = terms[:k]
+        if len(x) < len(candidate):
+            continue
+        design = np.stack([columns[t] for t in candidate], axis=1) * sqrt_w[:, None]
+        coef = np.linalg.lstsq(design, y * sqrt_w, rcond=None)[0]
+        if (coef >= 0).all():
+            return {**{t: 0.0 for t in terms}, **dict(zip(candidate, coef.tolist()))}
+    return {t: 0.0 for t in terms}
+
+
+def fit_prefill(prompt_tokens: np.ndarray, ttft: np.ndarray) -> Dict[str, Any]:
+    """拟合无排队时的 TTFT 与输入长度的关系：ttft = overhead + per_token * L + per_token_sq * L^2
+
+    每个输入长度桶取 TTFT 的 p10 近似没有排队的请求；输入长度只有一种时只能拟合过原点的直线。
+    """
+    valid = ~np.isnan(prompt_tokens) & ~np.isnan(ttft)
+    bins = binned(prompt_tokens[valid], ttft[valid], 10)
+    if not len(bins["x"]):
+        raise ValueError("Not enough records with prompt_tokens and ttft to fit prefill")
+    if len(bins["x"]) == 1:
+        coef = {"const": 0.0, "linear": float(bins["y"][0] / bins["x"][0]), "quadratic": 0.0}
+    else:
+        coef = nonnegative_fit(bins["x"], bins["y"], bins["count"], ["const", "linear", "quadratic"])
+    prefill_time = coef["linear"] * bins["x"] + coef["quadratic"] * bins["x"] ** 2
+    return {
+        "overhead": coef["const"],
+        "per_token": coef["linear"],
+        "per_token_sq": coef["quadratic"],
+        "bins": [{"input_tokens": float(x), "ttft_p10": float(y), "count": int(c),
+                  "prefill_tokens_per_second": float(x / t) if t > 0 else None}
+                 for x, y, c, t in zip(bins["x"], bins["y"], bins["count"], prefill_time)],
+    }
+
+
+def fit_decode(batch: np.ndarray, tpot: np.ndarray) -> Dict[str, Any]:
+    """拟合 TPOT 与解码批大小的线性关系：tpot = base + per_seq * B
+
+    同时保存观测值与拟合值之比的分位数，预测分位数时按这个分布重采样。
+    """
+    valid = ~np.isnan(batch) & ~np.isnan(tpot)
+    if valid.sum() < MIN_BIN_SAMPLES:
+        raise ValueError("Not enough streamed records with tpot to fit decode")
+    batch, tpot = batch[valid], tpot[valid]
+    bins = binned(batch, tpot, 50)
+    coef = nonnegative_fit(bins["x"], bins["y"], bins["count"], ["const", "linear"])
+    if coef["const"] == 0 and coef["linear"] == 0:
+        coef["const"] = float(np.median(tpot))
+    ratio = tpot / (coef["const"] + coef["linear"] * batch)
+    return {
+        "base": coef["const"],
+        "per_seq": coef["linear"],
+        "max_batch": float(np.percentile(batch, 99)),
+        "tpot_ratio_quantiles": np.quantile(ratio, np.linspace(0, 1, 101)).tolist(),
+        "bins": [{"batch": float(x), "tpot_p50": float(y), "count": int(c)}
+                 for x, y, c in zip(bins["x"], bins["y"], bins["count"])],
+    }
+
+
+def fit_saturation(results: List[Dict[str, Any]], decode: Dict[str, Any]) -> Dict[str, Any]:
+    """并发扫描的吞吐曲线：最大输出吞吐，达到其 90% 的最小并发数（拐点），以及由此得到的最大解码批大小
+
+    拐点低于扫描的最大并发时吞吐已经进入平台，最大批大小取拟合的解码吞吐 B / tpot(B) 达到平台吞吐时的 B
+    （不超过观测到的 p99 批大小）。否则扫描没有压到饱和，观测到的 p99 批大小只是下界，不作为硬上限。
+    """
+    points = sorted((r["concurrency"], r["output_tokens_per_second"], r["requests_per_second"])
+                    for r in results if "concurrency" in r and "spread_mode" not in r)
+    saturation = {
+        "max_batch": decode["max_batch"],
+        "max_batch_lower_bound": True,
+        "sweep": [{"concurrency": c, "output_tokens_per_second": t, "requests_per_second": r} for c, t, r in points],
+        "max_output_tokens_per_second": None,
+        "knee_concurrency": None,
+    }
+    if points:
+        peak = max(t for _, t, _ in points)
+        saturation["max_output_tokens_per_second"] = peak
+        saturation["knee_concurrency"] = next(c for c, t, _ in points if t >= 0.9 * peak)
+        if saturation["knee_concurrency"] < points[-1][0]:
+            saturation["max_batch_lower_bound"] = False
+            if peak * decode["per_seq"] < 1:
+                plateau_batch = peak * decode["base"] / (1 - peak * decode["per_seq"])
+                saturation["max_batch"] = min(plateau_batch, decode["max_batch"])
+    saturation["decode_tokens_per_second_at_max_batch"] = (
+        saturation["max_batch"] / (decode["base"] + decode["per_seq"] * saturation["max_batch"]))
+    return saturation
+
+
+class CapacityModel:
+    """单副本的排队模型
+
+    - 预填充：每个请求占用 GPU 的时间 p(L) = per_token * L + per_token_sq * L^2，利用率 rho = lambda * E[p]；
+      排队等待按 M/G/1（Pollaczek-Khinchine）计算均值，以概率 rho 等待、等待时间服从指数分布
+    - 解码：由 Little 定律，在解码的请求数 B = lambda * E[O - 1] * tpot(B)，tpot(B) = base + per_seq * B，有闭式解；
+      拟合 tpot(B) 的记录本身带有对应负载下预填充的干扰，不再单独乘干扰系数。B 超过 max_batch 或 rho >= 1 时该速率不可持续；
+      max_batch 只是下界（扫描没有进入吞吐平台）时不限制 B，超过它的工作点标记为外推
+    """
+
+    def __init__(self, params: Dict[str, Any]):
+        self.params = params
+        self.prefill = params["prefill"]
+        self.decode = params["decode"]
+        self.max_batch = params["saturation"]["max_batch"]
+        self.max_batch_lower_bound = params["saturation"].get("max_batch_lower_bound", False)
+
+    def prefill_time(self, input_tokens: np.ndarray) -> np.ndarray:
+        return self.prefill["per_token"] * input_tokens + self.prefill["per_token_sq"] * input_tokens ** 2
+
+    def operating_point(self, rate: float, input_tokens: np.ndarray, output_tokens: np.ndarray) -> Dict[str, Any]:
+        """给定单副本的到达速率，求预填充利用率、解码批大小和平均 TPOT"""
+        p = self.prefill_time(input_tokens)
+        rho = rate * p.mean()
+        decode_tokens = np.maximum(output_tokens - 1, 0).mean()
+        k = rate * decode_tokens
+        feasible = rho < 1 and k * self.decode["per_seq"] < 1
+        batch = k * self.decode["base"] / (1 - k * self.decode["per_seq"]) if feasible else math.inf
+        feasible = feasible and (self.max_batch_lower_bound or batch <= self.max_batch)
+        tpot = self.decode["base"] + self.decode["per_seq"] * batch if feasible else math.inf
+        wait = rate * (p * p).mean() / (2 * (1 - rho)) if feasible else math.inf
+        return {"rate": rate, "feasible": bool(feasible), "prefill_utilization": float(rho), "decode_batch": float(batch),
+                "mean_tpot": float(tpot), "queue_wait": float(wait), "prefill_time": float(p.mean()),
+                "extrapolated": bool(feasible and batch > self.max_batch)}
+
+    def max_rate(self, input_tokens: np.ndarray, output_tokens: np.ndarray) -> float:
+        """单副本可持续的最大到达速率（可行性随速率单调，二分求边界）"""
+        high = 1.0
+        while self.operating_point(high, input_tokens, output_tokens)["feasible"] and high < 1e6:
+            high *= 2
+        low = 0.0
+        for _ in range(60):
+            mid = (low + high) / 2
+            if self.operating_point(mid, input_tokens, output_tokens)["feasible"]:
+                low = mid
+            else:
+                high = mid
+        return low
+
+    def distributions(self, point: Dict[str, Any], input_tokens: np.ndarray, rng: np.random.Generator,
+                      extra_wait: float = 0.0) -> Dict[str, Dict[str, float]]:
+        """在工作点上对每个样本请求抽取 TTFT 和 TPOT，返回分位数"""
+        n = len(input_tokens)
+        rho = point["prefill_utilization"]
+        waiting = rng.random(n) < rho
+        wait = np.where(waiting, rng.exponential(point["queue_wait"] / rho if rho > 0 else 0.0, n), 0.0)
+        ttft = self.prefill["overhead"] + self.prefill_time(input_tokens) + wait + extra_wait
+        ratios = np.asarray(self.decode["tpot_ratio_quantiles"])
+        tpot = point["mean_tpot"] * np.interp(rng.random(n), np.linspace(0, 1, len(ratios)), ratios)
+        return {
+            "ttft": {f"p{p}": float(v) for p, v in zip(PREDICT_PERCENTILES, np.percentile(ttft, PREDICT_PERCENTILES))},
+            "tpot": {f"p{p}": float(v) for p, v in zip(PREDICT_PERCENTILES, np.percentile(tpot, PREDICT_PERCENTILES))},
+        }
+
+    def predict_open(self, rate: float, input_tokens: np.ndarray, output_tokens: np.ndarray,
+                     rng: np.random.Generator) -> Dict[str, Any]:
+        """开环（给定到达速率）下单副本的吞吐和延迟分位数
+
+        速率不可持续时吞吐为副本的最大可持续速率，队列持续增长，不给出延迟分位数。
+        """
+        point = self.operating_point(rate, input_tokens, output_tokens)
+        served = rate if point["feasible"] else self.max_rate(input_tokens, output_tokens)
+        prediction = {**point, "requests_per_second": served,
+                      "output_tokens_per_second": served * float(output_tokens.mean()),
+                      "input_tokens_per_second": served * float(input_tokens.mean())}
+        if point["feasible"]:
+            prediction.update(self.distributions(point, input_tokens, rng))
+        return prediction
+
+    def predict_closed(self, concurrency: int, input_tokens: np.ndarray, output_tokens: np.ndarray,
+                       rng: np.random.Generator) -> Dict[str, Any]:
+        """闭环（固定并发）下的吞吐和延迟：求 rate * 平均请求时长 = concurrency 的速率
+
+        并发超过副本能容纳的量时速率停在可持续的边界上，多出的请求排队等待槽位，按 Little 定律计入 TTFT。
+        """
+        decode_tokens = float(np.maximum(output_tokens - 1, 0).mean())
+
+        def cycle(point: Dict[str, Any]) -> float:
+            return self.prefill["overhead"] + point["prefill_time"] + point["queue_wait"] + decode_tokens * point["mean_tpot"]
+
+        low, high = 0.0, self.max_rate(input_tokens, output_tokens) * 0.999
+        if high <= 0:
+            raise ValueError("The fitted model cannot sustain any load")
+        edge = self.operating_point(high, input_tokens, output_tokens)
+        extra_wait = 0.0
+        if high * cycle(edge) < concurrency:
+            rate, point = high, edge
+            extra_wait = (concurrency - rate * cycle(edge)) / rate
+        else:
+            for _ in range(60):
+                mid = (low + high) / 2
+                if mid * cycle(self.operating_point(mid, input_tokens, output_tokens)) < concurrency:
+                    low = mid
+                else:
+                    high = mid
+            rate = low
+            point = self.operating_point(rate, input_tokens, output_tokens)
+        return {**point, "requests_per_second": rate, "slot_wait": extra_wait,
+                "output_tokens_per_second": rate * float(output_tokens.mean()),
+                "input_tokens_per_second": rate * float(input_tokens.mean()),
+                **self.distributions(point, input_tokens, rng, extra_wait)}
+
+
+def fit_model(runs: List[Dict[str, Any]], results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """用所有训练运行的记录拟合预填充和解码，用所有结果的并发扫描得到饱和点"""
+    prompt_tokens = np.concatenate([run["prompt_tokens"] for run in runs])
+    ttft = np.concatenate([run["ttft"] for run in runs])
+    tpot = np.concatenate([run["tpot"] for run in runs])
+    # 批大小按运行分别估计，不同运行的时间轴不能混在一起
+    batch = np.concatenate([decode_batch_sizes(run["first_token_time"], run["end_time"]) for run in runs])
+    decode = fit_decode(batch, tpot)
+    return {
+        "records": int(len(ttft)),
+        "runs": len(runs),
+        "prefill": fit_prefill(prompt_tokens, ttft),
+        "decode": decode,
+        "saturation": fit_saturation(results, decode),
+    }
+
+
+def metric_value(result: Dict[str, Any], path: Tuple[str, ...]) -> Optional[float]:
+    value: Any = result
+    for key in path:
+        value = value.get(key) if isinstance(value, dict) else None
+    return value
+
+
+def evaluate_holdout(model: CapacityModel, result: Dict[str, Any], run: Dict[str, np.ndarray],
+                     rng: np.random.Generator) -> Optional[Dict[str, Any]]:
+    """用留出运行自己的输入输出长度预测它的结果，返回各指标的相对误差（预测 / 观测 - 1）"""
+    valid = ~np.isnan(run["prompt_tokens"]) & ~np.isnan(run["output_tokens"])
+    input_tokens, output_tokens = run["prompt_tokens"][valid], run["output_tokens"][valid]
+    if not len(input_tokens):
+        return None
+    if "concurrency" in result and "spread_mode" not in result:
+        mode = f"concurrency {result['concurrency']}"
+        prediction = model.predict_closed(result["concurrency"], input_tokens, output_tokens, rng)
+    elif "offered_rate" in result:
+        mode = f"{result['offered_rate']:.2f} req/s"
+        prediction = model.predict_open(result["offered_rate"], input_tokens, output_tokens, rng)
+    else:
+        return None
+    predicted = {
+        "output tok/s": prediction["output_tokens_per_second"],
+        "ttft p50": (prediction.get("ttft") or {}).get("p50"),
+        "ttft p99": (prediction.get("ttft") or {}).get("p99"),
+        "tpot p50": (prediction.get("tpot") or {}).get("p50"),
+        "tpot p99": (prediction.get("tpot") or {}).get("p99"),
+    }
+    metrics = {}
+    for name, path in HOLDOUT_METRICS:
+        observed = metric_value(result, path)
+        error = predicted[name] / observed - 1 if observed and predicted[name] is not None else None
+        metrics[name] = {"observed": observed, "predicted": predicted[name], "error": error}
+    return {"run": mode, "feasible": prediction["feasible"], "metrics": metrics}
+
+
+def sample_traffic(traffic: Dict[str, Any]) -> Tuple[np.ndarray, np.ndarray]:
+    """按流量构成抽取样本请求的输入、输出长度；classes 中的每一类按 weight 占比"""
+    rng = random.Random(traffic.get("seed", 0))
+    samples = traffic.get("samples", 20000)
+    classes = traffic.get("classes") or [traffic]
+    weights = [c.get("weight", 1) for c in classes]
+    chosen = rng.choices(range(len(classes)), weights=weights, k=samples)
+    input_tokens = np.array([sample_length(classes[i]["input_len"], rng) for i in chosen], dtype=np.float64)
+    output_tokens = np.array([sample_length(classes[i]["output_len"], rng) for i in chosen], dtype=np.float64)
+    return input_tokens, output_tokens
+
+
+def validate_traffic(traffic: Dict[str, Any]) -> None:
+    """检查流量构成，错误时抛出 ValueError"""
+    if not isinstance(traffic, dict) or traffic.get("request_rate", 0) <= 0:
+        raise ValueError("Traffic needs a positive 'request_rate'")
+    for cls in traffic.get("classes") or [traffic]:
+        if "input_len" not in cls or "output_len" not in cls:
+            raise ValueError("Traffic (or each of its classes) needs 'input_len' and 'output_len'")
+        for key in ("input_len", "output_len"):
+            validate_length(cls[key], key)
+    for key in traffic.get("slo", {}):
+        metric, _, stat = key.rpartition("_")
+        if metric not in ("ttft", "tpot") or stat not in {f"p{p}" for p in PREDICT_PERCENTILES}:
+            raise ValueError(f"Invalid SLO key '{key}'. Use ttft_<p> or tpot_<p> with p in {PREDICT_PERCENTILES}")
+
+
+def plan_replicas(model: CapacityModel, traffic: Dict[str, Any], headroom: float, max_replicas: int,
+                  rng: np.random.Generator) -> Dict[str, Any]:
+    """求满足 SLO 且每个副本的速率不超过可持续上限 headroom 倍的最少副本数"""
+    input_tokens, output_tokens = sample_traffic(traffic)
+    total_rate = traffic["request_rate"]
+    slo = traffic.get("slo", {})
+    limit = model.max_rate(input_tokens, output_tokens)
+    plan = {"request_rate": total_rate, "max_rate_per_replica": limit, "headroom": headroom, "replicas": None,
+            "per_replica": None, "mean_input_tokens": float(input_tokens.mean()),
+            "mean_output_tokens": float(output_tokens.mean())}
+    if limit <= 0:
+        plan["reason"] = "the fitted model cannot sustain any load"
+        return plan
+
+    def meets(prediction: Dict[str, Any]) -> bool:
+        return prediction["feasible"] and all(
+            prediction[key.split("_")[0]][key.split("_")[1]] <= target for key, target in slo.items())
+
+    # SLO 在负载趋于零时仍不满足，增加副本也无济于事
+    if not meets(model.predict_open(limit * 1e-3, input_tokens, output_tokens, rng)):
+        plan["reason"] = "SLO not met even on an idle replica"
+        return plan
+    replicas = max(1, math.ceil(total_rate / (limit * headroom)))
+    while replicas <= max_replicas:
+        prediction = model.predict_open(total_rate / replicas, input_tokens, output_tokens, rng)
+        if meets(prediction):
+            plan["replicas"] = replicas
+            plan["per_replica"] = prediction
+            return plan
+        replicas += 1
+    plan["reason"] = f"more than {max_replicas} replicas needed"
+    return plan
+
+
+def holdout_runs(runs: List[Tuple[Dict[str, Any], Optional[Dict[str, np.ndarray]]]],
+                 every: int) -> List[Tuple[Dict[str, Any], Optional[Dict[str, np.ndarray]]]]:
+    """按负载（并发数或到达速率）排序后每 every 个有记录的运行留出一个，只从中间取
+
+    负载最低和最高的运行留在训练集里，留出运行的预测是内插而不是外推。
+    """
+    with_records = sorted((run for run in runs if run[1] is not None),
+                          key=lambda run: run[0].get("concurrency") or run[0].get("offered_rate") or 0)
+    if len(with_records) < max(every, 3):
+        return []
+    return [run for i, run in enumerate(with_records[1:-1], 1) if i % every == every // 2]
+
+
+def display_model(params: Dict[str, Any]) -> None:
+    console = Console()
+    prefill, decode, saturation = params["prefill"], params["decode"], params["saturation"]
+    table = Table(title=f"Capacity Model ({params['records']} records from {params['runs']} runs)")
+    table.add_column("Component", style="cyan")
+    table.add_column("Fit", style="green")
+    table.add_row("Prefill", f"TTFT = {prefill['overhead'] * 1000:.1f}ms + {prefill['per_token'] * 1e6:.2f}us * L"
+                  + (f" + {prefill['per_token_sq'] * 1e9:.4f}ns * L^2" if prefill["per_token_sq"] else ""))
+    for b in prefill["bins"]:
+        if b["prefill_tokens_per_second"] is not None:
+            table.add_row(f"  input {b['input_tokens']:.0f} tokens", f"{b['prefill_tokens_per_second']:.0f} prefill tok/s "
+                          f"(TTFT p10 {b['ttft_p10'] * 1000:.1f}ms, {b['count']} requests)")
+    table.add_row("Decode", f"TPOT = {decode['base'] * 1000:.2f}ms + {decode['per_seq'] * 1000:.3f}ms * batch")
+    if saturation.get("max_batch_lower_bound"):
+        table.add_row("Max Decode Batch", f">= {saturation['max_batch']:.1f} (observed p99, sweep did not plateau)")
+    else:
+        table.add_row("Max Decode Batch", f"{saturation['max_batch']:.1f} (at the sweep's throughput plateau)")
+    table.add_row("Decode tok/s at Max Batch", f"{saturation['decode_tokens_per_second_at_max_batch']:.0f}")
+    if saturation["max_output_tokens_per_second"] is not None:
+        table.add_row("Sweep Peak Output tok/s", f"{saturation['max_output_tokens_per_second']:.0f} "
+                      f"(90% reached at concurrency {saturation['knee_concurrency']})")
+    console.print(table)
+
+
+def display_holdout(holdout: List[Dict[str, Any]]) -> None:
+    table = Table(title="Prediction Error on Held-out Runs (predicted / observed - 1)")
+    table.add_column("Run", style="cyan")
+    for name, _ in HOLDOUT_METRICS:
+        table.add_column(name, style="magenta")
+    for entry in holdout:
+        cells = []
+        for name, _ in HOLDOUT_METRICS:
+            error = entry["metrics"][name]["error"]
+            cells.append(f"{error:+.1%}" if error is not None else "-")
+        table.add_row(entry["run"] + ("" if entry["feasible"] else " (saturated)"), *cells)
+    mape = holdout_mape(holdout)
+    table.add_row("[bold]mean |error|[/bold]", *[f"{mape[name]:.1%}" if mape[name] is not None else "-"
+                                                 for name, _ in HOLDOUT_METRICS])
+    Console().print(table)
+
+
+def holdout_mape(holdout: List[Dict[str, Any]]) -> Dict[str, Optional[float]]:
+    mape = {}
+    for name, _ in HOLDOUT_METRICS:
+        errors = [abs(e["metrics"][name]["error"]) for e in holdout if e["metrics"][name]["error"] is not None]
+        mape[name] = float(np.mean(errors)) if errors else None
+    return mape
+
+
+def display_plan(plan: Dict[str, Any]) -> None:
+    console = Console()
+    table = Table(title=f"Capacity Plan for {plan['request_rate']:.2f} req/s "
+                        f"(input {plan['mean_input_tokens']:.0f}, output {plan['mean_output_tokens']:.0f} tokens on average)")
+    table.add_column("Metric", style="cyan")
+    table.add_column("Value", style="green")
+    table.add_row("Max Rate per Replica", f"{plan['max_rate_per_replica']:.2f} req/s")
+    table.add_row("Replicas", str(plan["replicas"]) if plan["replicas"] else f"[red]none ({plan['reason']})[/red]")
+    prediction = plan["per_replica"]
+    if prediction:
+        table.add_row("Per Replica", f"{prediction['requests_per_second']:.2f} req/s, "
+                      f"{prediction['output_tokens_per_second']:.0f} output tok/s")
+        table.add_row("Decode Batch", f"{prediction['decode_batch']:.1f}" + (
+            " [yellow](beyond any fitted run, extrapolated)[/yellow]" if prediction.get("extrapolated") else ""))
+        table.add_row("Prefill Utilization", f"{prediction['prefill_utilization']:.1%}")
+        for key in ("ttft", "tpot"):
+            table.add_row(f"{key.upper()} (p50/p90/p99)", " / ".join(f"{prediction[key][f'p{p}']:.3f}s" for p in PREDICT_PERCENTILES))
+    console.print(table)
+
+
+def parse_json_option(ctx, param, value):
+    """解析 JSON 字符串或 JSON 文件路径"""
+    if not value:
+        return None
+    try:
+        return json.loads(value)
+    except json.JSONDecodeError:
+        try:
+            with open(value, "r") as f:
+                return json.load(f)
+        except (json.JSONDecodeError, FileNotFoundError) as e:
+            raise click.BadParameter(f"Invalid JSON: {str(e)}")
+
+
+@click.group()
+def main() -> None:
+    """Fit a per-replica performance model from benchmark runs and plan capacity for a traffic mix."""
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+@main.command()
+@click.argument("result_files", nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option("--holdout", "holdout_files", multiple=True, type=click.Path(exists=True, dir_okay=False),
+              help="Result file whose runs are only used to measure prediction error (repeatable)")
+@click.option("--holdout_every", type=int, default=4, show_default=True,
+              help="Without --holdout, hold out every Nth run that has records (0 disables)")
+@click.option("--seed", type=int, default=0, help="Random seed for sampling predicted distributions")
+@click.option("--output_file", type=str, default="capacity_model.json", show_default=True, help="Where to write the model")
+def fit(result_files: Tuple[str, ...], holdout_files: Tuple[str, ...], holdout_every: int, seed: int, output_file: str) -> None:
+    """Fit prefill, decode and saturation from run_benchmarks result files.
+
+    The results must reference raw request records (record_file) from one model/server configuration.
+    Concurrency sweeps give the saturation curve.
+    """
+    def load(paths: Tuple[str, ...]) -> List[Tuple[Dict[str, Any], Optional[Dict[str, np.ndarray]]]]:
+        runs = []
+        for path in paths:
+            for result in load_result_set(path):
+                records = record_paths(result, os.path.dirname(os.path.abspath(path)))
+                runs.append((result, load_run_arrays(records) if records else None))
+        return runs
+
+    training = load(result_files)
+    holdout = load(holdout_files)
+    if not holdout_files and holdout_every > 1:
+        holdout = holdout_runs(training, holdout_every)
+        training = [run for run in training if not any(run is h for h in holdout)]
+    runs = [arrays for _, arrays in training if arrays is not None]
+    if not runs:
+        raise click.BadParameter("No training run references readable raw records (set record_file when benchmarking)")
+    try:
+        params = fit_model(runs, [result for result, _ in training])
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    display_model(params)
+
+    model = CapacityModel(params)
+    rng = np.random.default_rng(seed)
+    evaluated = [evaluate_holdout(model, result, arrays, rng) for result, arrays in holdout if arrays is not None]
+    params["holdout"] = [e for e in evaluated if e is not None]
+    if params["holdout"]:
+        display_holdout(params["holdout"])
+        params["holdout_mape"] = holdout_mape(params["holdout"])
+    else:
+        Console().print("[yellow]No held-out runs, prediction error not measured[/yellow]")
+    with open(output_file, "w") as f:
+        json.dump(params, f, indent=2)
+    Console().print(f"Capacity model saved to [bold green]{output_file}[/bold green]")
+
+
+@main.command()
+@click.option("--model_file", type=click.Path(exists=True, dir_okay=False), required=True, help="Model written by 'fit'")
+@click.option("--traffic", callback=parse_json_option, required=True,
+              help="Traffic mix as a JSON string or file: request_rate, input_len/output_len or classes, optional slo")
+@click.option("--headroom", type=float, default=0.8, show_default=True,
+              help="Fraction of a replica's sustainable rate it may be loaded to")
+@click.option("--max_replicas", type=int, default=1000, show_default=True, help="Give up beyond this many replicas")
+@click.option("--seed", type=int, default=0, help="Random seed for sampling predicted distributions")
+@click.option("--output_file", type=str, default=None, help="Write the plan as JSON")
+def predict(model_file: str, traffic: Dict[str, Any], headroom: float, max_replicas: int, seed: int,
+            output_file: Optional[str]) -> None:
+    """Predict per-replica throughput, TTFT/TPOT percentiles and the replica count for a traffic mix."""
+    try:
+        validate_traffic(traffic)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    if not 0 < headroom <= 1:
+        raise click.BadParameter("--headroom must be in (0, 1]")
+    with open(model_file, "r") as f:
+        params = json.load(f)
+    plan = plan_replicas(CapacityModel(params), traffic, headroom, max_replicas, np.random.default_rng(seed))
+    plan["holdout_mape"] = params.get("holdout_mape")
+    display_plan(plan)
+    if plan["holdout_mape"]:
+        Console().print("Held-out prediction error of this model: " + ", ".join(
+            f"{name} {error:.1%}" for name, error in plan["holdout_mape"].items() if error is not None))
+    if output_file:
+        with open(output_file, "w") as f:
+            json.dump({"traffic": traffic, **plan}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
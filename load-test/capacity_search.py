@@ -0,0 +1,238 @@
+import asyncio
+import copy
+import logging
+from typing import List, Dict, Any, Optional, Tuple, Callable, Awaitable
+
+from rich.console import Console
+from rich.table import Table
+from steady_state import DEFAULT_STEADY
+
+# SLO 指标名到结果字典中对应字段的映射，形如 ttft_p99、tpot_p95、latency_p50
+SLO_METRICS = {
+    "ttft": "time_to_first_token",
+    "tpot": "time_per_output_token",
+    "itl": "inter_token_latency",
+    "latency": "latency",
+}
+
+SEARCH_PARAMS = ["concurrency", "request_rate"]
+
+# 到达速率由 request_rate 决定的开环模式；其余模式按 num_requests 和 duration 排布，忽略 request_rate
+RATE_SPREAD_MODES = ["poisson", "gamma"]
+
+DEFAULT_SEARCH = {
+    "growth": 2.0,                  # 指数爬升阶段每次放大的倍数
+    "tolerance": 0.1,               # 二分阶段的相对精度
+    "max_probes": 12,
+    "cooldown": 5,                  # 探测之间等待服务器恢复的秒数
+    "screen_fraction": 0.25,        # 先用这一比例的请求做快速筛查
+    "screen_margin": 1.5,           # 筛查结果超出阈值这么多倍即判定为明显失败
+    "requests_per_concurrency": 4,  # 并发模式下每个并发槽位至少发送的请求数
+}
+
+
+def validate_search_config(config: Dict[str, Any], parallelism: int = 1) -> None:
+    """检查 search 配置，错误时抛出 ValueError；parallelism 为拆分负载的进程或 agent 数"""
+    search = config["search"]
+    param = search.get("param", "concurrency")
+    if param not in SEARCH_PARAMS:
+        raise ValueError(f"Invalid search param '{param}'. Must be one of: {', '.join(SEARCH_PARAMS)}")
+    if param == "request_rate" and "spread_mode" not in config:
+        raise ValueError("Searching 'request_rate' requires an open-loop 'spread_mode' (e.g. poisson) in the configuration")
+    if param == "request_rate" and config["spread_mode"] not in RATE_SPREAD_MODES:
+        raise ValueError(f"Searching 'request_rate' requires spread_mode {' or '.join(RATE_SPREAD_MODES)}; "
+                         f"'{config['spread_mode']}' ignores request_rate")
+    if param == "concurrency" and "spread_mode" in config:
+        raise ValueError("Searching 'concurrency' requires a concurrent-mode configuration without 'spread_mode'")
+    if param == "concurrency" and search.get("start", parallelism) < parallelism:
+        # 每个进程或 agent 至少分到一个并发槽位
+        raise ValueError(f"'search.start' ({search['start']}) must be >= the number of workers or agents ({parallelism})")
+    slo = search.get("slo")
+    if not slo:
+        raise ValueError("Search configuration requires a non-empty 'slo'")
+    for key in slo:
+        parse_slo_key(key)
+    if "slo_attainment" in slo and "slo" not in config:
+        raise ValueError("SLO key 'slo_attainment' requires a per-request 'slo' in the configuration")
+
+
+def parse_slo_key(key: str) -> Tuple[str, Optional[str]]:
+    """把 ttft_p99 这样的键拆成 (结果字段, 统计量)；success_rate 和 slo_attainment 没有统计量"""
+    if key in ("success_rate", "slo_attainment"):
+        return key, None
+    metric, _, stat = key.rpartition("_")
+    if metric not in SLO_METRICS or not (stat == "average" or stat == "max" or stat.startswith("p")):
+        raise ValueError(f"Invalid SLO key '{key}'. Use success_rate, slo_attainment or <{'|'.join(SLO_METRICS)}>_<pNN|average|max>")
+    return SLO_METRICS[metric], stat
+
+
+def evaluate_slo(result: Dict[str, Any], slo: Dict[str, float]) -> Dict[str, Dict[str, Any]]:
+    """逐项检查结果是否满足 SLO，返回每项的观测值、阈值、是否通过以及超出比例"""
+    checks = {}
+    for key, target in slo.items():
+        field, stat = parse_slo_key(key)
+        if field in ("success_rate", "slo_attainment"):
+            if field == "success_rate":
+                total = result["total_requests"]
+                observed = result["successful_requests"] / total if total > 0 else 0
+            else:
+                # 按请求级 SLO（配置中的 slo）计算的达标比例
+                observed = result.get("goodput", {}).get("attainment", 0)
+            passed = observed >= target
+            ratio = target / observed if observed > 0 else float("inf")
+        else:
+            observed = result.get(field, {}).get(stat)
+            passed = observed is not None and observed <= target
+            ratio = observed / target if observed is not None and target > 0 else float("inf")
+        checks[key] = {
+            "observed": float(observed) if observed is not None else None,
+            "target": target,
+            "passed": bool(passed),
+            "ratio": float(ratio),
+        }
+    return checks
+
+
+def probe_config(base: Dict[str, Any], param: str, value: float, fraction: float = 1.0) -> Dict[str, Any]:
+    """基于基础配置生成某个负载水平的探测配置"""
+    config = copy.deepcopy(base)
+    config.pop("search", None)
+    search = {**DEFAULT_SEARCH, **base["search"]}
+    if param == "concurrency" and "duration" in config:
+        # 按时长的闭环模式只缩短测量窗口，预热和冷却保持不变
+        config["concurrency"] = int(value)
+        overhead = config.get("warmup", DEFAULT_STEADY["warmup"]) + config.get("cooldown", DEFAULT_STEADY["cooldown"])
+        config["duration"] = overhead + max(1, (config["duration"] - overhead) * fraction)
+    elif param == "concurrency":
+        config["concurrency"] = int(value)
+        num_requests = max(config.get("num_requests", 0), int(value) * search["requests_per_concurrency"])
+        config["num_requests"] = max(int(value), int(num_requests * fraction))
+    else:
+        config["request_rate"] = value
+        if "duration" in config:
+            config["duration"] = max(1, config["duration"] * fraction)
+        if "num_requests" in config:
+            config["num_requests"] = max(1, int(config["num_requests"] * fraction))
+    return config
+
+
+async def find_capacity(
+    base_config: Dict[str, Any],
+    run_probe: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]],
+    parallelism: int = 1
+) -> Dict[str, Any]:
+    """搜索满足 SLO 的最大并发数或请求速率
+
+    先从 start 开始按 growth 倍数指数爬升直到第一次违反 SLO，再在最后一个通过点
+    和第一个失败点之间二分。每个探测点先用一小部分请求做筛查，明显失败的点不再跑完整测试。
+    并发搜索的 start 默认为 parallelism（拆分负载的进程或 agent 数）。
+    """
+    search = {**DEFAULT_SEARCH, **base_config["search"]}
+    param = search.get("param", "concurrency")
+    slo = search["slo"]
+    is_int = param == "concurrency"
+    start = value = search.get("start", parallelism if is_int else 1.0)
+    upper = search.get("max", 1024 if is_int else 1000.0)
+    console = Console()
+
+    probes: List[Dict[str, Any]] = []
+    best_pass: Optional[Dict[str, Any]] = None
+    first_fail: Optional[float] = None
+
+    async def probe(level: float) -> bool:
+        nonlocal best_pass
+        if probes:
+            await asyncio.sleep(search["cooldown"])
+        screened = False
+        if search["screen_fraction"] < 1:
+            console.print(f"[cyan]Screening {param}={level} with {search['screen_fraction']:.0%} of the load...[/cyan]")
+            result = await run_probe(probe_config(base_config, param, level, search["screen_fraction"]))
+            checks = evaluate_slo(result, slo)
+            screened = any(c["ratio"] >= search["screen_margin"] for c in checks.values())
+        if not screened:
+            console.print(f"[cyan]Probing {param}={level}...[/cyan]")
+            result = await run_probe(probe_config(base_config, param, level))
+            checks = evaluate_slo(result, slo)
+        passed = all(c["passed"] for c in checks.values())
+        entry = {"value": level, "passed": passed, "screened_out": screened, "slo_checks": checks, "result": result}
+        probes.append(entry)
+        status = "[green]PASS[/green]" if passed else ("[red]FAIL (screened)[/red]" if screened else "[red]FAIL[/red]")
+        console.print(f"{param}={level}: {status}")
+        if passed and (best_pass is None or level > best_pass["value"]):
+            best_pass = entry
+        return passed
+
+    # 指数爬升
+    while len(probes) < search["max_probes"]:
+        if await probe(value):
+            if value >= upper:
+                break
+            value = min(upper, max(value + 1, int(value * search["growth"])) if is_int else value * search["growth"])
+        else:
+            first_fail = value
+            break
+
+    # 二分
+    if best_pass is not None and first_fail is not None:
+        low, high = best_pass["value"], first_fail
+        while len(probes) < search["max_probes"]:
+            if is_int:
+                if high - low <= max(1, int(low * search["tolerance"])):
+                    break
+                mid = (low + high) // 2
+            else:
+                if (high - low) / high <= search["tolerance"]:
+                    break
+                mid = round((low + high) / 2, 3)
+            if await probe(mid):
+                low = mid
+            else:
+                high = mid
+        first_fail = high
+
+    if best_pass is None:
+        logging.warning(f"SLO not met even at {param}={start}")
+
+    return {
+        "search": param,
+        "slo": slo,
+        "knee": best_pass["value"] if best_pass else None,
+        "first_failing": first_fail,
+        "knee_result": best_pass["result"] if best_pass else None,
+        # 任一探测点受客户端事件循环滞后影响时，拐点也不可信
+        "trustworthy": all(p["result"].get("trustworthy", True) for p in probes),
+        "probes": probes,
+    }
+
+
+def display_search_results(search_result: Dict[str, Any]) -> None:
+    """显示容量搜索的探测曲线和拐点"""
+    console = Console()
+    param = search_result["search"]
+    slo_keys = list(search_result["slo"])
+    table = Table(title=f"Capacity Search ({param})")
+    table.add_column(param, style="cyan")
+    table.add_column("Result", style="green")
+    table.add_column("Req/s", style="yellow")
+    for key in slo_keys:
+        table.add_column(key, style="magenta")
+
+    for entry in sorted(search_result["probes"], key=lambda e: e["value"]):
+        status = "PASS" if entry["passed"] else ("FAIL*" if entry["screened_out"] else "FAIL")
+        if entry["result"].get("trustworthy") is False:
+            status += " (untrustworthy)"
+        cells = []
+        for key in slo_keys:
+            observed = entry["slo_checks"][key]["observed"]
+            cells.append(f"{observed:.4f}" if observed is not None else "-")
+        table.add_row(str(entry["value"]), status, f"{entry['result']['requests_per_second']:.2f}", *cells)
+
+    console.print(table)
+    if search_result["knee"] is None:
+        console.print(f"[bold red]No {param} satisfied the SLO[/bold red]")
+    else:
+        console.print(f"[bold green]Max {param} meeting SLO: {search_result['knee']}[/bold green] "
+                      f"(first failing: {search_result['first_failing']})")
+    console.print("FAIL* = rejected by the short screening probe")
+    if not search_result.get("trustworthy", True):
+        console.print("[bold red]Some probes exceeded the client loop lag threshold; do not publish this capacity.[/bold red]")
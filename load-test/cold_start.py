@@ -0,0 +1,210 @@
+import json
+import logging
+import os
+import shlex
+import statistics
+import subprocess
+import threading
+import time
+from typing import List, Dict, Any, Optional
+
+import click
+from openai import OpenAI
+from rich.console import Console
+from rich.table import Table
+from prewarm import PREWARM_METHODS, DEFAULT_PATTERNS, weight_files, evict, prewarm, parse_size
+from sweep import wait_for_health, stop_server
+
+# cold：丢弃页缓存后直接启动；prewarmed：先预热再启动；overlapped：启动的同时在后台预热
+COLD_START_MODES = ["cold", "prewarmed", "overlapped"]
+DEFAULT_COMMAND = "bash " + shlex.quote(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "serve.sh"))
+PROBE_PROMPT = "Say hello."
+
+
+def first_streamed_token(vllm_url: str, api_key: str, model: str, timeout: float) -> bool:
+    """发送一个流式请求，收到第一个非空 token 时返回 True"""
+    client = OpenAI(base_url=vllm_url, api_key=api_key, timeout=timeout, max_retries=0)
+    stream = client.chat.completions.create(
+        model=model,
+        messages=[{"role": "user", "content": PROBE_PROMPT}],
+        max_tokens=8,
+        stream=True,
+    )
+    try:
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                return True
+    finally:
+        stream.close()
+    return False
+
+
+def wait_for_first_token(vllm_url: str, api_key: str, model: str, process: subprocess.Popen, deadline: float) -> int:
+    """健康检查通过后服务可能还在预热（如 CUDA graph 捕获），重试直到流式请求返回第一个 token，返回尝试次数"""
+    attempts = 0
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode} before streaming a token")
+        attempts += 1
+        try:
+            if first_streamed_token(vllm_url, api_key, model, max(1.0, deadline - time.perf_counter())):
+                return attempts
+        except Exception as e:
+            logging.debug(f"First-token probe failed: {str(e)}")
+        time.sleep(0.2)
+    raise RuntimeError("Server did not stream a token before the startup timeout")
+
+
+def run_trial(mode: str, trial: int, options: Dict[str, Any], files: List[str]) -> Dict[str, Any]:
+    """执行一次冷启动：丢弃权重的页缓存，按模式预热，启动服务并测量到健康检查通过和第一个流式 token 的时间"""
+    console = Console()
+    entry = {"mode": mode, "trial": trial, "status": "ok", "prewarm": None,
+             "ready_time": None, "first_token_time": None, "total_time": None, "probe_attempts": None}
+    evict(files)
+    prewarm_time = 0.0
+    if mode == "prewarmed":
+        entry["prewarm"] = prewarm(files, options["concurrency"], options["method"], options["chunk_size"])
+        prewarm_time = entry["prewarm"]["elapsed"]
+
+    log_file = os.path.join(options["log_dir"], f"{mode}{trial}.log")
+    command = shlex.split(options["command"])
+    console.print(f"[green]{mode} #{trial}: 启动 {options['command']}[/green]")
+    launch = time.perf_counter()
+    with open(log_file, "w") as log:
+        # 新会话使服务及其子进程成为一个进程组，便于一并关闭
+        process = subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
+    warmer = None
+    if mode == "overlapped":
+        def run_prewarm():
+            entry["prewarm"] = prewarm(files, options["concurrency"], options["method"], options["chunk_size"])
+        warmer = threading.Thread(target=run_prewarm, daemon=True)
+        warmer.start()
+    try:
+        deadline = launch + options["startup_timeout"]
+        wait_for_health(f"http://{options['host']}:{options['port']}{options['health_path']}", process,
+                        options["startup_timeout"])
+        entry["ready_time"] = time.perf_counter() - launch
+        entry["probe_attempts"] = wait_for_first_token(f"http://{options['host']}:{options['port']}/v1",
+                                                       options["api_key"], options["model"], process, deadline)
+        entry["first_token_time"] = time.perf_counter() - launch
+        entry["total_time"] = prewarm_time + entry["first_token_time"]
+        console.print(f"[green]{mode} #{trial}: 就绪 {entry['ready_time']:.1f} 秒，第一个 token {entry['first_token_time']:.1f} 秒[/green]")
+    except RuntimeError as e:
+        entry["status"] = "failed"
+        entry["error"] = str(e)
+        console.print(f"[red]{mode} #{trial} 失败: {e}（日志见 {log_file}）[/red]")
+    finally:
+        stop_server(process, options["teardown_timeout"])
+        if warmer is not None:
+            warmer.join()
+    return entry
+
+
+def summarize_trials(entries: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """每个模式成功试验的中位数"""
+    summary = {}
+    for mode in dict.fromkeys(e["mode"] for e in entries):
+        ok = [e for e in entries if e["mode"] == mode and e["status"] == "ok"]
+
+        def median(values: List[Optional[float]]) -> Optional[float]:
+            values = [v for v in values if v is not None]
+            return statistics.median(values) if values else None
+
+        summary[mode] = {
+            "trials": len([e for e in entries if e["mode"] == mode]),
+            "successful": len(ok),
+            "prewarm_time": median([e["prewarm"]["elapsed"] if e["prewarm"] else None for e in ok]),
+            "prewarm_gb_per_second": median([e["prewarm"]["gb_per_second"] if e["prewarm"] else None for e in ok]),
+            "ready_time": median([e["ready_time"] for e in ok]),
+            "first_token_time": median([e["first_token_time"] for e in ok]),
+            "total_time": median([e["total_time"] for e in ok]),
+        }
+    return summary
+
+
+def display_cold_start(summary: Dict[str, Dict[str, Any]], weights_bytes: int) -> None:
+    table = Table(title=f"Cold Start to First Streamed Token ({weights_bytes / 1e9:.2f} GB of weights, medians)")
+    table.add_column("Mode", style="cyan")
+    table.add_column("Trials", style="white")
+    table.add_column("Prewarm (s)", style="yellow")
+    table.add_column("Prewarm GB/s", style="yellow")
+    table.add_column("Ready (s)", style="blue")
+    table.add_column("First Token (s)", style="green")
+    table.add_column("Total (s)", style="bold green")
+
+    def fmt(value: Optional[float], spec: str = ".1f") -> str:
+        return format(value, spec) if value is not None else "-"
+
+    for mode, s in summary.items():
+        table.add_row(mode, f"{s['successful']}/{s['trials']}", fmt(s["prewarm_time"]), fmt(s["prewarm_gb_per_second"], ".2f"),
+                      fmt(s["ready_time"]), fmt(s["first_token_time"]), fmt(s["total_time"]))
+    Console().print(table)
+    Console().print("Total = prewarm time (prewarmed mode only) + launch to first streamed token; "
+                    "overlapped prewarms in the background while the server starts.")
+
+
+@click.command()
+@click.option("--model_dir", type=click.Path(exists=True, file_okay=False), required=True, help="Model directory the server loads (evicted and prewarmed)")
+@click.option("--model", type=str, required=True, help="Model name the server serves (used for the probe request)")
+@click.option("--command", type=str, default=DEFAULT_COMMAND, help="Server launch command (default: serve.sh)")
+@click.option("--host", type=str, default="127.0.0.1", help="Host the server listens on")
+@click.option("--port", type=int, default=8000, help="Port the server listens on")
+@click.option("--health_path", type=str, default="/health", help="Health check path")
+@click.option("--api_key", type=str, default="EMPTY", help="API key of the launched server")
+@click.option("--modes", type=str, default="cold,prewarmed", help=f"Comma-separated modes: {', '.join(COLD_START_MODES)}")
+@click.option("--repeats", type=int, default=1, help="Trials per mode (modes are interleaved)")
+@click.option("--concurrency", type=int, default=8, help="Prewarm reader threads")
+@click.option("--method", type=click.Choice(PREWARM_METHODS), default="read", help="Prewarm method")
+@click.option("--chunk_size", type=str, default="64M", help="Prewarm bytes per read task")
+@click.option("--pattern", "patterns", multiple=True, help="Weight file patterns (default: *.safetensors *.bin *.pt *.pth *.gguf)")
+@click.option("--startup_timeout", type=float, default=900, help="Seconds to wait for the first token")
+@click.option("--teardown_timeout", type=float, default=60, help="Seconds to wait after SIGTERM before SIGKILL")
+@click.option("--cooldown", type=float, default=5, help="Seconds between trials (lets GPU memory be released)")
+@click.option("--log_dir", type=str, default="cold_start_logs", help="Directory for server logs")
+@click.option("--output_file", type=str, default="cold_start_results.json", help="Output file for the results")
+def main(model_dir: str, model: str, command: str, host: str, port: int, health_path: str, api_key: str, modes: str,
+         repeats: int, concurrency: int, method: str, chunk_size: str, patterns, startup_timeout: float,
+         teardown_timeout: float, cooldown: float, log_dir: str, output_file: str) -> None:
+    """Measure time from launching the server to its first streamed token, with and without page cache prewarming.
+
+    Before every trial the weight shards are dropped from the page cache (POSIX_FADV_DONTNEED, no root needed),
+    so each trial reads the weights from disk unless the mode prewarms them.
+    """
+    mode_list = [m.strip() for m in modes.split(",") if m.strip()]
+    invalid = [m for m in mode_list if m not in COLD_START_MODES]
+    if not mode_list or invalid:
+        raise click.BadParameter(f"Invalid modes {', '.join(invalid)}. Must be from: {', '.join(COLD_START_MODES)}")
+    if repeats < 1:
+        raise click.BadParameter("--repeats must be >= 1")
+    try:
+        files = weight_files(model_dir, list(patterns) or DEFAULT_PATTERNS)
+        chunk_bytes = parse_size(chunk_size)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    logging.getLogger("openai").setLevel(logging.WARNING)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    os.makedirs(log_dir, exist_ok=True)
+    options = {"command": command, "host": host, "port": port, "health_path": health_path, "api_key": api_key,
+               "model": model, "concurrency": concurrency, "method": method, "chunk_size": chunk_bytes,
+               "startup_timeout": startup_timeout, "teardown_timeout": teardown_timeout, "log_dir": log_dir}
+    weights_bytes = sum(os.path.getsize(f) for f in files)
+    entries = []
+    # 各模式交替进行，避免磁盘或节点状态随时间的变化只影响某一个模式
+    trials = [(mode, trial) for trial in range(repeats) for mode in mode_list]
+    for i, (mode, trial) in enumerate(trials):
+        entries.append(run_trial(mode, trial, options, files))
+        if i < len(trials) - 1:
+            time.sleep(cooldown)
+
+    summary = summarize_trials(entries)
+    display_cold_start(summary, weights_bytes)
+    with open(output_file, "w") as f:
+        json.dump({"command": command, "model_dir": model_dir, "weights_bytes": weights_bytes,
+                   "summary": summary, "trials": entries}, f, indent=2)
+    Console().print(f"Cold start results saved to [bold green]{output_file}[/bold green]")
+
+
+if __name__ == "__main__":
+    main()
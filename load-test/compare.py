@@ -0,0 +1,295 @@
+import json
+import logging
+import os
+import sys
+from typing import List, Dict, Any, Optional, Tuple
+
+import click
+import numpy as np
+from rich.console import Console
+from rich.table import Table
+from records import read_records
+
+# 对比的指标：(名称, 结果字典中的路径, 原始记录字段, 统计量, 是否越大越好)
+# 统计量为分位数（0-100）或 "rate"（按秒分桶求和后的平均速率）
+COMPARE_METRICS = [
+    ("req/s", ("requests_per_second",), "requests", "rate", True),
+    ("output tok/s", ("output_tokens_per_second",), "output_tokens", "rate", True),
+    ("goodput req/s", ("goodput", "requests_per_second"), "slo_met", "rate", True),
+    ("ttft p50", ("time_to_first_token", "p50"), "ttft", 50, False),
+    ("ttft p95", ("time_to_first_token", "p95"), "ttft", 95, False),
+    ("ttft p99", ("time_to_first_token", "p99"), "ttft", 99, False),
+    ("tpot p50", ("time_per_output_token", "p50"), "tpot", 50, False),
+    ("tpot p95", ("time_per_output_token", "p95"), "tpot", 95, False),
+    ("tpot p99", ("time_per_output_token", "p99"), "tpot", 99, False),
+    ("e2e p50", ("latency", "p50"), "latency", 50, False),
+    ("e2e p95", ("latency", "p95"), "latency", 95, False),
+    ("e2e p99", ("latency", "p99"), "latency", 99, False),
+]
+
+# 对齐配置时忽略的键（只影响输出，不影响负载）
+IGNORED_CONFIG_KEYS = {"record_file", "server_metrics"}
+
+# 每批重采样的元素上限，控制 (重采样次数 x 分桶数) 索引矩阵的内存
+RESAMPLE_BATCH_ELEMENTS = 4_000_000
+
+
+def load_result_set(path: str) -> List[Dict[str, Any]]:
+    """读取 run_benchmarks 的输出文件（单个结果或结果数组），跳过容量搜索结果"""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    results = data if isinstance(data, list) else [data]
+    return [r for r in results if "probes" not in r]
+
+
+def config_key(result: Dict[str, Any]) -> str:
+    """用于跨结果集对齐的配置键；旧结果没有保存 config 时由负载参数推导"""
+    if "config" in result:
+        config = {k: v for k, v in result["config"].items() if k not in IGNORED_CONFIG_KEYS}
+    else:
+        config = {k: result.get(k) for k in ("concurrency", "spread_mode", "duration", "max_output_tokens", "workload")}
+    return json.dumps(config, sort_keys=True)
+
+
+def align_results(baseline: List[Dict[str, Any]], candidate: List[Dict[str, Any]]) -> List[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """按配置键配对；配不上的剩余结果按顺序配对（例如对比不同 transport 时配置本身不同）"""
+    remaining = list(candidate)
+    pairs = []
+    unmatched = []
+    for base in baseline:
+        match = next((c for c in remaining if config_key(c) == config_key(base)), None)
+        if match is None:
+            unmatched.append(base)
+        else:
+            remaining.remove(match)
+            pairs.append((base, match))
+    if unmatched and remaining:
+        logging.warning(f"{len(unmatched)} configurations differ between result sets, pairing them by position")
+    pairs.extend(zip(unmatched, remaining))
+    return pairs
+
+
+def record_paths(result: Dict[str, Any], result_dir: str) -> List[str]:
+    """结果引用的原始记录文件；相对路径先按当前目录、再按结果文件所在目录查找"""
+    paths = result.get("record_files") or ([result["record_file"]] if result.get("record_file") else [])
+    resolved = []
+    for path in paths:
+        if not os.path.isabs(path) and not os.path.exists(path):
+            path = os.path.join(result_dir, path)
+        if os.path.exists(path):
+            resolved.append(path)
+    return resolved if len(resolved) == len(paths) else []
+
+
+def load_samples(paths: List[str]) -> Optional[Dict[str, np.ndarray]]:
+    """把原始记录整理成 numpy 数组：各延迟指标的样本，以及按完成时刻每秒分桶的请求数、token 数和达标数"""
+    records = [r for path in paths for r in read_records(path)
+               if r.get("status", "ok") == "ok" and r.get("in_window", True)]
+    if not records:
+        return None
+    samples = {}
+    for field in ("ttft", "tpot", "latency"):
+        samples[field] = np.array([r[field] for r in records if r.get(field) is not None], dtype=np.float64)
+    end = np.array([r["end_time"] for r in records])
+    bins = (end - end.min()).astype(np.int64)
+    samples["requests"] = np.bincount(bins).astype(np.float64)
+    samples["output_tokens"] = np.bincount(bins, weights=[r.get("output_tokens") or 0 for r in records])
+    if all("slo_met" in r for r in records):
+        samples["slo_met"] = np.bincount(bins, weights=[bool(r["slo_met"]) for r in records])
+    return samples
+
+
+def order_rank(n: int, percentile: float) -> int:
+    """第 percentile 分位数对应的次序统计量（从 1 开始）"""
+    return int(percentile / 100 * (n - 1)) + 1
+
+
+def bootstrap(values: np.ndarray, statistics: List[Any], resamples: int, rng: np.random.Generator) -> np.ndarray:
+    """向量化的 bootstrap，返回 (len(statistics), resamples) 的统计量
+
+    rate 统计量对每秒的分桶分批重采样，取桶的均值。分位数不生成重采样矩阵：重采样样本的
+    第 k 个次序统计量等于排序后原样本的第 J 个，J / n 近似服从 Beta(k, n - k + 1)，
+    直接抽取 J 即可，耗时与样本数无关（排序除外）。
+    """
+    n = len(values)
+    out = np.empty((len(statistics), resamples))
+    ordered = np.sort(values)
+    batch = max(1, RESAMPLE_BATCH_ELEMENTS // n)
+    for i, stat in enumerate(statistics):
+        if stat == "rate":
+            for start in range(0, resamples, batch):
+                size = min(batch, resamples - start)
+                out[i, start:start + size] = values[rng.integers(0, n, size=(size, n))].mean(axis=1)
+        else:
+            k = order_rank(n, stat)
+            index = (n * rng.beta(k, n - k + 1, size=resamples)).astype(np.int64)
+            out[i] = ordered[np.minimum(index, n - 1)]
+    return out
+
+
+def point_estimate(values: np.ndarray, stat: Any) -> float:
+    return float(values.mean()) if stat == "rate" else float(np.sort(values)[order_rank(len(values), stat) - 1])
+
+
+def metric_value(result: Dict[str, Any], path: Tuple[str, ...]) -> Optional[float]:
+    value: Any = result
+    for key in path:
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value
+
+
+def relative_replicates(samples: Optional[Dict[str, np.ndarray]], resamples: int,
+                        rng: np.random.Generator) -> Dict[str, np.ndarray]:
+    """每个指标的 bootstrap 重复值除以全样本估计值，即相对波动（乘到结果中的点估计上）"""
+    replicates = {}
+    if samples is None:
+        return replicates
+    by_field: Dict[str, List[Tuple[str, Any]]] = {}
+    for name, _, field, stat, _ in COMPARE_METRICS:
+        if field in samples and len(samples[field]) > 1:
+            by_field.setdefault(field, []).append((name, stat))
+    for field, metrics in by_field.items():
+        values = samples[field]
+        boot = bootstrap(values, [stat for _, stat in metrics], resamples, rng)
+        for (name, stat), row in zip(metrics, boot):
+            estimate = point_estimate(values, stat)
+            if estimate > 0:
+                replicates[name] = row / estimate
+    return replicates
+
+
+def compare_pair(
+    base: Dict[str, Any],
+    candidate: Dict[str, Any],
+    base_samples: Optional[Dict[str, np.ndarray]],
+    candidate_samples: Optional[Dict[str, np.ndarray]],
+    threshold: float,
+    confidence: float,
+    resamples: int,
+    rng: np.random.Generator
+) -> List[Dict[str, Any]]:
+    """计算各指标的变化和置信区间，并判断是否为显著回退
+
+    变化超过 threshold（相对值）且置信区间不包含 0 才算回退；没有原始记录时只按阈值判断。
+    """
+    base_boot = relative_replicates(base_samples, resamples, rng)
+    candidate_boot = relative_replicates(candidate_samples, resamples, rng)
+    alpha = (1 - confidence) / 2
+    rows = []
+    for name, path, _, _, higher_is_better in COMPARE_METRICS:
+        before, after = metric_value(base, path), metric_value(candidate, path)
+        if before is None or after is None:
+            continue
+        delta = after - before
+        row = {
+            "metric": name,
+            "baseline": before,
+            "candidate": after,
+            "delta": delta,
+            "relative_delta": delta / before if before else None,
+            "ci": None,
+            "status": "",
+        }
+        if name in base_boot and name in candidate_boot:
+            deltas = after * candidate_boot[name] - before * base_boot[name]
+            low, high = np.quantile(deltas, [alpha, 1 - alpha])
+            row["ci"] = [float(low), float(high)]
+        worse = row["relative_delta"]
+        if worse is not None and higher_is_better:
+            worse = -worse
+        significant = row["ci"] is None or row["ci"][0] > 0 or row["ci"][1] < 0
+        if worse is not None and significant and abs(worse) > threshold:
+            row["status"] = "regression" if worse > 0 else "improvement"
+        rows.append(row)
+    return rows
+
+
+def describe(result: Dict[str, Any]) -> str:
+    if "spread_mode" in result:
+        return f"{result['spread_mode']} ({result.get('offered_rate', 0):.1f} req/s)"
+    return f"concurrency {result.get('concurrency', '-')}"
+
+
+def display_comparison(label: str, base_label: str, candidate_label: str, rows: List[Dict[str, Any]],
+                       confidence: float) -> None:
+    """以表格显示一组配置的对比结果"""
+    table = Table(title=f"{candidate_label} vs {base_label}: {label}")
+    table.add_column("Metric", style="cyan")
+    table.add_column(base_label, style="white")
+    table.add_column(candidate_label, style="white")
+    table.add_column("Delta", style="yellow")
+    table.add_column(f"{confidence:.0%} CI", style="blue")
+    table.add_column("Status")
+    for row in rows:
+        scale, unit = (1000, "ms") if row["metric"].startswith(("ttft", "tpot", "e2e")) else (1, "")
+        relative = f" ({row['relative_delta']:+.1%})" if row["relative_delta"] is not None else ""
+        ci = f"[{row['ci'][0] * scale:+.2f}, {row['ci'][1] * scale:+.2f}]" if row["ci"] else "-"
+        status = {"regression": "[bold red]REGRESSION[/bold red]", "improvement": "[green]improved[/green]"}.get(row["status"], "")
+        table.add_row(row["metric"], f"{row['baseline'] * scale:.2f}{unit}", f"{row['candidate'] * scale:.2f}{unit}",
+                      f"{row['delta'] * scale:+.2f}{unit}{relative}", ci, status)
+    Console().print(table)
+
+
+@click.command()
+@click.argument("result_files", nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option("--threshold", type=float, default=0.05, show_default=True,
+              help="Relative change beyond which a significant slowdown counts as a regression")
+@click.option("--confidence", type=float, default=0.95, show_default=True, help="Confidence level of the bootstrap intervals")
+@click.option("--resamples", type=int, default=2000, show_default=True, help="Number of bootstrap resamples")
+@click.option("--seed", type=int, default=0, help="Random seed for resampling")
+@click.option("--output_file", type=str, default=None, help="Write the comparison as JSON")
+def main(result_files: Tuple[str, ...], threshold: float, confidence: float, resamples: int, seed: int,
+         output_file: Optional[str]) -> None:
+    """Compare benchmark result files against the first one (the baseline).
+
+    Results are aligned by configuration. Deltas of throughput, goodput and TTFT/TPOT/E2E
+    percentiles get bootstrap confidence intervals when the results reference raw request
+    records (record_file). Exits with status 1 if any metric regressed beyond --threshold.
+    """
+    if len(result_files) < 2:
+        raise click.BadParameter("Need a baseline and at least one result file to compare")
+    if not 0 < confidence < 1:
+        raise click.BadParameter("--confidence must be between 0 and 1")
+    rng = np.random.default_rng(seed)
+    sample_cache: Dict[Tuple[str, int], Optional[Dict[str, np.ndarray]]] = {}
+
+    def samples_for(path: str, index: int, result: Dict[str, Any]) -> Optional[Dict[str, np.ndarray]]:
+        if (path, index) not in sample_cache:
+            paths = record_paths(result, os.path.dirname(os.path.abspath(path)))
+            sample_cache[(path, index)] = load_samples(paths) if paths else None
+        return sample_cache[(path, index)]
+
+    base_file = result_files[0]
+    baseline = load_result_set(base_file)
+    base_label = os.path.basename(base_file)
+    comparisons = []
+    for candidate_file in result_files[1:]:
+        candidate = load_result_set(candidate_file)
+        candidate_label = os.path.basename(candidate_file)
+        for base, result in align_results(baseline, candidate):
+            rows = compare_pair(
+                base, result,
+                samples_for(base_file, baseline.index(base), base),
+                samples_for(candidate_file, candidate.index(result), result),
+                threshold, confidence, resamples, rng
+            )
+            display_comparison(describe(base), base_label, candidate_label, rows, confidence)
+            comparisons.append({"baseline": base_file, "candidate": candidate_file,
+                                "config": json.loads(config_key(base)), "metrics": rows})
+
+    regressions = [(c["candidate"], row["metric"]) for c in comparisons for row in c["metrics"] if row["status"] == "regression"]
+    if output_file:
+        with open(output_file, "w") as f:
+            json.dump({"threshold": threshold, "confidence": confidence, "comparisons": comparisons,
+                       "regressions": len(regressions)}, f, indent=2)
+    console = Console()
+    if regressions:
+        console.print(f"[bold red]{len(regressions)} regressions beyond {threshold:.0%}[/bold red]")
+        sys.exit(1)
+    console.print(f"[green]No regressions beyond {threshold:.0%}[/green]")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Dict, Any, Optional, Tuple
+
+from profiling import start_lag_window, end_lag_window
+from records import RecordSink
+from stats import QuantileSketch
+from transport import open_client
+from vllm_benchmark import make_request, create_progress
+from workloads import SYNTHETIC_WORDS, sample_length, validate_length
+
+DEFAULT_CONVERSATION = {
+    "num_sessions": 32,         # 会话总数
+    "turns": 5,                 # 每个会话的轮数，可以是长度分布
+    "user_len": 64,             # 每轮用户消息的 token 数，可以是长度分布
+    "system_prompt_len": 1024,  # 系统提示的 token 数
+    "prefix_overlap": 1.0,      # 系统提示中所有用户共享部分的比例，其余部分每个会话不同
+    "think_time": 0.0,          # 两轮之间的思考时间（秒），数字或 {"dist": "exponential|uniform|fixed", ...}
+    "seed": 0,                  # 共享前缀的随机种子，固定后不同测试之间的共享前缀相同
+}
+
+
+def validate_conversation_config(config: Dict[str, Any]) -> None:
+    """检查多轮对话配置，错误时抛出 ValueError"""
+    conversation = {**DEFAULT_CONVERSATION, **config["conversation"]}
+    if "concurrency" not in config:
+        raise ValueError("Conversation mode requires 'concurrency' (number of concurrent sessions)")
+    if not 0 <= conversation["prefix_overlap"] <= 1:
+        raise ValueError(f"'prefix_overlap' must be between 0 and 1, got {conversation['prefix_overlap']}")
+    rng = random.Random(0)
+    for key in ("turns", "user_len", "system_prompt_len"):
+        validate_length(conversation[key], f"conversation.{key}")
+    sample_think_time(conversation["think_time"], rng)
+
+
+def sample_think_time(spec, rng: random.Random) -> float:
+    """采样两轮之间的用户思考时间"""
+    if isinstance(spec, (int, float)):
+        return float(spec)
+    dist = spec.get("dist", "fixed")
+    if dist == "fixed":
+        return float(spec["value"])
+    if dist == "exponential":
+        return rng.expovariate(1.0 / spec["mean"]) if spec["mean"] > 0 else 0.0
+    if dist == "uniform":
+        return rng.uniform(spec["min"], spec["max"])
+    raise ValueError(f"Unknown think_time distribution: {dist}")
+
+
+def random_text(num_tokens: int, rng: random.Random) -> str:
+    return " ".join(rng.choices(SYNTHETIC_WORDS, k=num_tokens))
+
+
+class SessionFactory:
+    """生成会话的系统提示：shared 部分对所有会话相同，其余部分每个会话独立随机
+
+    prefix_sent 在第一个首轮请求成功完成后置为 True，此后发出的首轮请求才可能命中共享前缀的缓存。
+    """
+
+    def __init__(self, conversation: Dict[str, Any]):
+        self.conversation = conversation
+        system_len = sample_length(conversation["system_prompt_len"], random.Random(conversation["seed"]))
+        self.shared_len = int(system_len * conversation["prefix_overlap"])
+        self.unique_len = system_len - self.shared_len
+        self.shared_prefix = random_text(self.shared_len, random.Random(conversation["seed"]))
+        self.prefix_sent = False
+
+    def system_prompt(self, rng: random.Random) -> str:
+        unique = random_text(self.unique_len, rng) if self.unique_len else ""
+        return " ".join(part for part in (self.shared_prefix, unique) if part)
+
+
+async def run_session(
+    session_id: int,
+    factory: SessionFactory,
+    client,
+    model: str,
+    output_tokens: int,
+    request_timeout: int,
+    sink: RecordSink,
+    rng: random.Random,
+    progress=None,
+    progress_task=None,
+    stats: Optional[Dict[str, int]] = None
+) -> None:
+    """执行一个多轮会话：每轮把上一轮的助手回复追加到历史中，再经过思考时间发送下一轮"""
+    conversation = factory.conversation
+    messages = []
+    system_prompt = factory.system_prompt(rng)
+    if system_prompt:
+        messages.append({"role": "system", "content": system_prompt})
+    turns = sample_length(conversation["turns"], rng)
+    history_tokens = 0
+    if stats is not None:
+        # 中途失败的会话不再继续，剩余轮次同样计为未完成的请求
+        stats["planned_requests"] = stats.get("planned_requests", 0) + turns
+
+    for turn in range(turns):
+        if turn > 0:
+            await asyncio.sleep(sample_think_time(conversation["think_time"], rng))
+        messages.append({"role": "user", "content": random_text(sample_length(conversation["user_len"], rng), rng)})
+        spec = {"messages": list(messages), "max_tokens": output_tokens, "extra_body": {}}
+        # 客户端估计的可复用前缀：首轮只有共享系统提示（且要有更早的会话发送过），之后还包括完整的上一轮历史
+        expected_cached = history_tokens if turn > 0 else factory.shared_len if factory.prefix_sent else 0
+        record = await make_request(client, model, output_tokens, request_timeout, False, spec=spec, keep_text=True)
+        if progress and progress_task is not None:
+            progress.update(progress_task, advance=1)
+        record["session"] = session_id
+        record["turn"] = turn
+        if record["status"] != "ok":
+            sink.add(record)
+            logging.debug(f"Session {session_id} turn {turn} failed, ending session")
+            break
+
+        reply = record.pop("text")
+        record["expected_cached_tokens"] = expected_cached
+        factory.prefix_sent = True
+        sink.add(record)
+        history_tokens = (record["prompt_tokens"] or 0) + (record["output_tokens"] or 0)
+        messages.append({"role": "assistant", "content": reply})
+
+
+async def collect_conversation_results(
+    conversation: Dict[str, Any],
+    concurrency: int,
+    output_tokens: int,
+    request_timeout: int,
+    vllm_url: str,
+    api_key: str,
+    model: str,
+    progress=None,
+    progress_task=None,
+    stats: Optional[Dict[str, int]] = None,
+    sink: Optional[RecordSink] = None,
+    transport: Optional[Dict[str, Any]] = None
+) -> Tuple[RecordSink, float, float]:
+    """以 concurrency 个并发会话执行 num_sessions 个多轮会话，返回 ConversationSink 以及开始、结束时间"""
+    conversation = {**DEFAULT_CONVERSATION, **conversation}
+    client = await open_client(vllm_url, api_key, transport, concurrency)
+    factory = SessionFactory(conversation)
+    sink = sink if sink is not None else ConversationSink()
+    queue = asyncio.Queue()
+    for i in range(conversation["num_sessions"]):
+        queue.put_nowait(i)
+
+    async def session_worker() -> None:
+        while not queue.empty():
+            session_id = queue.get_nowait()
+            rng = random.Random()
+            await run_session(session_id, factory, client, model, output_tokens, request_timeout,
+                              sink, rng, progress, progress_task, stats)
+
+    start_lag_window()
+    start_time = time.time()
+    try:
+        await asyncio.gather(*(session_worker() for _ in range(concurrency)))
+    finally:
+        end_lag_window()
+        await client.close()
+        sink.close()
+    return sink, start_time, time.time()
+
+
+class ConversationSink(RecordSink):
+    """在写出记录和累计总体统计量的同时，按轮次以及是否命中前缀缓存累计 TTFT 草图，不保留记录
+
+    服务端返回 cached_tokens 时按实际命中划分，否则按客户端估计的可复用前缀划分；
+    是否有服务端数据要到最后才知道，所以两种划分都累计。
+    """
+
+    def __init__(self, record_file: Optional[str] = None, slo: Optional[Dict[str, float]] = None):
+        super().__init__(record_file, slo)
+        self.ttft_by_turn: Dict[int, QuantileSketch] = {}
+        self.ttft_by_prefix = {source: {"cached": QuantileSketch(), "uncached": QuantileSketch()}
+                               for source in ("server", "estimated")}
+        self.sessions = set()
+        self.server_reported = False
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+
+    def add(self, record: Dict[str, Any], measured: bool = True) -> None:
+        super().add(record, measured)
+        if record["status"] != "ok":
+            return
+        self.sessions.add(record["session"])
+        self.prompt_tokens += record["prompt_tokens"] or 0
+        if record.get("cached_tokens") is not None:
+            self.server_reported = True
+            self.cached_tokens += record["cached_tokens"]
+        if record["ttft"] is None:
+            return
+        self.ttft_by_turn.setdefault(record["turn"], QuantileSketch()).add(record["ttft"])
+        for source, reused in (("server", record.get("cached_tokens")), ("estimated", record.get("expected_cached_tokens"))):
+            self.ttft_by_prefix[source]["cached" if reused else "uncached"].add(record["ttft"])
+
+    def conversation_summary(self) -> Dict[str, Any]:
+        """按轮次以及是否命中前缀缓存拆分 TTFT"""
+        source = "server" if self.server_reported else "estimated"
+        summary = {
+            "sessions": len(self.sessions),
+            "ttft_by_turn": {str(turn): sketch.stats() for turn, sketch in sorted(self.ttft_by_turn.items())},
+            "ttft_by_prefix_cache": {
+                "source": source,
+                "cached": self.ttft_by_prefix[source]["cached"].stats(),
+                "uncached": self.ttft_by_prefix[source]["uncached"].stats(),
+            },
+        }
+        if self.server_reported:
+            summary["prefix_cache_hit_rate"] = self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0
+        return summary
+
+
+async def run_conversation_benchmark(
+    conversation: Dict[str, Any],
+    concurrency: int,
+    request_timeout: int,
+    output_tokens: int,
+    vllm_url: str,
+    api_key: str,
+    model: str,
+    slo: Optional[Dict[str, float]] = None,
+    record_file: Optional[str] = None,
+    transport: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """运行多轮对话基准测试"""
+    conversation = {**DEFAULT_CONVERSATION, **conversation}
+    stats = {}
+    with create_progress() as progress:
+        task = progress.add_task(f"[cyan]Running {conversation['num_sessions']} conversations", total=None)
+        sink, start_time, end_time = await collect_conversation_results(
+            conversation, concurrency, output_tokens, request_timeout,
+            vllm_url, api_key, model, progress, task, stats,
+            sink=ConversationSink(record_file, slo), transport=transport
+        )
+
+    total_elapsed_time = end_time - start_time
+    total_requests = stats.get("planned_requests", sink.count)
+    summary = {
+        "total_requests": total_requests,
+        "concurrency": concurrency,
+        "request_timeout": request_timeout,
+        "max_output_tokens": output_tokens,
+        "use_long_context": False,
+        "workload": "conversation",
+        "conversation": conversation,
+        "model": model,
+        "total_time": total_elapsed_time,
+    }
+    if record_file:
+        summary["record_file"] = record_file
+    summary.update(sink.summary(total_elapsed_time, total_requests))
+    summary.update(sink.conversation_summary())
+    return summary
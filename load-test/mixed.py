@@ -0,0 +1,262 @@
+import asyncio
+import logging
+import time
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+from aborts import build_abort_plan
+from arrivals import renewal_arrivals
+from profiling import start_lag_window, end_lag_window
+from records import RecordSink
+from stats import REQUEST_SLO_FIELDS, ResultAccumulator
+from transport import open_client
+from vllm_benchmark import make_request, create_progress
+from workloads import build_workload, validate_workload_config
+
+CLASS_SPREAD_MODES = ["poisson", "gamma"]
+# 每个类别可以配置的键
+CLASS_KEYS = ["name", "weight", "request_rate", "spread_mode", "burstiness_cv", "workload", "output_tokens",
+              "use_long_context", "slo"]
+
+
+def validate_mixed_config(config: Dict[str, Any]) -> None:
+    """检查多类请求混合负载的配置，错误时抛出 ValueError
+
+    每个类别用 request_rate 给出自己的到达速率，或用 weight 按比例分配顶层的 request_rate。
+    """
+    classes = config["classes"]
+    if "duration" not in config:
+        raise ValueError(f"'classes' requires 'duration': {config}")
+    if not isinstance(classes, list) or not classes or not all(isinstance(c, dict) for c in classes):
+        raise ValueError("'classes' must be a non-empty list of objects")
+    if "slo" in config:
+        raise ValueError("A top-level 'slo' is not used with 'classes'; give each class its own 'slo'")
+    names = [c.get("name") for c in classes]
+    if any(not isinstance(n, str) or not n for n in names) or len(set(names)) != len(names):
+        raise ValueError("Every class needs a unique 'name'")
+    for cls in classes:
+        unknown = set(cls) - set(CLASS_KEYS)
+        if unknown:
+            raise ValueError(f"Class '{cls['name']}': unknown options {', '.join(sorted(unknown))} "
+                             f"(allowed: {', '.join(CLASS_KEYS)})")
+        if "request_rate" not in cls:
+            if "request_rate" not in config:
+                raise ValueError(f"Class '{cls['name']}' needs 'request_rate', or a 'weight' and a top-level 'request_rate'")
+            if cls.get("weight", 1) <= 0:
+                raise ValueError(f"Class '{cls['name']}': 'weight' must be > 0")
+        elif cls["request_rate"] <= 0:
+            raise ValueError(f"Class '{cls['name']}': 'request_rate' must be > 0")
+        if cls.get("spread_mode", "poisson") not in CLASS_SPREAD_MODES:
+            raise ValueError(f"Class '{cls['name']}': 'spread_mode' must be one of {', '.join(CLASS_SPREAD_MODES)}")
+        if "workload" in cls:
+            validate_workload_config(cls["workload"])
+        if "slo" in cls and (not isinstance(cls["slo"], dict) or set(cls["slo"]) - set(REQUEST_SLO_FIELDS)):
+            raise ValueError(f"Class '{cls['name']}': 'slo' keys must be among {', '.join(REQUEST_SLO_FIELDS)}")
+
+
+def class_rates(config: Dict[str, Any]) -> List[float]:
+    """各类别的到达速率：显式的 request_rate，或按 weight 分配顶层 request_rate"""
+    classes = config["classes"]
+    total_weight = sum(c.get("weight", 1) for c in classes if "request_rate" not in c)
+    return [c["request_rate"] if "request_rate" in c else config["request_rate"] * c.get("weight", 1) / total_weight
+            for c in classes]
+
+
+def build_mixed_schedule(config: Dict[str, Any]) -> List[Tuple[float, int]]:
+    """为每个类别生成独立的到达过程，合并为按时间排序的 (发送时间, 类别下标) 列表"""
+    seed = config.get("seed")
+    schedule = []
+    for i, (cls, rate) in enumerate(zip(config["classes"], class_rates(config))):
+        cv = cls.get("burstiness_cv", 2.0) if cls.get("spread_mode", "poisson") == "gamma" else 1.0
+        times = renewal_arrivals(rate, config["duration"], cv=cv, seed=None if seed is None else seed + i)
+        schedule.extend((float(t), i) for t in times)
+    schedule.sort()
+    return schedule
+
+
+class MixedSink(RecordSink):
+    """按类别分别累计统计量，每个类别用自己的 SLO 计算 goodput"""
+
+    def __init__(self, classes: List[Dict[str, Any]], record_file: Optional[str] = None):
+        super().__init__(record_file)
+        self.class_stats = {cls["name"]: ResultAccumulator(cls.get("slo")) for cls in classes}
+
+    def add(self, record: Dict[str, Any], measured: bool = True) -> None:
+        # 类别的统计量先累计，slo / slo_met 标记随记录一起写出
+        if measured:
+            self.class_stats[record["class"]].add(record)
+        super().add(record, measured)
+
+
+async def collect_mixed_results(
+    config: Dict[str, Any],
+    schedule: List[Tuple[float, int]],
+    vllm_url: str,
+    api_key: str,
+    use_long_context: bool,
+    model: str,
+    sink: MixedSink,
+    progress=None,
+    progress_task=None,
+    transport: Optional[Dict[str, Any]] = None
+) -> Tuple[MixedSink, float, float]:
+    """按合并后的发送计划开环调度，每个请求使用所属类别的负载来源，记录带 class 字段"""
+    classes = config["classes"]
+    duration = config["duration"]
+    output_tokens = config.get("output_tokens", 100)
+    request_timeout = config.get("request_timeout", duration)
+    seed = config.get("seed")
+    client = await open_client(vllm_url, api_key, transport)
+    sources = [build_workload(cls.get("workload"), cls.get("output_tokens", output_tokens),
+                              (cls.get("workload") or {}).get("seed", None if seed is None else seed + i))
+               for i, cls in enumerate(classes)]
+    abort_plan = build_abort_plan(config.get("abort"))
+    tasks = []
+
+    async def scheduled_request(class_index: int, intended: float, actual: float) -> None:
+        cls = classes[class_index]
+        record = await make_request(client, model, cls.get("output_tokens", output_tokens), request_timeout,
+                                    cls.get("use_long_context", use_long_context), sources[class_index],
+                                    abort_after=abort_plan.sample() if abort_plan else None)
+        record["class"] = cls["name"]
+        record["intended_send"] = intended
+        record["actual_send"] = actual
+        record["schedule_lag"] = actual - intended
+        sink.add(record)
+
+    start_lag_window()
+    start_time = time.time()
+    start_mono = time.perf_counter()
+    for intended, class_index in schedule:
+        wait_time = start_mono + intended - time.perf_counter()
+        if wait_time > 0:
+            await asyncio.sleep(wait_time)
+        tasks.append(asyncio.create_task(scheduled_request(class_index, intended, time.perf_counter() - start_mono)))
+        if progress and progress_task is not None:
+            progress.update(progress_task, advance=1)
+
+    try:
+        for task in tasks:
+            try:
+                await task
+            except Exception as e:
+                logging.error(f"Error in mixed request: {str(e)}")
+    finally:
+        end_lag_window()
+        await client.close()
+        sink.close()
+    return sink, start_time, time.time()
+
+
+def class_interference(mixed: Dict[str, Any], alone: Dict[str, Any]) -> Dict[str, Optional[float]]:
+    """混合运行与单独运行同一类别时的延迟比值，大于 1 表示受到其他类别的干扰"""
+    def ratio(key: str, p: str) -> Optional[float]:
+        value, reference = mixed[key][p], alone[key][p]
+        return value / reference if value is not None and reference else None
+
+    return {
+        "ttft_p50_ratio": ratio("time_to_first_token", "p50"),
+        "ttft_p99_ratio": ratio("time_to_first_token", "p99"),
+        "tpot_p50_ratio": ratio("time_per_output_token", "p50"),
+        "tpot_p99_ratio": ratio("time_per_output_token", "p99"),
+    }
+
+
+async def run_mixed_benchmark(
+    config: Dict[str, Any],
+    vllm_url: str,
+    api_key: str,
+    use_long_context: bool,
+    model: str,
+    transport: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """运行多类请求混合的开环测试，按类别报告延迟、吞吐和 SLO 达成率
+
+    class_baseline 为 true 时随后让每个类别单独运行一次，报告混合运行相对单独运行的延迟比值。
+    """
+    schedule = build_mixed_schedule(config)
+    duration = config["duration"]
+    classes = config["classes"]
+    rates = class_rates(config)
+    with create_progress() as progress:
+        task = progress.add_task(f"[cyan]Running {len(classes)} request classes", total=len(schedule))
+        sink, start_time, end_time = await collect_mixed_results(
+            config, schedule, vllm_url, api_key, use_long_context, model,
+            MixedSink(classes, config.get("record_file")), progress, task, transport
+        )
+
+    actual_duration = end_time - start_time
+    counts = np.bincount([i for _, i in schedule], minlength=len(classes))
+    summary = {
+        "total_requests": len(schedule),
+        "spread_mode": "mixed",
+        "planned_duration": duration,
+        "actual_duration": actual_duration,
+        "offered_rate": len(schedule) / duration if duration > 0 else 0,
+        "request_timeout": config.get("request_timeout", duration),
+        "max_output_tokens": config.get("output_tokens", 100),
+        "use_long_context": use_long_context,
+        "workload": "mixed",
+        "model": model,
+    }
+    if config.get("record_file"):
+        summary["record_file"] = config["record_file"]
+    summary.update(sink.summary(actual_duration, len(schedule)))
+
+    summary["classes"] = {}
+    met = denominator = 0
+    for cls, rate, count in zip(classes, rates, counts):
+        stats = sink.class_stats[cls["name"]]
+        summary["classes"][cls["name"]] = {
+            "offered_rate": rate,
+            "spread_mode": cls.get("spread_mode", "poisson"),
+            "workload": (cls.get("workload") or {}).get("type", "builtin"),
+            "total_requests": int(count),
+            **stats.summary(actual_duration, int(count)),
+        }
+        if stats.slo:
+            met += stats.slo_met_requests
+            denominator += int(count) - stats.aborted_requests
+    # 总体 goodput：每个请求按所属类别的 SLO 判断
+    if any(cls.get("slo") for cls in classes):
+        summary["goodput"] = {
+            "slo": {cls["name"]: cls["slo"] for cls in classes if cls.get("slo")},
+            "requests_met": met,
+            "requests_per_second": met / actual_duration if actual_duration > 0 else 0,
+            "output_tokens_per_second": sum(s.slo_met_tokens for s in sink.class_stats.values()) / actual_duration
+            if actual_duration > 0 else 0,
+            "attainment": met / denominator if denominator else 0,
+            "attainment_by_metric": {},
+        }
+
+    if config.get("class_baseline") and len(classes) > 1:
+        await asyncio.sleep(5)
+        baselines = await run_class_baselines(config, vllm_url, api_key, use_long_context, model, transport)
+        for name, alone in baselines.items():
+            summary["classes"][name]["alone"] = {key: alone[key] for key in
+                                                 ("requests_per_second", "time_to_first_token", "time_per_output_token")}
+            summary["classes"][name]["interference"] = class_interference(summary["classes"][name], alone)
+    return summary
+
+
+async def run_class_baselines(
+    config: Dict[str, Any],
+    vllm_url: str,
+    api_key: str,
+    use_long_context: bool,
+    model: str,
+    transport: Optional[Dict[str, Any]] = None
+) -> Dict[str, Dict[str, Any]]:
+    """每个类别以相同速率单独运行一次，作为衡量干扰的对照"""
+    rates = class_rates(config)
+    baselines = {}
+    for cls, rate in zip(config["classes"], rates):
+        alone = {**config, "classes": [{**cls, "request_rate": rate}]}
+        alone.pop("record_file", None)
+        alone.pop("class_baseline", None)
+        logging.info(f"Running class '{cls['name']}' alone at {rate:.2f} req/s")
+        result = await run_mixed_benchmark(alone, vllm_url, api_key, use_long_context, model, transport)
+        baselines[cls["name"]] = result["classes"][cls["name"]]
+        if cls is not config["classes"][-1]:
+            await asyncio.sleep(5)
+    return baselines
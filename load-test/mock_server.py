@@ -0,0 +1,401 @@
+import asyncio
+import json
+import logging
+import math
+import random
+import time
+import uuid
+from typing import Dict, Any, Optional, Tuple
+import click
+from prewarm import weight_files
+
+# 模拟服务器默认参数，时间单位均为秒
+DEFAULT_MOCK_CONFIG = {
+    "ttft": 0.05,               # 获得调度槽位后到第一个 token 的时间（模拟 prefill）
+    "ttft_jitter": 0.0,         # TTFT 的均匀随机抖动幅度
+    "prefill_per_token": 0.0,   # 每个输入 token 额外增加的 prefill 时间
+    "token_delay": 0.01,        # 每个输出 token 的间隔（模拟 decode）
+    "tokens_per_chunk": 1,      # 每个 SSE 块包含的 token 数（模拟投机解码）
+    "output_len": "max_tokens", # 输出长度分布：max_tokens / fixed / uniform / lognormal
+    "output_len_fixed": 100,
+    "output_len_min": 10,
+    "output_len_max": 500,
+    "output_len_mean": 200,     # lognormal 的均值
+    "output_len_sigma": 0.8,    # lognormal 的形状参数
+    "max_num_seqs": 0,          # 同时运行的请求上限，0 表示不限制，超出后排队
+    "max_queue": 0,             # 等待队列上限，超出后返回 429，0 表示不限制
+    "batch_slowdown": 0.0,      # 每多一个运行中的请求，token 间隔增加的比例
+    "error_rate": 0.0,          # 直接返回错误的请求比例
+    "error_status": 503,
+    "stall_rate": 0.0,          # 发送响应头后卡住不再输出的请求比例（模拟超时）
+    "stall_seconds": 3600,
+    "abort_on_disconnect": True,  # 客户端断开后是否立即停止生成；false 时继续生成到结束，模拟不回收槽位的服务端
+}
+
+
+class MockLLMServer:
+    """兼容 OpenAI 接口的流式模拟服务器，延迟完全由配置决定，用于校准压测客户端本身的开销"""
+
+    def __init__(self, **options):
+        unknown = set(options) - set(DEFAULT_MOCK_CONFIG)
+        if unknown:
+            raise ValueError(f"Unknown mock server options: {', '.join(sorted(unknown))}")
+        self.config = {**DEFAULT_MOCK_CONFIG, **options}
+        self.slots = asyncio.Semaphore(self.config["max_num_seqs"]) if self.config["max_num_seqs"] > 0 else None
+        self.stats = {
+            "requests": 0,
+            "completed": 0,
+            "errors": 0,
+            "rejected": 0,
+            "stalled": 0,
+            "aborted": 0,
+            "running": 0,
+            "waiting": 0,
+            "peak_running": 0,
+            "peak_waiting": 0,
+            "prompt_tokens": 0,
+            "generated_tokens": 0,
+        }
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8000) -> asyncio.AbstractServer:
+        """启动监听，port 为 0 时由系统分配端口"""
+        self.server = await asyncio.start_server(self.handle_connection, host, port, backlog=4096)
+        return self.server
+
+    @property
+    def port(self) -> int:
+        return self.server.sockets[0].getsockname()[1]
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """处理一个 HTTP/1.1 连接，支持 keep-alive"""
+        try:
+            while True:
+                request = await read_http_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                keep_alive = headers.get("connection", "").lower() != "close"
+                await self.dispatch(method, path, body, writer)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            logging.error(f"Mock server error: {str(e)}")
+        finally:
+            writer.close()
+
+    async def dispatch(self, method: str, path: str, body: bytes, writer: asyncio.StreamWriter) -> None:
+        """根据路径分发请求"""
+        path = path.split("?", 1)[0]
+        if method == "GET" and path in ("/health", "/v1/health"):
+            await send_response(writer, 200, b"", "text/plain")
+        elif method == "GET" and path == "/v1/models":
+            await send_json(writer, 200, {"object": "list", "data": [{"id": "mock", "object": "model", "owned_by": "mock"}]})
+        elif method == "GET" and path == "/mock/stats":
+            await send_json(writer, 200, self.stats)
+        elif method == "GET" and path == "/metrics":
+            await send_response(writer, 200, self.prometheus_metrics().encode(), "text/plain; version=0.0.4")
+        elif method == "POST" and path in ("/v1/chat/completions", "/v1/completions"):
+            try:
+                payload = json.loads(body or b"{}")
+            except json.JSONDecodeError:
+                await send_json(writer, 400, error_body("Invalid JSON body", 400))
+                return
+            await self.handle_completion(payload, path.endswith("chat/completions"), writer)
+        else:
+            await send_json(writer, 404, error_body(f"Not found: {method} {path}", 404))
+
+    def prometheus_metrics(self) -> str:
+        """以 vLLM 的 Prometheus 指标名导出内部计数，KV 缓存占用按运行中请求数占槽位比例模拟"""
+        stats = self.stats
+        slots = self.config["max_num_seqs"]
+        kv_usage = stats["running"] / slots if slots > 0 else 0.0
+        label = '{model_name="mock"}'
+        lines = [
+            ("vllm:num_requests_running", "gauge", stats["running"]),
+            ("vllm:num_requests_waiting", "gauge", stats["waiting"]),
+            ("vllm:kv_cache_usage_perc", "gauge", kv_usage),
+            ("vllm:num_preemptions_total", "counter", 0),
+            ("vllm:prompt_tokens_total", "counter", stats["prompt_tokens"]),
+            ("vllm:generation_tokens_total", "counter", stats["generated_tokens"]),
+        ]
+        return "".join(f"# TYPE {name} {kind}\n{name}{label} {float(value)}\n" for name, kind, value in lines)
+
+    def sample_output_len(self, payload: Dict[str, Any]) -> int:
+        """按配置的分布采样输出长度，受 max_tokens / min_tokens / ignore_eos 约束"""
+        cfg = self.config
+        max_tokens = payload.get("max_tokens") or payload.get("max_completion_tokens") or cfg["output_len_max"]
+        if payload.get("ignore_eos"):
+            return max_tokens
+        mode = cfg["output_len"]
+        if mode == "fixed":
+            n = cfg["output_len_fixed"]
+        elif mode == "uniform":
+            n = random.randint(cfg["output_len_min"], cfg["output_len_max"])
+        elif mode == "lognormal":
+            sigma = cfg["output_len_sigma"]
+            mu = math.log(cfg["output_len_mean"]) - sigma * sigma / 2
+            n = int(random.lognormvariate(mu, sigma))
+        else:
+            n = max_tokens
+        return max(1, payload.get("min_tokens") or 0, min(n, max_tokens))
+
+    async def handle_completion(self, payload: Dict[str, Any], chat: bool, writer: asyncio.StreamWriter) -> None:
+        """模拟一次补全请求：排队、prefill、逐 token decode"""
+        cfg = self.config
+        stats = self.stats
+        stats["requests"] += 1
+        prompt_tokens = estimate_prompt_tokens(payload, chat)
+        stats["prompt_tokens"] += prompt_tokens
+
+        if cfg["error_rate"] > 0 and random.random() < cfg["error_rate"]:
+            stats["errors"] += 1
+            await send_json(writer, cfg["error_status"], error_body("Injected error", cfg["error_status"]))
+            return
+        if cfg["max_queue"] > 0 and stats["waiting"] >= cfg["max_queue"]:
+            stats["rejected"] += 1
+            await send_json(writer, 429, error_body("Too many requests in queue", 429))
+            return
+
+        # 模拟连续批处理：运行中的请求数达到上限后排队等待槽位
+        stats["waiting"] += 1
+        stats["peak_waiting"] = max(stats["peak_waiting"], stats["waiting"])
+        try:
+            if self.slots is not None:
+                await self.slots.acquire()
+        finally:
+            stats["waiting"] -= 1
+        stats["running"] += 1
+        stats["peak_running"] = max(stats["peak_running"], stats["running"])
+        try:
+            await self.generate(payload, chat, prompt_tokens, writer)
+        except (ConnectionError, asyncio.CancelledError):
+            # 客户端断开，释放槽位
+            stats["aborted"] += 1
+        finally:
+            stats["running"] -= 1
+            if self.slots is not None:
+                self.slots.release()
+
+    async def generate(self, payload: Dict[str, Any], chat: bool, prompt_tokens: int, writer: asyncio.StreamWriter) -> None:
+        """生成输出，流式请求按 SSE 逐块发送"""
+        cfg = self.config
+        stream = payload.get("stream", False)
+        # /v1/completions 的 prompt 可以是列表，每个提示各生成 n 个结果
+        prompts = payload.get("prompt") if not chat and isinstance(payload.get("prompt"), list) else [None]
+        n_choices = max(1, payload.get("n") or 1) * max(1, len(prompts))
+        output_len = self.sample_output_len(payload)
+        request_id = f"{'chatcmpl' if chat else 'cmpl'}-{uuid.uuid4().hex}"
+        created = int(time.time())
+        model = payload.get("model", "mock")
+        obj = "chat.completion.chunk" if chat else "text_completion"
+
+        ttft = cfg["ttft"] + cfg["prefill_per_token"] * prompt_tokens + random.uniform(0, cfg["ttft_jitter"])
+
+        if not stream:
+            await asyncio.sleep(ttft + self.token_delay() * (output_len - 1))
+            self.stats["generated_tokens"] += output_len * n_choices
+            self.stats["completed"] += 1
+            choices = []
+            for i in range(n_choices):
+                text = "tok " * output_len
+                if chat:
+                    choices.append({"index": i, "message": {"role": "assistant", "content": text}, "finish_reason": "length"})
+                else:
+                    choices.append({"index": i, "text": text, "finish_reason": "length"})
+            await send_json(writer, 200, {
+                "id": request_id, "object": "chat.completion" if chat else "text_completion",
+                "created": created, "model": model, "choices": choices,
+                "usage": usage_body(prompt_tokens, output_len * n_choices),
+            })
+            return
+
+        writer.write(b"HTTP/1.1 200 OK\r\ncontent-type: text/event-stream\r\ncache-control: no-cache\r\n"
+                     b"transfer-encoding: chunked\r\n\r\n")
+        await writer.drain()
+
+        if cfg["stall_rate"] > 0 and random.random() < cfg["stall_rate"]:
+            self.stats["stalled"] += 1
+            await asyncio.sleep(cfg["stall_seconds"])
+
+        def chunk(choices, usage=None) -> bytes:
+            data = {"id": request_id, "object": obj, "created": created, "model": model, "choices": choices}
+            if usage is not None:
+                data["usage"] = usage
+            return sse_event(json.dumps(data, separators=(",", ":")))
+
+        def choice(i: int, text: Optional[str], finish: Optional[str]) -> Dict[str, Any]:
+            if chat:
+                delta = {} if text is None else {"content": text}
+                return {"index": i, "delta": delta, "finish_reason": finish}
+            return {"index": i, "text": text or "", "finish_reason": finish}
+
+        await asyncio.sleep(ttft)
+        if chat:
+            writer.write(chunk([{"index": i, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}
+                                for i in range(n_choices)]))
+        disconnected = False
+
+        async def send(data: bytes) -> None:
+            # 不检查断开时，客户端离开后照常生成，只是不再写出
+            nonlocal disconnected
+            if disconnected:
+                return
+            try:
+                if writer.is_closing():
+                    raise ConnectionResetError("Client disconnected")
+                writer.write(data)
+                await writer.drain()
+            except ConnectionError:
+                if cfg["abort_on_disconnect"]:
+                    raise
+                disconnected = True
+
+        sent = 0
+        step = max(1, cfg["tokens_per_chunk"])
+        while sent < output_len:
+            if sent > 0:
+                await asyncio.sleep(self.token_delay() * step)
+            count = min(step, output_len - sent)
+            await send(b"".join(chunk([choice(i, "tok " * count, None)]) for i in range(n_choices)))
+            sent += count
+            self.stats["generated_tokens"] += count * n_choices
+        if disconnected:
+            raise ConnectionResetError("Client disconnected")
+
+        writer.write(chunk([choice(i, None, "length") for i in range(n_choices)]))
+        if (payload.get("stream_options") or {}).get("include_usage"):
+            writer.write(chunk([], usage_body(prompt_tokens, output_len * n_choices)))
+        writer.write(sse_event("[DONE]"))
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+        self.stats["completed"] += 1
+
+    def token_delay(self) -> float:
+        """当前批大小下的 token 间隔"""
+        cfg = self.config
+        return cfg["token_delay"] * (1 + cfg["batch_slowdown"] * max(0, self.stats["running"] - 1))
+
+
+async def read_http_request(reader: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+    """读取一个 HTTP 请求，连接关闭时返回 None"""
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    parts = request_line.decode("latin-1").split()
+    if len(parts) < 2:
+        return None
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        key, _, value = line.decode("latin-1").partition(":")
+        headers[key.strip().lower()] = value.strip()
+    length = int(headers.get("content-length", 0) or 0)
+    body = await reader.readexactly(length) if length else b""
+    return parts[0], parts[1], headers, body
+
+
+def sse_event(data: str) -> bytes:
+    """把一条 SSE 事件编码为 HTTP chunked 块"""
+    payload = f"data: {data}\n\n".encode()
+    return f"{len(payload):x}\r\n".encode() + payload + b"\r\n"
+
+
+async def send_response(writer: asyncio.StreamWriter, status: int, body: bytes, content_type: str) -> None:
+    reason = {200: "OK", 400: "Bad Request", 404: "Not Found", 429: "Too Many Requests",
+              500: "Internal Server Error", 503: "Service Unavailable"}.get(status, "Error")
+    writer.write(f"HTTP/1.1 {status} {reason}\r\ncontent-type: {content_type}\r\n"
+                 f"content-length: {len(body)}\r\n\r\n".encode() + body)
+    await writer.drain()
+
+
+async def send_json(writer: asyncio.StreamWriter, status: int, data: Dict[str, Any]) -> None:
+    await send_response(writer, status, json.dumps(data).encode(), "application/json")
+
+
+def error_body(message: str, status: int) -> Dict[str, Any]:
+    return {"object": "error", "message": message, "type": "MockError", "code": status}
+
+
+def usage_body(prompt_tokens: int, completion_tokens: int) -> Dict[str, int]:
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens}
+
+
+def estimate_prompt_tokens(payload: Dict[str, Any], chat: bool) -> int:
+    """粗略估计输入 token 数（约 4 个字符一个 token）"""
+    if chat:
+        text = "".join(str(m.get("content", "")) for m in payload.get("messages", []))
+    else:
+        prompt = payload.get("prompt", "")
+        text = "".join(prompt) if isinstance(prompt, list) else str(prompt)
+    return max(1, len(text) // 4)
+
+
+def load_weights(model_dir: str) -> None:
+    """按顺序完整读一遍权重分片，启动时间取决于它们是否在页缓存中"""
+    start = time.perf_counter()
+    total = 0
+    for path in weight_files(model_dir):
+        with open(path, "rb") as f:
+            while True:
+                data = f.read(16 * 1024 * 1024)
+                if not data:
+                    break
+                total += len(data)
+    logging.info(f"Loaded {total / 1e9:.2f} GB of weights in {time.perf_counter() - start:.2f}s")
+
+
+async def serve(host: str, port: int, **options) -> None:
+    """启动模拟服务器并一直运行"""
+    mock = MockLLMServer(**options)
+    server = await mock.start(host, port)
+    logging.info(f"Mock OpenAI server listening on http://{host}:{mock.port}/v1")
+    async with server:
+        await server.serve_forever()
+
+
+@click.command()
+@click.option("--host", type=str, default="127.0.0.1", help="Host to bind")
+@click.option("--port", type=int, default=8000, help="Port to bind")
+@click.option("--config", "config_json", type=str, default=None, help="Mock options as JSON string or path to JSON file")
+@click.option("--max-num-seqs", "max_num_seqs", type=int, default=None, help="Same as vLLM's flag; overrides max_num_seqs in --config")
+@click.option("--startup_delay", type=float, default=0.0, help="Seconds to wait before listening (simulates model loading)")
+@click.option("--weights", type=click.Path(exists=True, file_okay=False), default=None, help="Read this model directory's weight shards before listening (disk-bound startup)")
+def main(host: str, port: int, config_json: Optional[str], max_num_seqs: Optional[int], startup_delay: float,
+         weights: Optional[str]) -> None:
+    """Run a mock OpenAI-compatible streaming server with known latencies.
+
+    Options (JSON keys): ttft, ttft_jitter, prefill_per_token, token_delay, tokens_per_chunk,
+    output_len (max_tokens/fixed/uniform/lognormal), output_len_fixed, output_len_min, output_len_max,
+    output_len_mean, output_len_sigma, max_num_seqs, max_queue, batch_slowdown,
+    error_rate, error_status, stall_rate, stall_seconds, abort_on_disconnect.
+
+    --max-num-seqs mirrors the vLLM flag so the mock can stand in for `vllm serve` in sweep.py.
+    --weights reads shards sequentially like a model loader, so cold_start.py can be tried without a GPU.
+    """
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    options = {}
+    if config_json:
+        try:
+            options = json.loads(config_json)
+        except json.JSONDecodeError:
+            with open(config_json, 'r') as f:
+                options = json.load(f)
+    if max_num_seqs is not None:
+        options["max_num_seqs"] = max_num_seqs
+    time.sleep(startup_delay)
+    if weights:
+        load_weights(weights)
+    try:
+        asyncio.run(serve(host, port, **options))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
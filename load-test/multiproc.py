@@ -0,0 +1,266 @@
+import asyncio
+import logging
+import multiprocessing as mp
+import time
+from typing import List, Dict, Any, Optional, Tuple
+
+from rich.console import Console
+from arrivals import build_arrival_times, open_loop_timeout, planned_duration
+from profiling import monitored, profile_options
+from records import RecordSink, worker_record_file
+from transport import transport_options
+from vllm_benchmark import (
+    collect_concurrent_results,
+    collect_distributed_results,
+    create_progress,
+)
+
+# 子进程启动（导入 openai 等库）耗时不一，用屏障保证所有进程同时开始计时
+BARRIER_TIMEOUT = 120
+
+
+class SharedCounterProgress:
+    """在子进程中模拟 rich Progress 的 update 接口，把进度写入进程间共享计数器"""
+
+    def __init__(self, counter):
+        self.counter = counter
+
+    def update(self, task_id, advance: int = 1) -> None:
+        with self.counter.get_lock():
+            self.counter.value += advance
+
+
+def split_evenly(total: int, parts: int) -> List[int]:
+    """把 total 尽量平均地拆成 parts 份"""
+    base, extra = divmod(total, parts)
+    return [base + (1 if i < extra else 0) for i in range(parts)]
+
+
+def worker_seeded(config: Dict[str, Any], key: str, index: int) -> Optional[Dict[str, Any]]:
+    """为每个子进程生成 workload、abort 等带随机种子的配置，种子错开以免各进程做出相同的抽样"""
+    options = config.get(key)
+    if not options:
+        return None
+    options = dict(options)
+    if options.get("seed") is not None:
+        options["seed"] = options["seed"] + index
+    return options
+
+
+def _worker_process(
+    index: int,
+    mode: str,
+    kwargs: Dict[str, Any],
+    sink_options: Dict[str, Any],
+    log_level: int,
+    barrier,
+    counter,
+    result_queue,
+    lag_interval: Optional[float] = None
+) -> None:
+    """子进程入口：使用独立的事件循环和 HTTP 客户端执行分配到的负载
+
+    子进程只把固定大小的统计量传回主进程，原始记录由各子进程直接写入自己的记录文件。
+    """
+    logging.getLogger().setLevel(log_level)
+    progress = SharedCounterProgress(counter)
+    collect = collect_distributed_results if mode == "distributed" else collect_concurrent_results
+    sink = RecordSink(worker=index, **sink_options)
+
+    error = None
+    try:
+        barrier.wait(BARRIER_TIMEOUT)
+    except Exception as e:
+        logging.warning(f"Worker {index} failed to synchronize start: {str(e)}")
+
+    cpu_start = time.process_time()
+    start_time = end_time = time.time()
+    lag = None
+    try:
+        (_, start_time, end_time), lag = asyncio.run(
+            monitored(collect(**kwargs, progress=progress, progress_task=0, sink=sink), lag_interval))
+    except Exception as e:
+        error = str(e)
+        end_time = time.time()
+        sink.close()
+        logging.error(f"Worker {index} failed: {error}")
+    cpu_time = time.process_time() - cpu_start
+    wall_time = end_time - start_time
+
+    result_queue.put({
+        "index": index,
+        "stats": sink.stats,
+        "endpoint_stats": sink.endpoint_stats,
+        "record_file": sink_options["record_file"],
+        "start_time": start_time,
+        "end_time": end_time,
+        "cpu_time": cpu_time,
+        "cpu_percent": cpu_time / wall_time * 100 if wall_time > 0 else 0,
+        "loop_lag": lag.stats() if lag is not None else None,
+        "error": error,
+    })
+
+
+def split_load(
+    config: Dict[str, Any],
+    workers: int,
+    vllm_url: str,
+    api_key: str,
+    use_long_context: bool,
+    model: str
+) -> Tuple[str, int, Optional[float], List[Dict[str, Any]]]:
+    """把负载拆成 workers 份，返回 (模式, 总请求数, 计划时长, 每份的 collect_* 参数)
+
+    开环模式在这里生成完整发送计划再轮流分配，保证合并后的到达过程与单进程一致；
+    并发模式平均拆分请求数和并发数。多进程和多主机（agent）共用这一拆分。
+    """
+    output_tokens = config.get("output_tokens", 100)
+    duration = None
+    if "spread_mode" in config:
+        mode = "distributed"
+        request_times = build_arrival_times(config)
+        num_requests = len(request_times)
+        duration = planned_duration(config, request_times)
+        worker_kwargs = [
+            dict(num_requests=len(request_times[i::workers]), duration=duration, spread_mode=config["spread_mode"],
+                 output_tokens=output_tokens, vllm_url=vllm_url, api_key=api_key,
+                 use_long_context=use_long_context, model=model,
+                 request_times=[float(t) for t in request_times[i::workers]],
+                 workload=worker_seeded(config, "workload", i), abort=worker_seeded(config, "abort", i),
+                 transport=transport_options(config), request_timeout=open_loop_timeout(config))
+            for i in range(workers)
+        ]
+    else:
+        mode = "concurrent"
+        num_requests = config["num_requests"]
+        request_shares = split_evenly(num_requests, workers)
+        concurrency = config["concurrency"]
+        if concurrency < workers:
+            raise ValueError(f"concurrency ({concurrency}) must be >= workers ({workers})")
+        worker_kwargs = [
+            dict(num_requests=n, concurrency=c, request_timeout=config.get("request_timeout", 30),
+                 output_tokens=output_tokens, vllm_url=vllm_url, api_key=api_key,
+                 use_long_context=use_long_context, model=model, workload=worker_seeded(config, "workload", i),
+                 abort=worker_seeded(config, "abort", i), transport=transport_options(config))
+            for i, (n, c) in enumerate(zip(request_shares, split_evenly(concurrency, workers)))
+        ]
+    return mode, num_requests, duration, worker_kwargs
+
+
+def load_summary(
+    config: Dict[str, Any],
+    num_requests: int,
+    duration: Optional[float],
+    elapsed: float,
+    use_long_context: bool,
+    model: str
+) -> Dict[str, Any]:
+    """拆分执行的测试的基本信息，字段与单进程的 run_benchmark / distributed_request_benchmark 一致"""
+    output_tokens = config.get("output_tokens", 100)
+    if "spread_mode" in config:
+        return {
+            "total_requests": num_requests,
+            "spread_mode": config["spread_mode"],
+            "planned_duration": duration,
+            "actual_duration": elapsed,
+            "offered_rate": num_requests / duration if duration > 0 else 0,
+            "request_timeout": open_loop_timeout(config),
+            "max_output_tokens": output_tokens,
+            "use_long_context": use_long_context,
+            "workload": config.get("workload", {}).get("type", "builtin"),
+            "model": model,
+        }
+    return {
+        "total_requests": num_requests,
+        "concurrency": config["concurrency"],
+        "request_timeout": config.get("request_timeout", 30),
+        "max_output_tokens": output_tokens,
+        "use_long_context": use_long_context,
+        "workload": config.get("workload", {}).get("type", "builtin"),
+        "model": model,
+        "total_time": elapsed,
+    }
+
+
+async def run_multiprocess_benchmark(
+    config: Dict[str, Any],
+    workers: int,
+    vllm_url: str,
+    api_key: str,
+    use_long_context: bool,
+    model: str
+) -> Dict[str, Any]:
+    """把一个测试配置的负载拆分到多个进程执行，并合并原始请求结果"""
+    mode, num_requests, duration, worker_kwargs = split_load(config, workers, vllm_url, api_key, use_long_context, model)
+
+    ctx = mp.get_context("spawn")
+    barrier = ctx.Barrier(workers)
+    counter = ctx.Value("i", 0)
+    result_queue = ctx.Queue()
+    log_level = logging.getLogger().getEffectiveLevel()
+    profile = profile_options(config)
+    processes = [
+        ctx.Process(
+            target=_worker_process,
+            args=(i, mode, kwargs, {"record_file": worker_record_file(config.get("record_file"), i), "slo": config.get("slo")},
+                  log_level, barrier, counter, result_queue, profile["interval"] if profile["loop_lag"] else None),
+            daemon=True
+        )
+        for i, kwargs in enumerate(worker_kwargs)
+    ]
+    for p in processes:
+        p.start()
+
+    # 主进程只负责汇总进度，必须在 join 之前取空队列，否则子进程可能阻塞在 put 上
+    loop = asyncio.get_running_loop()
+    worker_reports = []
+    with create_progress() as progress:
+        task = progress.add_task(f"[cyan]Processing {num_requests} requests in {workers} workers", total=num_requests)
+        while len(worker_reports) < workers:
+            try:
+                report = await loop.run_in_executor(None, result_queue.get, True, 0.5)
+                worker_reports.append(report)
+            except Exception:
+                if not any(p.is_alive() for p in processes) and result_queue.empty():
+                    break
+            progress.update(task, completed=counter.value)
+        progress.update(task, completed=counter.value)
+
+    for p in processes:
+        p.join()
+
+    if len(worker_reports) < workers:
+        logging.error(f"Only {len(worker_reports)}/{workers} workers reported results")
+
+    # 合并所有子进程的统计量（分位数草图可以直接按桶相加）
+    worker_reports.sort(key=lambda r: r["index"])
+    merged = RecordSink(slo=config.get("slo"))
+    for report in worker_reports:
+        merged.merge(report["stats"], report["endpoint_stats"])
+    start_time = min((r["start_time"] for r in worker_reports), default=time.time())
+    end_time = max((r["end_time"] for r in worker_reports), default=start_time)
+    elapsed = end_time - start_time
+
+    summary = load_summary(config, num_requests, duration, elapsed, use_long_context, model)
+    if config.get("record_file"):
+        summary["record_files"] = [r["record_file"] for r in worker_reports]
+    summary.update(merged.summary(elapsed, num_requests))
+    summary["workers"] = workers
+    summary["client_workers"] = [
+        {
+            "worker": report["index"],
+            "successful_requests": report["stats"].successful_requests,
+            "cpu_time": report["cpu_time"],
+            "cpu_percent": report["cpu_percent"],
+            "loop_lag": report["loop_lag"],
+            "error": report["error"],
+        }
+        for report in worker_reports
+    ]
+
+    # 单个进程的 CPU 接近 100% 时说明压测客户端自身已经饱和
+    busiest = max((r["cpu_percent"] for r in worker_reports), default=0)
+    if busiest > 90:
+        Console().print(f"[bold red]Warning: a load-generator worker reached {busiest:.0f}% CPU, "
+                        f"client may be the bottleneck. Consider more workers.[/bold red]")
+    return summary
@@ -0,0 +1,186 @@
+import math
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+from arrivals import DEFAULT_BURST
+from records import RecordSink
+from stats import ERROR_CATEGORIES, QuantileSketch, ResultAccumulator
+from vllm_benchmark import distributed_request_benchmark
+
+PHASES = ["before", "burst", "after"]
+
+
+class OverloadSeries:
+    """过载场景的时间序列，请求按实际发送时刻分桶
+
+    每桶统计发送数、成功数、各类错误数和 TTFT 分布；同时按阶段（突发前、突发、突发后）分别累计统计量。
+    """
+
+    def __init__(self, duration: float, burst: Dict[str, Any]):
+        self.burst = {**DEFAULT_BURST, **burst}
+        self.bucket = self.burst["bucket"]
+        self.burst_start = self.burst["start"]
+        self.burst_end = self.burst["start"] + self.burst["duration"]
+        # 调度滞后可能使最后的请求晚于 duration 发出，多留几个桶
+        size = int(math.ceil(duration / self.bucket)) + 8
+        self.sends = np.zeros(size, dtype=np.int64)
+        self.ends = np.zeros(size, dtype=np.int64)
+        self.successes = np.zeros(size, dtype=np.int64)
+        self.aborts = np.zeros(size, dtype=np.int64)
+        self.errors = {category: np.zeros(size, dtype=np.int64) for category in ERROR_CATEGORIES}
+        self.ttft = [QuantileSketch(relative_accuracy=0.01) for _ in range(size)]
+        self.phases = {phase: ResultAccumulator() for phase in PHASES}
+        self.last_send = 0.0
+
+    def index(self, offset: float) -> int:
+        return min(max(int(offset / self.bucket), 0), len(self.sends) - 1)
+
+    def phase(self, offset: float) -> str:
+        if offset < self.burst_start:
+            return "before"
+        return "burst" if offset < self.burst_end else "after"
+
+    def add(self, record: Dict[str, Any]) -> None:
+        send = record["actual_send"]
+        self.last_send = max(self.last_send, send)
+        i = self.index(send)
+        self.sends[i] += 1
+        self.ends[self.index(send + record["latency"])] += 1
+        self.phases[self.phase(send)].add(record)
+        if record["status"] == "ok":
+            self.successes[i] += 1
+            if record["ttft"] is not None:
+                self.ttft[i].add(record["ttft"])
+        elif record["status"] == "aborted":
+            self.aborts[i] += 1
+        else:
+            self.errors[record.get("category", "other")][i] += 1
+
+    def analyze(self) -> Dict[str, Any]:
+        """汇总排队累积、恢复时间、分阶段指标和错误率曲线
+
+        基线为突发前发出的请求。突发结束后，从某个桶开始连续 recovery_window 秒的请求
+        TTFT p50 不超过基线的 (1 + recovery_tolerance) 倍、错误率不超过基线错误率的同样倍数，
+        即视为恢复，time_to_recover 为该桶的开始时间减去突发结束时间（按发送时刻计）。
+        """
+        n = self.index(self.last_send) + 1
+        tolerance = self.burst["recovery_tolerance"]
+        ttft_p50 = [self.ttft[i].quantile(0.5) for i in range(n)]
+        ttft_p99 = [self.ttft[i].quantile(0.99) for i in range(n)]
+        errors = sum(self.errors.values())[:n]
+        finished = self.successes[:n] + errors
+        error_rate = [float(errors[i] / finished[i]) if finished[i] else None for i in range(n)]
+        in_flight = np.cumsum(self.sends)[:n] - np.cumsum(self.ends)[:n]
+
+        before = self.phases["before"]
+        baseline_ttft = before.sketches["ttft"].quantile(0.5)
+        before_total = before.successful_requests + before.failed_requests
+        baseline_error_rate = before.failed_requests / before_total if before_total else 0.0
+
+        # 排队累积：突发期间每桶 TTFT p50 的线性增长速度，以及突发开始后的峰值
+        start, end = self.index(self.burst_start), min(int(math.ceil(self.burst_end / self.bucket)), n)
+        burst_points = [(i * self.bucket, v) for i, v in enumerate(ttft_p50[start:end], start) if v is not None]
+        ttft_slope = float(np.polyfit(*zip(*burst_points), 1)[0]) if len(burst_points) >= 3 else None
+        after_start = [(v, i) for i, v in enumerate(ttft_p50[start:], start) if v is not None]
+        peak_ttft, peak_index = max(after_start) if after_start else (None, None)
+
+        recovery = {
+            "recovered": False,
+            "time_to_recover": None,
+            "ttft_threshold": baseline_ttft * (1 + tolerance) if baseline_ttft is not None else None,
+            "error_rate_threshold": baseline_error_rate * (1 + tolerance),
+        }
+        window = max(1, int(math.ceil(self.burst["recovery_window"] / self.bucket)))
+        if baseline_ttft is not None:
+            healthy = [ttft_p50[i] is not None and ttft_p50[i] <= recovery["ttft_threshold"]
+                       and (error_rate[i] or 0.0) <= recovery["error_rate_threshold"] for i in range(n)]
+            for i in range(end, n - window + 1):
+                if all(healthy[i:i + window]):
+                    recovery["recovered"] = True
+                    recovery["time_to_recover"] = max(0.0, i * self.bucket - self.burst_end)
+                    break
+
+        phase_bounds = {"before": (0.0, self.burst_start), "burst": (self.burst_start, self.burst_end),
+                        "after": (self.burst_end, max(self.burst_end, n * self.bucket))}
+        phases = {}
+        for phase, (phase_start, phase_end) in phase_bounds.items():
+            stats = self.phases[phase]
+            summary = stats.summary(phase_end - phase_start)
+            total = stats.successful_requests + stats.failed_requests
+            phases[phase] = {
+                "start": phase_start,
+                "end": phase_end,
+                "successful_requests": stats.successful_requests,
+                "failed_requests": stats.failed_requests,
+                "error_rate": stats.failed_requests / total if total else 0.0,
+                "error_categories": summary.get("error_categories", {}),
+                "requests_per_second": summary["requests_per_second"],
+                "output_tokens_per_second": summary["output_tokens_per_second"],
+                "time_to_first_token": summary["time_to_first_token"],
+            }
+
+        return {
+            "burst": self.burst,
+            "baseline_ttft_p50": baseline_ttft,
+            "baseline_error_rate": baseline_error_rate,
+            "queue_buildup": {
+                "ttft_slope": ttft_slope,
+                "peak_ttft_p50": peak_ttft,
+                "peak_ttft_time": peak_index * self.bucket - self.burst_start if peak_index is not None else None,
+                "peak_in_flight": int(in_flight.max()) if n else 0,
+            },
+            "recovery": recovery,
+            "phases": phases,
+            "timeseries": {
+                "bucket_seconds": self.bucket,
+                "time": (np.arange(n) * self.bucket).tolist(),
+                "sends": self.sends[:n].tolist(),
+                "successful": self.successes[:n].tolist(),
+                "aborts": self.aborts[:n].tolist(),
+                "in_flight": in_flight.tolist(),
+                "ttft_p50": ttft_p50,
+                "ttft_p99": ttft_p99,
+                "error_rate": error_rate,
+                "errors_by_category": {c: self.errors[c][:n].tolist() for c in ERROR_CATEGORIES if self.errors[c][:n].any()},
+            },
+        }
+
+
+class OverloadSink(RecordSink):
+    """在写出记录和累计总体统计量的同时，把记录交给 OverloadSeries"""
+
+    def __init__(self, series: OverloadSeries, record_file: Optional[str] = None, slo: Optional[Dict[str, float]] = None):
+        super().__init__(record_file, slo)
+        self.series = series
+
+    def add(self, record: Dict[str, Any], measured: bool = True) -> None:
+        super().add(record, measured)
+        self.series.add(record)
+
+
+async def run_overload_benchmark(
+    request_times: List[float],
+    duration: float,
+    spread_mode: str,
+    burst: Dict[str, Any],
+    output_tokens: int,
+    vllm_url: str,
+    api_key: str,
+    use_long_context: bool,
+    model: str,
+    request_timeout: Optional[float] = None,
+    slo: Optional[Dict[str, float]] = None,
+    workload: Optional[Dict[str, Any]] = None,
+    record_file: Optional[str] = None,
+    transport: Optional[Dict[str, Any]] = None,
+    abort: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """运行过载场景（基线 -> 突发 -> 基线），在开环测试的结果上附加 overload 分析"""
+    series = OverloadSeries(duration, burst)
+    summary = await distributed_request_benchmark(
+        len(request_times), duration, spread_mode, output_tokens, vllm_url, api_key, use_long_context, model,
+        request_times=request_times, workload=workload, record_file=record_file, transport=transport, abort=abort,
+        request_timeout=request_timeout, sink=OverloadSink(series, record_file, slo)
+    )
+    summary["overload"] = series.analyze()
+    return summary
@@ -0,0 +1,190 @@
+import asyncio
+import contextvars
+import logging
+import os
+import shutil
+import signal
+import subprocess
+import time
+from typing import List, Dict, Any, Optional
+
+from stats import QuantileSketch
+
+SAMPLERS = ["py-spy"]
+
+# 当前测试的 LoopLagMonitor，由 monitored 设置，collect_* 在开始发送请求时启动监测窗口
+_active_monitor: contextvars.ContextVar[Optional["LoopLagMonitor"]] = contextvars.ContextVar("loop_lag_monitor", default=None)
+
+# profile 配置的默认值
+DEFAULT_PROFILE = {
+    "loop_lag": True,           # 测试期间监测事件循环滞后
+    "interval": 0.01,           # 滞后采样间隔（秒）
+    "lag_threshold": 0.02,      # 滞后 p99 超过该值（秒）时结果标记为不可信
+    "sampler": None,            # "py-spy"：测试期间用采样分析器记录压测客户端自身
+    "sampler_output": "client_profile.svg",
+    "sampler_rate": 100,        # 每秒采样次数
+}
+
+
+def profile_options(config: Dict[str, Any]) -> Dict[str, Any]:
+    """profile 可以是 true、false 或选项对象；未配置时只监测事件循环滞后"""
+    spec = config.get("profile", True)
+    if spec is False:
+        return {**DEFAULT_PROFILE, "loop_lag": False}
+    return {**DEFAULT_PROFILE, **(spec if isinstance(spec, dict) else {})}
+
+
+def validate_profile_config(spec: Any) -> None:
+    """检查 profile 配置，错误时抛出 ValueError"""
+    if isinstance(spec, bool):
+        return
+    if not isinstance(spec, dict):
+        raise ValueError(f"'profile' must be true, false or an object, got {spec!r}")
+    unknown = set(spec) - set(DEFAULT_PROFILE)
+    if unknown:
+        raise ValueError(f"Unknown profile options: {', '.join(sorted(unknown))}")
+    options = {**DEFAULT_PROFILE, **spec}
+    if options["interval"] <= 0 or options["lag_threshold"] <= 0:
+        raise ValueError("'profile.interval' and 'profile.lag_threshold' must be > 0")
+    if options["sampler"] is not None:
+        if options["sampler"] not in SAMPLERS:
+            raise ValueError(f"'profile.sampler' must be one of {', '.join(SAMPLERS)}")
+        if shutil.which(options["sampler"]) is None:
+            raise ValueError(f"'profile.sampler' requires {options['sampler']} on PATH (pip install {options['sampler']})")
+
+
+class LoopLagMonitor:
+    """周期性地 sleep(interval)，实际唤醒时刻比预期晚的部分即事件循环滞后
+
+    滞后说明循环上还有别的工作（进度条、日志、SSE 解析、记录序列化）占着 CPU，
+    这段时间内到达的 token 也要晚这么久才被打上时间戳，会被误算成服务端延迟。
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.lag = QuantileSketch()
+        self.task: Optional[asyncio.Task] = None
+        self.started = False
+
+    async def run(self) -> None:
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            self.lag.add(max(0.0, time.perf_counter() - expected))
+
+    def start(self) -> None:
+        if self.task is None:
+            self.started = True
+            self.task = asyncio.create_task(self.run())
+
+    def pause(self) -> None:
+        """暂停采样，之后可以再次 start；已采集的滞后保留"""
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+
+def start_lag_window() -> None:
+    """开始（或继续）监测当前测试的事件循环滞后，collect_* 在开始计时、发出第一个请求前调用"""
+    monitor = _active_monitor.get()
+    if monitor is not None:
+        monitor.start()
+
+
+def end_lag_window() -> None:
+    """暂停监测，collect_* 在关闭客户端、收尾之前调用"""
+    monitor = _active_monitor.get()
+    if monitor is not None:
+        monitor.pause()
+
+
+async def monitored(coro, interval: Optional[float]):
+    """运行 coro 并返回 (coro 的结果, 滞后草图)；interval 为 None 或 coro 从未开启监测窗口时草图为 None
+
+    只监测 start_lag_window 与 end_lag_window 之间的发送阶段，打开客户端、预热、
+    扫描数据集、生成提示等准备工作本身就会阻塞循环，不代表测试期间的时间戳精度。
+    """
+    if interval is None:
+        return await coro, None
+    monitor = LoopLagMonitor(interval)
+    token = _active_monitor.set(monitor)
+    try:
+        result = await coro
+    finally:
+        monitor.pause()
+        _active_monitor.reset(token)
+    return result, monitor.lag if monitor.started else None
+
+
+def assess_client(result: Dict[str, Any], lag: Optional[QuantileSketch], options: Dict[str, Any]) -> None:
+    """在结果上附加 client_profile，并在客户端事件循环滞后超过阈值时标记 trustworthy 为 False
+
+    多进程和多 agent 模式下主进程的循环只汇总进度，按各子进程或 agent 中最大的滞后 p99 判断。
+    """
+    worker_lags = [w["loop_lag"]["p99"] for w in result.get("client_workers", []) + result.get("agents", [])
+                   if w.get("loop_lag") and w["loop_lag"]["p99"] is not None]
+    if lag is None and not worker_lags:
+        return
+    profile = result.setdefault("client_profile", {})
+    profile["lag_threshold"] = options["lag_threshold"]
+    worst = 0.0
+    if lag is not None:
+        profile["loop_lag"] = lag.stats()
+        worst = profile["loop_lag"]["p99"] or 0.0
+    if worker_lags:
+        profile["worker_loop_lag_p99"] = worker_lags
+        worst = max(worker_lags)
+    result["trustworthy"] = worst <= options["lag_threshold"]
+    if not result["trustworthy"]:
+        result["untrustworthy_reason"] = (f"client event loop lag p99 {worst * 1000:.1f}ms exceeds "
+                                          f"{options['lag_threshold'] * 1000:.1f}ms")
+
+
+class SamplingProfiler:
+    """在测试期间用外部采样分析器（py-spy）记录压测客户端进程及其子进程
+
+    分析器作为独立进程附加到当前进程上，不在被测的事件循环里运行。py-spy 需要 ptrace 权限，
+    容器中可能需要 CAP_SYS_PTRACE 或 sudo。输出格式按扩展名选择：.json 为 speedscope，.txt 为折叠栈，其余为火焰图。
+    """
+
+    def __init__(self, options: Dict[str, Any], output: str):
+        self.options = options
+        self.output = output
+        self.process: Optional[subprocess.Popen] = None
+
+    def command(self) -> List[str]:
+        ext = os.path.splitext(self.output)[1].lower()
+        fmt = {".json": "speedscope", ".txt": "raw"}.get(ext, "flamegraph")
+        return [self.options["sampler"], "record", "--pid", str(os.getpid()), "--rate", str(self.options["sampler_rate"]),
+                "--subprocesses", "--format", fmt, "--output", self.output]
+
+    def start(self) -> None:
+        directory = os.path.dirname(self.output)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.process = subprocess.Popen(self.command(), stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+    def stop(self, timeout: float = 30) -> Optional[str]:
+        """停止采样并等待写出结果，成功时返回输出文件路径"""
+        if self.process is None:
+            return None
+        if self.process.poll() is None:
+            self.process.send_signal(signal.SIGINT)
+        try:
+            _, stderr = self.process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            _, stderr = self.process.communicate()
+        if not os.path.exists(self.output):
+            logging.warning(f"{self.options['sampler']} wrote no profile (exit code {self.process.returncode}): "
+                            f"{stderr.decode(errors='replace').strip()[-500:]}")
+            return None
+        return self.output
+
+
+def sampler_output(options: Dict[str, Any], index: int, total: int) -> str:
+    """多个测试配置时每个配置一个输出文件：client_profile.svg -> client_profile.1.svg"""
+    if total <= 1:
+        return options["sampler_output"]
+    root, ext = os.path.splitext(options["sampler_output"])
+    return f"{root}.{index}{ext}"
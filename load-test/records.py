@@ -0,0 +1,129 @@
+import json
+import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Dict, Any, Optional
+
+from routing import summarize_routing
+from stats import ResultAccumulator
+
+
+class RecordWriter:
+    """把请求记录以 JSON Lines 格式增量写入文件
+
+    记录先在内存中攒成批，满 batch_size 条或距上次写入超过 flush_interval 秒时，
+    交给单独的写线程序列化并写盘，不阻塞发送请求的事件循环。写线程中的错误（磁盘满、无法序列化）
+    在 close 时重新抛出，记录文件不完整时测试不会报告成功。
+    """
+
+    def __init__(self, path: str, batch_size: int = 256, flush_interval: float = 1.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file = open(path, "w", encoding="utf-8")
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="record-writer")
+        self.buffer: List[Dict[str, Any]] = []
+        self.last_flush = time.monotonic()
+        # 未完成或失败的写入；成功完成的随时丢弃，长时间运行时不会积累
+        self.futures: List[Future] = []
+
+    def write(self, record: Dict[str, Any]) -> None:
+        self.buffer.append(record)
+        if len(self.buffer) >= self.batch_size or time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self) -> None:
+        self.last_flush = time.monotonic()
+        if self.buffer:
+            batch, self.buffer = self.buffer, []
+            self.futures = [f for f in self.futures if not f.done() or f.exception() is not None]
+            self.futures.append(self.executor.submit(self._write_batch, batch))
+
+    def _write_batch(self, batch: List[Dict[str, Any]]) -> None:
+        self.file.write("".join(json.dumps(r, separators=(",", ":"), default=float) + "\n" for r in batch))
+        self.file.flush()
+
+    def close(self) -> None:
+        """写出剩余记录并等待写线程结束，写入失败时抛出第一个错误"""
+        self.flush()
+        self.executor.shutdown(wait=True)
+        self.file.close()
+        futures, self.futures = self.futures, []
+        for future in futures:
+            future.result()
+
+
+class RecordSink:
+    """请求记录的去处：编号后写入原始记录文件，同时累计统计量
+
+    不在内存中保留记录，长时间运行时内存占用保持不变；需要额外统计的模式继承它并在 add 中累计自己的草图。
+    writer 可以替换为任何带 write / close 方法的对象（如 agent 把记录回传给协调器）。
+    """
+
+    def __init__(
+        self,
+        record_file: Optional[str] = None,
+        slo: Optional[Dict[str, float]] = None,
+        worker: Optional[int] = None,
+        writer: Optional[Any] = None
+    ):
+        self.slo = slo
+        self.stats = ResultAccumulator(slo)
+        # 多端点时按端点分别统计
+        self.endpoint_stats: Dict[str, ResultAccumulator] = {}
+        self.writer = writer if writer is not None else RecordWriter(record_file) if record_file else None
+        self.worker = worker
+        self.count = 0
+
+    def add(self, record: Dict[str, Any], measured: bool = True) -> None:
+        """measured 为 False 的记录（如预热期间的请求）只写入文件，不计入统计"""
+        record["id"] = self.count if self.worker is None else f"{self.worker}-{self.count}"
+        if self.worker is not None:
+            record["worker"] = self.worker
+        self.count += 1
+        # 先累计统计，slo 标记随记录一起写出；写入后不能再修改记录
+        if measured:
+            self.stats.add(record)
+            if "endpoint" in record:
+                self.endpoint_stats.setdefault(record["endpoint"], ResultAccumulator(self.slo)).add(record)
+        if self.writer is not None:
+            self.writer.write(record)
+
+    def merge(self, stats: ResultAccumulator, endpoint_stats: Dict[str, ResultAccumulator]) -> None:
+        """合并其他进程的统计量"""
+        self.stats.merge(stats)
+        for endpoint, other in endpoint_stats.items():
+            self.endpoint_stats.setdefault(endpoint, ResultAccumulator(self.slo)).merge(other)
+
+    def summary(self, total_elapsed_time: float, total_requests: Optional[int] = None) -> Dict[str, Any]:
+        """汇总指标；多端点时附带每个端点的指标和请求分布"""
+        summary = self.stats.summary(total_elapsed_time, total_requests)
+        if self.endpoint_stats:
+            endpoints = {endpoint: stats.summary(total_elapsed_time)
+                         for endpoint, stats in sorted(self.endpoint_stats.items())}
+            summary["endpoints"] = endpoints
+            summary["routing"] = summarize_routing(endpoints)
+        return summary
+
+    def close(self) -> None:
+        # 先清空 writer：close 重新抛出写入错误后，调用方在异常处理中再次 close 不会重复关闭
+        writer, self.writer = self.writer, None
+        if writer is not None:
+            writer.close()
+
+
+def worker_record_file(record_file: Optional[str], worker: int) -> Optional[str]:
+    """多进程时每个子进程写自己的文件：records.jsonl -> records.worker0.jsonl"""
+    if not record_file:
+        return None
+    root, ext = os.path.splitext(record_file)
+    return f"{root}.worker{worker}{ext or '.jsonl'}"
+
+
+def read_records(path: str) -> List[Dict[str, Any]]:
+    """读取原始记录文件，用于离线重新分析"""
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
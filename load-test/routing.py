@@ -0,0 +1,105 @@
+import itertools
+import random
+import zlib
+from typing import List, Dict, Any, Tuple, Union
+
+ROUTING_POLICIES = ["round_robin", "random", "least_outstanding", "prefix_hash"]
+
+DEFAULT_ROUTING = {
+    "policy": "round_robin",
+    "prefix_length": 256,   # prefix_hash 使用的提示前缀字符数
+}
+
+
+def routing_config(spec: Union[str, Dict[str, Any], None]) -> Dict[str, Any]:
+    """routing 可以是策略名，也可以是 {"policy": ..., "prefix_length": ...}"""
+    if spec is None:
+        return dict(DEFAULT_ROUTING)
+    if isinstance(spec, str):
+        return {**DEFAULT_ROUTING, "policy": spec}
+    return {**DEFAULT_ROUTING, **spec}
+
+
+def validate_routing_config(spec: Union[str, Dict[str, Any]]) -> None:
+    """检查 routing 配置，错误时抛出 ValueError"""
+    if not isinstance(spec, (str, dict)):
+        raise ValueError(f"'routing' must be a policy name or an object, got {spec!r}")
+    routing = routing_config(spec)
+    if routing["policy"] not in ROUTING_POLICIES:
+        raise ValueError(f"Invalid routing policy '{routing['policy']}'. Must be one of: {', '.join(ROUTING_POLICIES)}")
+    if routing["prefix_length"] < 1:
+        raise ValueError("'routing.prefix_length' must be >= 1")
+
+
+def parse_endpoints(vllm_url: str) -> Union[str, List[str]]:
+    """--vllm_url 可以用逗号分隔多个端点，只有一个时仍返回字符串"""
+    urls = [url.strip() for url in vllm_url.split(",") if url.strip()]
+    return urls[0] if len(urls) == 1 else urls
+
+
+def prompt_prefix(messages: List[Dict[str, Any]], length: int) -> str:
+    """按消息顺序拼接出提示的前 length 个字符，系统提示和历史相同的请求前缀相同"""
+    parts = []
+    total = 0
+    for message in messages:
+        content = str(message.get("content", ""))
+        parts.append(content)
+        total += len(content)
+        if total >= length:
+            break
+    return "\n".join(parts)[:length]
+
+
+class EndpointRouter:
+    """在多个端点（vLLM 副本）之间分发请求
+
+    - round_robin：依次轮换
+    - random：均匀随机
+    - least_outstanding：选择在途请求最少的端点，相同时轮换
+    - prefix_hash：按提示前缀哈希固定到某个端点，使相同前缀命中同一副本的前缀缓存
+    """
+
+    def __init__(self, urls: List[str], clients: List[Any], routing: Dict[str, Any]):
+        self.urls = urls
+        self.clients = clients
+        self.policy = routing["policy"]
+        self.prefix_length = routing["prefix_length"]
+        self.outstanding = [0] * len(clients)
+        self.cycle = itertools.cycle(range(len(clients)))
+        self.rng = random.Random()
+
+    def choose(self, messages: List[Dict[str, Any]]) -> int:
+        if self.policy == "random":
+            return self.rng.randrange(len(self.clients))
+        if self.policy == "least_outstanding":
+            start = next(self.cycle)
+            order = [(start + i) % len(self.clients) for i in range(len(self.clients))]
+            return min(order, key=lambda i: self.outstanding[i])
+        if self.policy == "prefix_hash":
+            # crc32 在不同进程之间结果一致（内置 hash 对字符串加了随机盐）
+            prefix = prompt_prefix(messages, self.prefix_length)
+            return zlib.crc32(prefix.encode("utf-8")) % len(self.clients)
+        return next(self.cycle)
+
+    def acquire(self, messages: List[Dict[str, Any]]) -> Tuple[int, Any]:
+        index = self.choose(messages)
+        self.outstanding[index] += 1
+        return index, self.clients[index]
+
+    def release(self, index: int) -> None:
+        self.outstanding[index] -= 1
+
+    async def close(self) -> None:
+        for client in self.clients:
+            await client.close()
+
+
+def summarize_routing(endpoints: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """各端点的请求占比和负载不均衡程度（最多的端点请求数 / 平均请求数）"""
+    counts = {url: summary["successful_requests"] for url, summary in endpoints.items()}
+    total = sum(counts.values())
+    mean = total / len(counts) if counts else 0
+    return {
+        "share": {url: count / total if total else 0 for url, count in counts.items()},
+        "load_imbalance": max(counts.values()) / mean if mean else None,
+    }
@@ -3,36 +3,204 @@ import json
 import time
 import logging
 import os
-from typing import List, Dict, Any, Optional, Union
+from typing import List, Dict, Any, Optional, Union, Tuple
 import click
 from rich.console import Console
 from rich.table import Table
 from rich.progress import Progress, TextColumn, BarColumn, TaskProgressColumn
 from vllm_benchmark import run_benchmark, distributed_request_benchmark, print_results
+from stats import REQUEST_SLO_FIELDS
+from multiproc import run_multiprocess_benchmark
+from agent import AGENT_TOKEN_ENV, run_agent_benchmark, parse_agents
+from arrivals import build_arrival_times, open_loop_timeout, planned_duration, validate_arrival_config
+from workloads import validate_workload_config
+from conversations import run_conversation_benchmark, validate_conversation_config
+from steady_state import run_steady_benchmark, validate_steady_config, DEFAULT_STEADY
+from capacity_search import find_capacity, display_search_results, validate_search_config
+from server_metrics import create_scraper, validate_server_metrics_config
+from transport import transport_options, validate_transport_config
+from routing import parse_endpoints, routing_config, validate_routing_config
+from aborts import validate_abort_config, summarize_abort_run
+from overload import run_overload_benchmark
+from mixed import run_mixed_benchmark, validate_mixed_config
+from batch import run_batch_benchmark, validate_batch_config
+from profiling import (profile_options, validate_profile_config, monitored, assess_client, SamplingProfiler,
+                       sampler_output)
 
 async def execute_benchmark(
     config: Dict[str, Any], 
     vllm_url: str, 
     api_key: str, 
     use_long_context: bool, 
-    model: str
+    model: str,
+    workers: int = 1,
+    agents: Optional[List[Tuple[str, int, str]]] = None
+) -> Dict[str, Any]:
+    """执行单个基准测试，配置了 server_metrics 时在测试期间后台抓取服务端指标
+
+    配置了 abort.baseline 时先以相同配置（不断开）运行一次对照，用于比较断开对容量的影响。
+    测试期间监测客户端事件循环的滞后，超过 profile.lag_threshold 时结果标记为不可信（trustworthy 为 False）。
+    """
+    abort = config.get('abort')
+    baseline = None
+    if abort and abort.get('baseline'):
+        Console().print("Running the baseline without client aborts...")
+        baseline = await execute_benchmark({k: v for k, v in config.items() if k not in ('abort', 'record_file')},
+                                           vllm_url, api_key, use_long_context, model, workers, agents)
+        await asyncio.sleep(5)
+    profile = profile_options(config)
+    lag_interval = profile['interval'] if profile['loop_lag'] else None
+    scraper = create_scraper(config.get('server_metrics'), vllm_url)
+    if scraper is None:
+        result, lag = await monitored(dispatch_benchmark(config, vllm_url, api_key, use_long_context, model, workers, agents),
+                                      lag_interval)
+    else:
+        scraper.start()
+        try:
+            result, lag = await monitored(dispatch_benchmark(config, vllm_url, api_key, use_long_context, model, workers, agents),
+                                          lag_interval)
+        finally:
+            server_metrics = await scraper.stop()
+        result["server_metrics"] = server_metrics
+    assess_client(result, lag, profile)
+    if result.get("trustworthy") is False:
+        Console().print(f"[bold red]Warning: result is untrustworthy, {result['untrustworthy_reason']}. "
+                        f"Client-side delays are counted as server latency; use more workers or the lean transport.[/bold red]")
+    result["transport"] = config.get('transport', 'openai')
+    # 保存原始配置，compare.py 按配置对齐不同运行的结果
+    result["config"] = config
+    if isinstance(vllm_url, list):
+        result["endpoint_urls"] = vllm_url
+        result["routing_policy"] = routing_config(config.get('routing'))["policy"]
+    if abort:
+        result["abort"] = summarize_abort_run(result, baseline)
+    return result
+
+async def dispatch_benchmark(
+    config: Dict[str, Any], 
+    vllm_url: str, 
+    api_key: str, 
+    use_long_context: bool, 
+    model: str,
+    workers: int = 1,
+    agents: Optional[List[Tuple[str, int, str]]] = None
 ) -> Dict[str, Any]:
     """执行单个基准测试，无论是并发模式还是分布式模式"""
-    if "spread_mode" in config and "duration" in config:
-        # 分布式模式
+    workers = config.get('workers', workers)
+    if agents:
+        # 多主机模式，负载拆分到各台负载机上的 agent
+        console = Console()
+        console.print(f"Splitting the load across [bold]{len(agents)}[/bold] agents...")
+        return await run_agent_benchmark(config, agents, vllm_url, api_key, use_long_context, model)
+    elif workers > 1:
+        # 多进程模式，避免单个事件循环成为瓶颈
+        console = Console()
+        console.print(f"Splitting [bold]{config['num_requests']}[/bold] requests across [bold]{workers}[/bold] worker processes...")
+        return await run_multiprocess_benchmark(config, workers, vllm_url, api_key, use_long_context, model)
+    elif "batch" in config:
+        # 批处理吞吐模式：非流式 /v1/completions，队列始终排满
+        console = Console()
+        console.print(f"Running batch throughput benchmark with [bold]{config['batch'].get('num_prompts', 1000)}[/bold] prompts...")
+
+        return await run_batch_benchmark(config, vllm_url, api_key, use_long_context, model, transport_options(config))
+    elif "conversation" in config:
+        # 多轮对话模式
+        console = Console()
+        console.print(f"Running conversation benchmark with [bold]{config['concurrency']}[/bold] concurrent sessions...")
+        
+        return await run_conversation_benchmark(
+            config['conversation'],
+            config['concurrency'],
+            config.get('request_timeout', 30),
+            config.get('output_tokens', 100),
+            vllm_url,
+            api_key,
+            model,
+            slo=config.get('slo'),
+            record_file=config.get('record_file'),
+            transport=transport_options(config)
+        )
+    elif "classes" in config:
+        # 多类请求混合的开环模式
         console = Console()
-        console.print(f"Running distributed benchmark with [bold]{config['num_requests']}[/bold] requests over "
-                      f"[bold]{config['duration']}s[/bold] using [bold]{config['spread_mode']}[/bold] distribution...")
+        console.print(f"Running mixed benchmark with [bold]{len(config['classes'])}[/bold] request classes "
+                      f"({', '.join(c['name'] for c in config['classes'])}) for [bold]{config['duration']}s[/bold]...")
+
+        return await run_mixed_benchmark(config, vllm_url, api_key, use_long_context, model, transport_options(config))
+    elif "duration" in config and "spread_mode" not in config:
+        # 按时长的闭环稳态模式
+        console = Console()
+        console.print(f"Running closed-loop benchmark for [bold]{config['duration']}s[/bold] with "
+                      f"[bold]{config['concurrency']}[/bold] requests in flight...")
+        
+        return await run_steady_benchmark(
+            config['concurrency'],
+            config['duration'],
+            config.get('request_timeout', 30),
+            config.get('output_tokens', 100),
+            vllm_url,
+            api_key,
+            use_long_context,
+            model,
+            warmup=config.get('warmup', DEFAULT_STEADY['warmup']),
+            cooldown=config.get('cooldown', DEFAULT_STEADY['cooldown']),
+            steady_tolerance=config.get('steady_tolerance', DEFAULT_STEADY['steady_tolerance']),
+            slo=config.get('slo'),
+            workload=config.get('workload'),
+            record_file=config.get('record_file'),
+            transport=transport_options(config),
+            abort=config.get('abort')
+        )
+    elif "burst" in config:
+        # 过载场景：基线速率 -> 突发 -> 回到基线
+        request_times = build_arrival_times(config)
+        burst = config['burst']
+        console = Console()
+        console.print(f"Running overload scenario: [bold]{config['request_rate']}[/bold] req/s, "
+                      f"[bold]{burst.get('multiplier', 5.0)}x[/bold] burst for [bold]{burst.get('duration', 30)}s[/bold] "
+                      f"({len(request_times)} requests over [bold]{config['duration']}s[/bold])...")
+
+        return await run_overload_benchmark(
+            request_times,
+            config['duration'],
+            config['spread_mode'],
+            burst,
+            config.get('output_tokens', 100),
+            vllm_url,
+            api_key,
+            use_long_context,
+            model,
+            request_timeout=open_loop_timeout(config),
+            slo=config.get('slo'),
+            workload=config.get('workload'),
+            record_file=config.get('record_file'),
+            transport=transport_options(config),
+            abort=config.get('abort')
+        )
+    elif "spread_mode" in config:
+        # 分布式模式（开环调度）
+        request_times = build_arrival_times(config)
+        duration = planned_duration(config, request_times)
+        console = Console()
+        console.print(f"Running distributed benchmark with [bold]{len(request_times)}[/bold] requests over "
+                      f"[bold]{duration:.0f}s[/bold] using [bold]{config['spread_mode']}[/bold] distribution...")
         
         return await distributed_request_benchmark(
-            config['num_requests'], 
-            config['duration'], 
+            len(request_times), 
+            duration, 
             config['spread_mode'],
             config.get('output_tokens', 100), 
             vllm_url, 
             api_key,
             use_long_context, 
-            model
+            model,
+            request_times=request_times,
+            slo=config.get('slo'),
+            workload=config.get('workload'),
+            record_file=config.get('record_file'),
+            transport=transport_options(config),
+            abort=config.get('abort'),
+            request_timeout=open_loop_timeout(config)
         )
     else:
         # 并发模式
@@ -48,9 +216,29 @@ async def execute_benchmark(
             vllm_url, 
             api_key,
             use_long_context, 
-            model
+            model,
+            slo=config.get('slo'),
+            workload=config.get('workload'),
+            record_file=config.get('record_file'),
+            transport=transport_options(config),
+            abort=config.get('abort')
         )
 
+async def execute_search(
+    config: Dict[str, Any], 
+    vllm_url: str, 
+    api_key: str, 
+    use_long_context: bool, 
+    model: str,
+    workers: int = 1,
+    agents: Optional[List[Tuple[str, int, str]]] = None
+) -> Dict[str, Any]:
+    """执行容量搜索，每个探测点复用 execute_benchmark"""
+    async def run_probe(probe_config: Dict[str, Any]) -> Dict[str, Any]:
+        return await execute_benchmark(probe_config, vllm_url, api_key, use_long_context, model, workers, agents)
+    
+    return await find_capacity(config, run_probe, len(agents) if agents else config.get('workers', workers))
+
 def display_results_table(all_results: List[Dict[str, Any]]) -> None:
     """以表格形式显示多个测试结果的比较"""
     console = Console()
@@ -66,14 +254,30 @@ def display_results_table(all_results: List[Dict[str, Any]]) -> None:
     table.add_column("TTFT avg (s)", style="blue")
     table.add_column("Token/s avg", style="red")
     table.add_column("Token/s P95", style="red")
+    table.add_column("TPOT P95 (ms)", style="blue")
+    table.add_column("Out tok/s", style="red")
+    show_goodput = any("goodput" in result for result in all_results)
+    if show_goodput:
+        table.add_column("Goodput req/s", style="green")
+        table.add_column("Goodput tok/s", style="green")
+        table.add_column("SLO Attain", style="green")
+    show_server = any("server_metrics" in result for result in all_results)
+    if show_server:
+        table.add_column("Peak Waiting", style="yellow")
+        table.add_column("Max KV %", style="yellow")
+        table.add_column("Preemptions", style="yellow")
     
     # 填充数据
     for result in all_results:
         # 获取并转换需要的值
         if "concurrency" in result:
             concurrency = str(result["concurrency"])
+        elif "batch" in result:
+            concurrency = f"batch (in-flight {result['max_in_flight']})"
         else:
-            concurrency = f"{result['spread_mode']} ({result['total_requests']} reqs)"
+            concurrency = f"{result['spread_mode']} ({result['offered_rate']:.1f} req/s)"
+        if result.get("trustworthy") is False:
+            concurrency += " [red](untrustworthy)[/red]"
             
         total = str(result["total_requests"])
         success_rate = f"{(result['successful_requests'] / result['total_requests']) * 100:.1f}%" if result["total_requests"] > 0 else "0%"
@@ -83,13 +287,34 @@ def display_results_table(all_results: List[Dict[str, Any]]) -> None:
         ttft_avg = f"{result['time_to_first_token']['average']:.2f}"
         tokens_per_sec_avg = f"{result['tokens_per_second']['average']:.2f}"
         tokens_per_sec_p95 = f"{result['tokens_per_second']['p95']:.2f}"
+        tpot_p95 = result['time_per_output_token']['p95']
+        tpot_p95 = f"{tpot_p95 * 1000:.1f}" if tpot_p95 is not None else "-"
+        output_tps = f"{result['output_tokens_per_second']:.1f}"
         
-        # 添加行
-        table.add_row(
+        row = [
             concurrency, total, success_rate, req_per_sec, 
             lat_avg, lat_p95, ttft_avg, 
-            tokens_per_sec_avg, tokens_per_sec_p95
-        )
+            tokens_per_sec_avg, tokens_per_sec_p95,
+            tpot_p95, output_tps
+        ]
+        if show_goodput:
+            goodput = result.get("goodput")
+            if goodput:
+                row += [f"{goodput['requests_per_second']:.2f}", f"{goodput['output_tokens_per_second']:.1f}",
+                        f"{goodput['attainment'] * 100:.1f}%"]
+            else:
+                row += ["-", "-", "-"]
+        if show_server:
+            server = result.get("server_metrics", {}).get("summary", {})
+            peak_waiting, kv_usage, preemptions = (server.get(k) for k in ("peak_waiting", "max_kv_cache_usage", "preemptions"))
+            row += [
+                f"{peak_waiting:.0f}" if peak_waiting is not None else "-",
+                f"{kv_usage * 100:.1f}%" if kv_usage is not None else "-",
+                f"{preemptions:.0f}" if preemptions is not None else "-",
+            ]
+        
+        # 添加行
+        table.add_row(*row)
     
     console.print(table)
 
@@ -109,14 +334,127 @@ def parse_config_option(ctx, param, value):
         except (json.JSONDecodeError, FileNotFoundError) as e:
             raise click.BadParameter(f"Invalid configuration: {str(e)}")
 
+def validate_benchmark_config(
+    cfg: Dict[str, Any],
+    workers: int = 1,
+    agents: Optional[List[Tuple[str, int, str]]] = None
+) -> None:
+    """检查一个测试配置，错误时抛出 click.BadParameter；sweep.py 在启动服务之前也用它检查测试套件"""
+    if "conversation" in cfg:
+        # 多轮对话模式，请求数由会话数和轮数决定
+        try:
+            validate_conversation_config(cfg)
+        except ValueError as e:
+            raise click.BadParameter(str(e))
+        if cfg.get("workers", workers) > 1:
+            raise click.BadParameter(f"Conversation mode does not support multiple workers: {cfg}")
+    elif "batch" in cfg:
+        # 批处理吞吐模式，请求数由提示数和每个请求的提示数决定
+        try:
+            validate_batch_config(cfg)
+        except ValueError as e:
+            raise click.BadParameter(str(e))
+        if agents or cfg.get("workers", workers) > 1:
+            raise click.BadParameter(f"'batch' does not support --agents or multiple workers: {cfg}")
+    elif "classes" in cfg:
+        # 多类请求混合模式，每个类别有自己的到达过程、负载和 SLO
+        try:
+            validate_mixed_config(cfg)
+        except ValueError as e:
+            raise click.BadParameter(str(e))
+        if agents or cfg.get("workers", workers) > 1:
+            raise click.BadParameter(f"'classes' does not support --agents or multiple workers: {cfg}")
+    elif "search" in cfg:
+        # 容量搜索模式，负载参数由搜索过程决定
+        try:
+            validate_search_config(cfg, len(agents) if agents else cfg.get("workers", workers))
+        except ValueError as e:
+            raise click.BadParameter(str(e))
+        if "duration" in cfg and "spread_mode" not in cfg:
+            # 探测点按时长闭环运行，并发数由搜索给出，其余与按时长的闭环模式相同
+            try:
+                validate_steady_config({**cfg, "concurrency": cfg.get("concurrency", 1)})
+            except ValueError as e:
+                raise click.BadParameter(str(e))
+            if cfg.get("workers", workers) > 1:
+                raise click.BadParameter(f"Duration-based closed-loop mode does not support multiple workers: {cfg}")
+    elif "spread_mode" in cfg:
+        # 分布式模式配置检查
+        try:
+            validate_arrival_config(cfg)
+        except ValueError as e:
+            raise click.BadParameter(str(e))
+    elif "duration" in cfg:
+        # 按时长的闭环模式
+        try:
+            validate_steady_config(cfg)
+        except ValueError as e:
+            raise click.BadParameter(str(e))
+        if cfg.get("workers", workers) > 1:
+            raise click.BadParameter(f"Duration-based closed-loop mode does not support multiple workers: {cfg}")
+    elif "num_requests" not in cfg:
+        raise click.BadParameter(f"Missing 'num_requests' in configuration: {cfg}")
+    elif "concurrency" not in cfg:
+        # 并发模式需要 concurrency
+        raise click.BadParameter(f"Missing 'concurrency' in configuration for concurrent mode: {cfg}")
+    if "slo" in cfg:
+        unknown = set(cfg["slo"]) - set(REQUEST_SLO_FIELDS)
+        if not isinstance(cfg["slo"], dict) or unknown:
+            raise click.BadParameter(f"Invalid 'slo' {cfg['slo']}. Keys must be among: {', '.join(REQUEST_SLO_FIELDS)}")
+    try:
+        validate_transport_config(cfg)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    if "routing" in cfg:
+        try:
+            validate_routing_config(cfg["routing"])
+        except ValueError as e:
+            raise click.BadParameter(str(e))
+    if "profile" in cfg:
+        try:
+            validate_profile_config(cfg["profile"])
+        except ValueError as e:
+            raise click.BadParameter(str(e))
+    if "server_metrics" in cfg:
+        try:
+            validate_server_metrics_config(cfg["server_metrics"])
+        except ValueError as e:
+            raise click.BadParameter(str(e))
+    if "workload" in cfg:
+        try:
+            validate_workload_config(cfg["workload"])
+        except ValueError as e:
+            raise click.BadParameter(str(e))
+    if "abort" in cfg:
+        try:
+            validate_abort_config(cfg["abort"])
+        except ValueError as e:
+            raise click.BadParameter(str(e))
+        if "conversation" in cfg:
+            raise click.BadParameter(f"'abort' is not supported in conversation mode: {cfg}")
+    if "burst" in cfg and (agents or cfg.get("workers", workers) > 1):
+        raise click.BadParameter(f"'burst' does not support --agents or multiple workers: {cfg}")
+    if agents and any(k in cfg for k in ("conversation", "duration")) and "spread_mode" not in cfg:
+        raise click.BadParameter(f"--agents supports concurrent (num_requests) and spread_mode configurations only: {cfg}")
+    if agents and "concurrency" in cfg and "spread_mode" not in cfg and cfg["concurrency"] < len(agents):
+        raise click.BadParameter(f"'concurrency' must be >= the number of agents: {cfg}")
+    cfg_workers = cfg.get("workers", workers)
+    if cfg_workers < 1:
+        raise click.BadParameter(f"'workers' must be >= 1: {cfg}")
+    if "concurrency" in cfg and not any(k in cfg for k in ("spread_mode", "search", "conversation", "duration")) and cfg["concurrency"] < cfg_workers:
+        raise click.BadParameter(f"'concurrency' must be >= 'workers' in configuration: {cfg}")
+
 @click.command()
-@click.option("--vllm_url", type=str, required=True, help="URL of the vLLM server")
+@click.option("--vllm_url", type=str, required=True, help="URL of the vLLM server, or comma-separated URLs of several replicas")
 @click.option("--api_key", type=str, required=True, help="API key for vLLM server")
 @click.option("--use_long_context", is_flag=True, help="Use long context prompt pairs instead of short prompts")
 @click.option("--model", type=str, required=True, help="Model name to use for benchmarking")
 @click.option("--output_file", type=str, default="benchmark_results.json", help="Output file for JSON results")
 @click.option("--config", callback=parse_config_option, help="Configuration as JSON string, JSON array string, or path to JSON file")
 @click.option("--quiet", is_flag=True, help="Reduce output verbosity")
+@click.option("--workers", type=int, default=1, help="Number of load-generator processes (overridden by 'workers' in config)")
+@click.option("--agents", type=str, default=None, help="Comma-separated host:port of load-generator agents (see agent.py)")
+@click.option("--agent_token", type=str, default=None, envvar=AGENT_TOKEN_ENV, help=f"Shared token of the agents (or set {AGENT_TOKEN_ENV})")
 def main(
     vllm_url: str, 
     api_key: str, 
@@ -124,7 +462,10 @@ def main(
     model: str, 
     output_file: str, 
     config: Optional[Union[Dict[str, Any], List[Dict[str, Any]]]],
-    quiet: bool
+    quiet: bool,
+    workers: int,
+    agents: Optional[str],
+    agent_token: Optional[str]
 ) -> None:
     """Run one or more benchmarks for LLM models served by vLLM.
     
@@ -137,12 +478,39 @@ def main(
     Configuration parameters:
     - num_requests: Number of requests to make
     - concurrency: (For concurrent mode) Number of concurrent requests
-    - request_timeout: (Optional) Timeout for each request in seconds
+    - request_timeout: (Optional) Timeout for each request in seconds (distributed mode: defaults to duration, or 30 without duration)
     - output_tokens: (Optional) Number of tokens to generate per request
-    - spread_mode: (For distributed mode) Distribution mode (uniform/normal/exponential)
+    - duration: (For concurrent mode, instead of num_requests) Run closed-loop for this many seconds
+    - warmup / cooldown: (For duration-based concurrent mode) Seconds excluded from statistics at the start / end
+    - spread_mode: (For distributed mode) Arrival mode (uniform/normal/exponential/poisson/gamma/trace)
     - duration: (For distributed mode) Test duration in seconds
+    - request_rate: (For poisson/gamma) Target arrival rate in requests per second
+    - burstiness_cv: (For gamma) Coefficient of variation of inter-arrival times (default: 2.0)
+    - trace_file: (For trace) File with one arrival timestamp per line
+    - burst: (For poisson/gamma with duration) Overload scenario, e.g. {"multiplier": 5, "start": 30, "duration": 30}
+    - workers: (Optional) Number of load-generator processes to split the load across
+    - workload: (Optional) Prompt source, e.g. {"type": "synthetic", "input_len": 2048, "output_len": 256}
+    - conversation: (Optional) Multi-turn session mode, e.g. {"num_sessions": 64, "turns": 5, "system_prompt_len": 2000}
+    - routing: (Optional) With several --vllm_url endpoints: round_robin (default), random, least_outstanding or prefix_hash
+    - transport: (Optional) HTTP client, "openai" (default) or "lean" (minimal pooled SSE client)
+    - http2 / pool_size / prewarm: (Optional) Transport options: HTTP/2 for the lean client, connection pool size, pre-warmed connections
+    - record_file: (Optional) JSON Lines file that receives every request's raw record as it completes
+    - slo: (Optional) Per-request SLO in seconds for goodput, e.g. {"ttft": 2.0, "tpot": 0.08, "e2e": 30}
+    - profile: (Optional) Client self-profiling, false or {"lag_threshold": 0.02, "sampler": "py-spy", "sampler_output": "client_profile.svg"}
+    - server_metrics: (Optional) Scrape vLLM /metrics during the run, true or {"url": ..., "interval": 1.0}
+    - abort: (Optional) Clients that disconnect mid-stream, e.g. {"fraction": 0.3, "after_tokens": 20, "baseline": true}
+    - batch: (Batch throughput mode) e.g. {"num_prompts": 10000, "prompts_per_request": 8, "n": 1, "stream": false, "max_in_flight": 512}
+    - classes: (Open-loop with duration) Mixed request classes, each with its own request_rate or weight, spread_mode, workload and slo
+    - class_baseline: (Optional, with classes) Also run each class alone and report the latency ratios
+    - search: (Optional) Capacity search spec, e.g. {"param": "concurrency", "slo": {"ttft_p99": 2.0}}
     """
     configs = []
+    vllm_url = parse_endpoints(vllm_url)
+    if agents:
+        try:
+            agents = parse_agents(agents, agent_token)
+        except ValueError as e:
+            raise click.BadParameter(str(e))
     
     # 获取配置列表
     if config:
@@ -159,15 +527,7 @@ def main(
     
     # 验证配置
     for cfg in configs:
-        if "num_requests" not in cfg:
-            raise click.BadParameter(f"Missing 'num_requests' in configuration: {cfg}")
-        if "spread_mode" in cfg and "duration" in cfg:
-            # 分布式模式配置检查
-            if cfg["spread_mode"] not in ["uniform", "normal", "exponential"]:
-                raise click.BadParameter(f"Invalid spread_mode '{cfg['spread_mode']}'. Must be one of: uniform, normal, exponential")
-        elif "concurrency" not in cfg:
-            # 并发模式需要 concurrency
-            raise click.BadParameter(f"Missing 'concurrency' in configuration for concurrent mode: {cfg}")
+        validate_benchmark_config(cfg, workers, agents)
     
     # 添加控制日志输出级别的选项
     logging_level = logging.WARNING if quiet else logging.INFO
@@ -188,16 +548,41 @@ def main(
     # 移除总进度条，只使用单个测试内部的进度条
     for i, cfg in enumerate(configs):
         # 为每个配置创建描述
-        if "spread_mode" in cfg:
-            config_desc = f"分布式 ({cfg['spread_mode']}, {cfg['num_requests']}请求, {cfg['duration']}秒)"
+        if "conversation" in cfg:
+            config_desc = f"多轮对话 ({cfg['conversation'].get('num_sessions', 32)}会话, 并发{cfg['concurrency']})"
+        elif "search" in cfg:
+            config_desc = f"容量搜索 ({cfg['search'].get('param', 'concurrency')}, SLO {cfg['search']['slo']})"
+        elif "batch" in cfg:
+            config_desc = f"批处理吞吐 ({cfg['batch'].get('num_prompts', 1000)}提示, 在途{cfg['batch'].get('max_in_flight', 256)})"
+        elif "classes" in cfg:
+            config_desc = f"混合负载 ({', '.join(c['name'] for c in cfg['classes'])}, {cfg['duration']}秒)"
+        elif "duration" in cfg and "spread_mode" not in cfg:
+            config_desc = f"稳态测试 (并发{cfg['concurrency']}, {cfg['duration']}秒, 预热{cfg.get('warmup', DEFAULT_STEADY['warmup'])}秒)"
+        elif "spread_mode" in cfg:
+            config_desc = f"分布式 ({cfg['spread_mode']}, {cfg.get('num_requests', cfg.get('request_rate', '-'))}{'请求' if 'num_requests' in cfg else 'req/s'}, {cfg.get('duration', '-')}秒)"
         else:
             config_desc = f"并发测试 ({cfg['num_requests']}请求, 并发{cfg['concurrency']})"
             
         # 使用简单的文本输出代替总进度条
         console.print(f"[green]执行测试 {i+1}/{len(configs)}: {config_desc}[/green]")
         
-        # 执行测试
-        result = asyncio.run(execute_benchmark(cfg, vllm_url, api_key, use_long_context, model))
+        # 配置了采样分析器时，分析器覆盖这个配置的整个运行（包括对照运行和容量搜索的所有探测点）
+        profile = profile_options(cfg)
+        sampler = SamplingProfiler(profile, sampler_output(profile, i, len(configs))) if profile["sampler"] else None
+        if sampler is not None:
+            sampler.start()
+        try:
+            # 执行测试
+            if "search" in cfg:
+                result = asyncio.run(execute_search(cfg, vllm_url, api_key, use_long_context, model, workers, agents))
+                display_search_results(result)
+            else:
+                result = asyncio.run(execute_benchmark(cfg, vllm_url, api_key, use_long_context, model, workers, agents))
+        finally:
+            profile_file = sampler.stop() if sampler is not None else None
+        if profile_file:
+            result.setdefault("client_profile", {})["sampler_output"] = profile_file
+            console.print(f"Client profile saved to [bold green]{profile_file}[/bold green]")
         all_results.append(result)
         
         # 如果不是最后一个配置，等待一下系统冷却
@@ -205,17 +590,18 @@ def main(
             console.print(f"[yellow]等待系统冷却 5 秒...[/yellow]")
             time.sleep(5)
     
-    # 根据结果数量显示不同形式的输出
-    if len(all_results) == 1:
-        # 单个测试结果，使用详细表格
-        print_results(all_results[0])
-    else:
-        # 多个测试结果，使用比较表格
-        display_results_table(all_results)
-    
-    # 保存结果
+    # 先保存结果，显示出错时不丢失已完成的测试
     with open(output_file, 'w') as f:
         json.dump(all_results if len(all_results) > 1 else all_results[0], f, indent=2)
+
+    # 根据结果数量显示不同形式的输出（容量搜索的结果已单独显示）
+    benchmark_results = [r for r in all_results if "probes" not in r]
+    if len(benchmark_results) == 1:
+        # 单个测试结果，使用详细表格
+        print_results(benchmark_results[0])
+    elif benchmark_results:
+        # 多个测试结果，使用比较表格
+        display_results_table(benchmark_results)
     
     console.print(f"Benchmark results saved to [bold green]{output_file}[/bold green]")
 
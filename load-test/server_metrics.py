@@ -0,0 +1,192 @@
+import asyncio
+import logging
+import time
+import urllib.request
+from typing import List, Dict, Any, Optional, Union
+
+# vLLM Prometheus 指标名（不同版本命名不同，按顺序取第一个存在的）
+GAUGE_METRICS = {
+    "running": ["vllm:num_requests_running"],
+    "waiting": ["vllm:num_requests_waiting"],
+    "kv_cache_usage": ["vllm:kv_cache_usage_perc", "vllm:gpu_cache_usage_perc"],
+    "prefix_cache_hit_rate": ["vllm:gpu_prefix_cache_hit_rate"],
+}
+COUNTER_METRICS = {
+    "preemptions": ["vllm:num_preemptions_total", "vllm:num_preemptions"],
+    "prompt_tokens": ["vllm:prompt_tokens_total", "vllm:prompt_tokens"],
+    "generation_tokens": ["vllm:generation_tokens_total", "vllm:generation_tokens"],
+    "prefix_cache_queries": ["vllm:prefix_cache_queries_total", "vllm:gpu_prefix_cache_queries_total"],
+    "prefix_cache_hits": ["vllm:prefix_cache_hits_total", "vllm:gpu_prefix_cache_hits_total"],
+    # 每次调度迭代的 token 数直方图，sum / count 即平均批大小（token）
+    "iteration_tokens_sum": ["vllm:iteration_tokens_total_sum"],
+    "iteration_tokens_count": ["vllm:iteration_tokens_total_count"],
+}
+
+# 多端点汇总时取最大值的比例类指标，其余指标求和
+RATIO_METRICS = {"kv_cache_usage", "prefix_cache_hit_rate"}
+
+DEFAULT_SERVER_METRICS = {
+    "url": None,        # 指标地址，默认由 vllm_url 推导（去掉 /v1 后加 /metrics）
+    "interval": 1.0,    # 采样间隔（秒）
+    "timeout": 2.0,     # 单次抓取超时（秒）
+}
+
+
+def parse_prometheus_text(text: str) -> Dict[str, float]:
+    """解析 Prometheus 文本格式，同名指标的不同标签（如多个模型）求和"""
+    values: Dict[str, float] = {}
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        name_part, _, rest = line.partition(" ") if "{" not in line else line.partition("}")
+        name = name_part.split("{", 1)[0]
+        fields = rest.split()
+        if not fields:
+            continue
+        try:
+            values[name] = values.get(name, 0.0) + float(fields[0])
+        except ValueError:
+            continue
+    return values
+
+
+def metrics_url(vllm_url: str) -> str:
+    """由 OpenAI 接口地址推导 /metrics 地址"""
+    base = vllm_url.rstrip("/")
+    if base.endswith("/v1"):
+        base = base[:-3]
+    return base + "/metrics"
+
+
+def pick(values: Dict[str, float], names: List[str]) -> Optional[float]:
+    for name in names:
+        if name in values:
+            return values[name]
+    return None
+
+
+def fetch_metrics(url: str, timeout: float) -> Dict[str, float]:
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return parse_prometheus_text(response.read().decode("utf-8", errors="replace"))
+
+
+class MetricsScraper:
+    """在测试期间后台定时抓取服务端 /metrics，保存时间序列并汇总
+
+    抓取在线程池中执行，不占用发送请求的事件循环。url 为多个地址时（多副本）
+    每次同时抓取所有副本，请求数和计数器求和，KV 缓存占用等比例指标取最大值。
+    """
+
+    def __init__(self, url: Union[str, List[str]], interval: float = 1.0, timeout: float = 2.0):
+        self.url = url
+        self.urls = url if isinstance(url, list) else [url]
+        self.interval = interval
+        self.timeout = timeout
+        self.samples: List[Dict[str, Any]] = []
+        self.errors = 0
+        self.task: Optional[asyncio.Task] = None
+        self.start_time = 0.0
+
+    async def scrape_once(self) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            scraped = await asyncio.gather(*(loop.run_in_executor(None, fetch_metrics, url, self.timeout)
+                                             for url in self.urls))
+        except Exception as e:
+            self.errors += 1
+            if self.errors == 1:
+                logging.warning(f"Failed to scrape server metrics from {self.url}: {str(e)}")
+            return
+        sample = {"time": time.perf_counter() - self.start_time}
+        for key, names in {**GAUGE_METRICS, **COUNTER_METRICS}.items():
+            values = [v for v in (pick(values, names) for values in scraped) if v is not None]
+            sample[key] = (max(values) if key in RATIO_METRICS else sum(values)) if values else None
+        self.samples.append(sample)
+
+    async def run(self) -> None:
+        next_time = time.perf_counter()
+        while True:
+            await self.scrape_once()
+            next_time += self.interval
+            await asyncio.sleep(max(0, next_time - time.perf_counter()))
+
+    def start(self) -> None:
+        self.start_time = time.perf_counter()
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self) -> Dict[str, Any]:
+        """停止抓取，最后再采一次样以得到完整的计数器增量"""
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        await self.scrape_once()
+        return {
+            "url": self.url,
+            "interval": self.interval,
+            "scrape_errors": self.errors,
+            "summary": summarize_server_metrics(self.samples),
+            "samples": self.samples,
+        }
+
+
+def summarize_server_metrics(samples: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """汇总时间序列：队列与 KV 缓存取峰值，计数器取测试期间的增量"""
+    def series(key: str) -> List[float]:
+        return [s[key] for s in samples if s.get(key) is not None]
+
+    def peak(key: str) -> Optional[float]:
+        values = series(key)
+        return max(values) if values else None
+
+    def delta(key: str) -> Optional[float]:
+        values = series(key)
+        # 服务端重启时计数器会归零，此时只能取最后的值
+        return (values[-1] - values[0] if values[-1] >= values[0] else values[-1]) if values else None
+
+    summary = {
+        "samples": len(samples),
+        "peak_running": peak("running"),
+        "peak_waiting": peak("waiting"),
+        "max_kv_cache_usage": peak("kv_cache_usage"),
+        "preemptions": delta("preemptions"),
+        "prompt_tokens": delta("prompt_tokens"),
+        "generation_tokens": delta("generation_tokens"),
+        "prefix_cache_hit_rate": None,
+        "avg_batch_tokens": None,
+    }
+    queries, hits = delta("prefix_cache_queries"), delta("prefix_cache_hits")
+    if queries:
+        summary["prefix_cache_hit_rate"] = hits / queries
+    elif series("prefix_cache_hit_rate"):
+        summary["prefix_cache_hit_rate"] = series("prefix_cache_hit_rate")[-1]
+    iterations = delta("iteration_tokens_count")
+    if iterations:
+        summary["avg_batch_tokens"] = delta("iteration_tokens_sum") / iterations
+    return summary
+
+
+def validate_server_metrics_config(spec: Any) -> None:
+    """检查 server_metrics 配置，可以是 true 或 {"url": ..., "interval": ...}"""
+    if isinstance(spec, bool):
+        return
+    if not isinstance(spec, dict):
+        raise ValueError(f"'server_metrics' must be true or an object, got {spec!r}")
+    unknown = set(spec) - set(DEFAULT_SERVER_METRICS)
+    if unknown:
+        raise ValueError(f"Unknown server_metrics options: {', '.join(sorted(unknown))}")
+    if spec.get("interval", 1.0) <= 0:
+        raise ValueError("'server_metrics.interval' must be > 0")
+
+
+def create_scraper(spec: Any, vllm_url: Union[str, List[str]]) -> Optional[MetricsScraper]:
+    """根据配置创建抓取器，未启用时返回 None；多端点时默认抓取每个端点的 /metrics"""
+    if not spec:
+        return None
+    spec = {**DEFAULT_SERVER_METRICS, **(spec if isinstance(spec, dict) else {})}
+    if not spec["url"]:
+        spec["url"] = [metrics_url(url) for url in vllm_url] if isinstance(vllm_url, list) else metrics_url(vllm_url)
+    return MetricsScraper(spec["url"], spec["interval"], spec["timeout"])
@@ -0,0 +1,258 @@
+import math
+from typing import Dict, Any, Optional, Tuple, Iterable
+
+import numpy as np
+
+# 单个请求的 SLO 指标（秒）到请求记录字段的映射
+REQUEST_SLO_FIELDS = {
+    "ttft": "ttft",
+    "tpot": "tpot",
+    "e2e": "latency",
+}
+
+
+# 失败请求的类别：负载保护（429/503）、其他服务端错误、超出上下文长度、其他客户端错误、超时、连接错误
+ERROR_CATEGORIES = ["rate_limited", "overloaded", "server_error", "context_length", "client_error",
+                    "timeout", "connection", "other"]
+
+# 请求的各个阶段，按先后顺序：进入压测客户端、拿到连接、请求写完、收到响应头、收到第一个 SSE 字节、
+# 第一个内容 token、最后一个 token。记录的 phases 字段为各阶段相对 queued 的秒数，传输层观测不到的阶段缺省
+REQUEST_PHASES = ["queued", "acquired", "sent", "headers", "first_byte", "first_token", "last_token"]
+
+
+def evaluate_request_slo(record: Dict[str, Any], slo: Dict[str, float]) -> Dict[str, bool]:
+    """检查单个请求是否满足各项 SLO；只有一个输出 token 的请求没有 TPOT，视为满足"""
+    checks = {}
+    for key, threshold in slo.items():
+        value = record.get(REQUEST_SLO_FIELDS[key])
+        if value is None:
+            checks[key] = key == "tpot" and record.get("ttft") is not None
+        else:
+            checks[key] = value <= threshold
+    return checks
+
+
+class QuantileSketch:
+    """对数分桶的流式分位数草图（与 DDSketch 相同的思路）
+
+    桶数组大小固定，内存与样本数无关；分位数的相对误差不超过 relative_accuracy。
+    可以直接合并（多进程汇总时按桶相加）。
+    """
+
+    def __init__(self, relative_accuracy: float = 0.005, min_value: float = 1e-6, max_value: float = 1e6):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.offset = math.floor(math.log(min_value) / self.log_gamma)
+        size = math.ceil(math.log(max_value) / self.log_gamma) - self.offset + 1
+        self.counts = np.zeros(size, dtype=np.int64)
+        self.zero_count = 0     # 小于 min_value 的样本（包括 0）
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if value <= 0:
+            self.zero_count += 1
+            return
+        index = math.floor(math.log(value) / self.log_gamma) - self.offset
+        if index < 0:
+            self.zero_count += 1
+        else:
+            self.counts[min(index, len(self.counts) - 1)] += 1
+
+    def add_many(self, values: Iterable[float]) -> None:
+        values = np.asarray(values, dtype=np.float64)
+        if not values.size:
+            return
+        self.count += int(values.size)
+        self.sum += float(values.sum())
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        positive = values[values > 0]
+        index = np.floor(np.log(positive) / self.log_gamma).astype(np.int64) - self.offset
+        self.zero_count += int(values.size - positive.size + np.count_nonzero(index < 0))
+        index = np.minimum(index[index >= 0], len(self.counts) - 1)
+        self.counts += np.bincount(index, minlength=len(self.counts))
+
+    def merge(self, other: "QuantileSketch") -> None:
+        self.counts += other.counts
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """返回第 q 分位数（0-1），无样本时返回 None"""
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        if rank < self.zero_count:
+            return max(self.min, 0.0)
+        cumulative = np.cumsum(self.counts)
+        index = int(np.searchsorted(cumulative, rank - self.zero_count, side="right"))
+        value = 2 * self.gamma ** (index + self.offset + 1) / (self.gamma + 1)
+        # 桶的代表值可能略微越出真实范围
+        return float(min(max(value, self.min), self.max))
+
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0
+
+    def stats(self, percentiles: Tuple[int, ...] = (50, 90, 95, 99), reverse: bool = False) -> Dict[str, Optional[float]]:
+        """与 distribution_stats 相同格式的统计；reverse 时 pNN 取 100-NN 分位（用于越大越好的指标）"""
+        stats = {"average": self.mean()}
+        for p in percentiles:
+            stats[f"p{p}"] = self.quantile((100 - p if reverse else p) / 100)
+        stats["max"] = float(self.max) if self.count else None
+        return stats
+
+
+class ResultAccumulator:
+    """逐条累计请求记录的统计量，内存占用固定，不保留记录本身
+
+    失败的请求（status 不为 ok）只按错误类型和类别（category）计数。配置 slo 时同时统计 goodput，
+    并在记录上标记 slo / slo_met，使写出的原始记录带有达标信息。
+    客户端中途离开的请求（status 为 aborted）既不算成功也不算失败，单独统计。
+    """
+
+    def __init__(self, slo: Optional[Dict[str, float]] = None):
+        self.slo = slo
+        self.sketches = {key: QuantileSketch() for key in
+                         ("latency", "tokens_per_second", "ttft", "tpot", "inter_token_latency", "schedule_lag",
+                          "pool_wait", "connect_time", "abort_latency", "ttft_after_abort")}
+        # 每个阶段距上一个已观测阶段的时间
+        self.sketches.update({f"phase_{name}": QuantileSketch() for name in REQUEST_PHASES[1:]})
+        self.successful_requests = 0
+        self.failed_requests = 0
+        self.aborted_requests = 0
+        self.aborted_tokens = 0
+        self.errors: Dict[str, int] = {}
+        self.error_categories: Dict[str, int] = {}
+        self.output_tokens = 0
+        self.input_tokens = 0
+        self.slo_met_requests = 0
+        self.slo_met_tokens = 0
+        self.slo_met_by_metric = {key: 0 for key in (slo or {})}
+
+    def add(self, record: Dict[str, Any]) -> None:
+        if record.get("status") == "aborted":
+            self.aborted_requests += 1
+            self.aborted_tokens += record.get("output_tokens") or 0
+            self.sketches["abort_latency"].add(record["latency"])
+            return
+        if record.get("status", "ok") != "ok":
+            self.failed_requests += 1
+            error = record.get("error") or record["status"]
+            self.errors[error] = self.errors.get(error, 0) + 1
+            category = record.get("category", "other")
+            self.error_categories[category] = self.error_categories.get(category, 0) + 1
+            return
+
+        self.successful_requests += 1
+        self.output_tokens += record["output_tokens"] or 0
+        self.input_tokens += record.get("prompt_tokens") or 0
+        for key in ("latency", "tokens_per_second", "ttft", "tpot", "schedule_lag", "pool_wait", "connect_time"):
+            if record.get(key) is not None:
+                self.sketches[key].add(record[key])
+        self.sketches["inter_token_latency"].add_many(record.get("inter_token_latencies", ()))
+        if record.get("after_abort") and record.get("ttft") is not None:
+            self.sketches["ttft_after_abort"].add(record["ttft"])
+        if "phases" in record:
+            phases = record["phases"]
+            previous = 0.0
+            for name in REQUEST_PHASES[1:]:
+                if phases.get(name) is not None:
+                    self.sketches[f"phase_{name}"].add(phases[name] - previous)
+                    previous = phases[name]
+
+        if self.slo:
+            checks = evaluate_request_slo(record, self.slo)
+            record["slo"] = checks
+            record["slo_met"] = all(checks.values())
+            for key, passed in checks.items():
+                self.slo_met_by_metric[key] += passed
+            if record["slo_met"]:
+                self.slo_met_requests += 1
+                self.slo_met_tokens += record["output_tokens"] or 0
+
+    def merge(self, other: "ResultAccumulator") -> None:
+        for key, sketch in self.sketches.items():
+            sketch.merge(other.sketches[key])
+        self.successful_requests += other.successful_requests
+        self.failed_requests += other.failed_requests
+        self.aborted_requests += other.aborted_requests
+        self.aborted_tokens += other.aborted_tokens
+        for error, count in other.errors.items():
+            self.errors[error] = self.errors.get(error, 0) + count
+        for category, count in other.error_categories.items():
+            self.error_categories[category] = self.error_categories.get(category, 0) + count
+        self.output_tokens += other.output_tokens
+        self.input_tokens += other.input_tokens
+        self.slo_met_requests += other.slo_met_requests
+        self.slo_met_tokens += other.slo_met_tokens
+        for key, count in other.slo_met_by_metric.items():
+            self.slo_met_by_metric[key] = self.slo_met_by_metric.get(key, 0) + count
+
+    def summary(self, total_elapsed_time: float, total_requests: Optional[int] = None) -> Dict[str, Any]:
+        """生成汇总指标"""
+        def rate(value: float) -> float:
+            return value / total_elapsed_time if total_elapsed_time > 0 else 0
+
+        sketches = self.sketches
+        summary = {
+            "successful_requests": self.successful_requests,
+            "requests_per_second": rate(self.successful_requests),
+            "total_output_tokens": self.output_tokens,
+            "total_input_tokens": self.input_tokens,
+            "input_tokens_per_second": rate(self.input_tokens),
+            "output_tokens_per_second": rate(self.output_tokens),
+            "latency": sketches["latency"].stats((50, 95, 99)),
+            "tokens_per_second": sketches["tokens_per_second"].stats((50, 95, 99), reverse=True),
+            "time_to_first_token": sketches["ttft"].stats((50, 95, 99)),
+            "time_per_output_token": sketches["tpot"].stats(),
+            "inter_token_latency": sketches["inter_token_latency"].stats(),
+        }
+        for key in ("latency", "tokens_per_second", "time_to_first_token"):
+            summary[key].pop("max")
+        if self.errors:
+            summary["errors"] = dict(self.errors)
+            summary["error_categories"] = {c: self.error_categories[c] for c in ERROR_CATEGORIES if c in self.error_categories}
+        if self.aborted_requests:
+            summary["aborted"] = {
+                "requests": self.aborted_requests,
+                "output_tokens": self.aborted_tokens,
+                "abort_latency": sketches["abort_latency"].stats((50, 95, 99)),
+                "ttft_after_abort": sketches["ttft_after_abort"].stats((50, 95, 99)) if sketches["ttft_after_abort"].count else None,
+            }
+
+        # 开环调度模式下统计实际发送时间相对计划时间的滞后
+        if sketches["schedule_lag"].count:
+            summary["schedule_lag"] = sketches["schedule_lag"].stats()
+        # 精简传输层单独报告客户端等待连接池和建立连接的时间，不计入 TTFT 和延迟
+        for key in ("pool_wait", "connect_time"):
+            if sketches[key].count:
+                summary[key] = sketches[key].stats()
+        breakdown = {name: sketches[f"phase_{name}"].stats((50, 90, 99)) for name in REQUEST_PHASES[1:]
+                     if sketches[f"phase_{name}"].count}
+        if breakdown:
+            summary["phase_breakdown"] = breakdown
+
+        if self.slo:
+            # 失败的请求同样算作未达标，客户端中途离开的请求不计入
+            denominator = (total_requests - self.aborted_requests if total_requests
+                           else self.successful_requests + self.failed_requests)
+            summary["goodput"] = {
+                "slo": self.slo,
+                "requests_met": self.slo_met_requests,
+                "requests_per_second": rate(self.slo_met_requests),
+                "output_tokens_per_second": rate(self.slo_met_tokens),
+                "attainment": self.slo_met_requests / denominator if denominator else 0,
+                "attainment_by_metric": {key: count / denominator if denominator else 0
+                                         for key, count in self.slo_met_by_metric.items()},
+            }
+        return summary
@@ -0,0 +1,264 @@
+import asyncio
+import math
+import time
+from typing import Dict, Any, Optional, Tuple
+
+import numpy as np
+from profiling import start_lag_window, end_lag_window
+from records import RecordSink
+from transport import open_client
+from vllm_benchmark import make_request, create_progress
+from workloads import build_workload
+from aborts import build_abort_plan
+
+DEFAULT_STEADY = {
+    "warmup": 10,               # 开始后不计入统计的预热时间（秒）
+    "cooldown": 5,              # 结束前不计入统计的时间（秒）
+    "steady_tolerance": 0.1,    # 测量窗口内吞吐和 TTFT 的线性趋势超过这一相对变化即判定未达到稳态
+}
+
+
+def validate_steady_config(config: Dict[str, Any]) -> None:
+    """检查按时长运行的闭环配置，错误时抛出 ValueError"""
+    if "concurrency" not in config:
+        raise ValueError(f"Duration-based closed-loop mode requires 'concurrency': {config}")
+    if "num_requests" in config:
+        raise ValueError(f"Use either 'num_requests' or 'duration' for concurrent mode, not both: {config}")
+    steady = {**DEFAULT_STEADY, **config}
+    if steady["warmup"] < 0 or steady["cooldown"] < 0:
+        raise ValueError("'warmup' and 'cooldown' must be >= 0")
+    if steady["warmup"] + steady["cooldown"] >= config["duration"]:
+        raise ValueError(f"'warmup' + 'cooldown' must be shorter than 'duration': {config}")
+
+
+class TimeSeries:
+    """按秒分桶的时间序列，数组大小由测试时长决定，与请求数无关"""
+
+    def __init__(self, seconds: float, bucket: float = 1.0):
+        self.bucket = bucket
+        size = int(math.ceil(seconds / bucket)) + 1
+        self.in_flight = np.zeros(size, dtype=np.int64)
+        self.sends = np.zeros(size, dtype=np.int64)
+        self.completions = np.zeros(size, dtype=np.int64)
+        self.errors = np.zeros(size, dtype=np.int64)
+        self.aborts = np.zeros(size, dtype=np.int64)
+        self.output_tokens = np.zeros(size, dtype=np.int64)
+        self.input_tokens = np.zeros(size, dtype=np.int64)
+        self.ttft_sum = np.zeros(size)
+        self.ttft_count = np.zeros(size, dtype=np.int64)
+
+    def index(self, offset: float) -> int:
+        return min(max(int(offset / self.bucket), 0), len(self.completions) - 1)
+
+    def add(self, record: Dict[str, Any], send_offset: float, end_offset: float) -> None:
+        """完成数和 token 数计入结束时刻所在的桶，TTFT 计入发送时刻所在的桶"""
+        self.sends[self.index(send_offset)] += 1
+        end = self.index(end_offset)
+        if record["status"] == "aborted":
+            self.aborts[end] += 1
+            return
+        if record["status"] != "ok":
+            self.errors[end] += 1
+            return
+        self.completions[end] += 1
+        self.output_tokens[end] += record["output_tokens"] or 0
+        self.input_tokens[end] += record.get("prompt_tokens") or 0
+        if record["ttft"] is not None:
+            start = self.index(send_offset)
+            self.ttft_sum[start] += record["ttft"]
+            self.ttft_count[start] += 1
+
+    def sample_in_flight(self, offset: float, count: int) -> None:
+        i = self.index(offset)
+        self.in_flight[i] = max(self.in_flight[i], count)
+
+    def ttft_mean(self) -> np.ndarray:
+        return np.divide(self.ttft_sum, self.ttft_count, out=np.full(len(self.ttft_sum), np.nan), where=self.ttft_count > 0)
+
+    def window(self, start: float, end: float) -> slice:
+        """完整落在 [start, end) 内的桶"""
+        return slice(int(math.ceil(start / self.bucket)), int(end / self.bucket))
+
+    def to_dict(self, length: Optional[int] = None) -> Dict[str, Any]:
+        n = length or len(self.completions)
+        ttft = self.ttft_mean()[:n]
+        return {
+            "bucket_seconds": self.bucket,
+            "time": (np.arange(n) * self.bucket).tolist(),
+            "in_flight": self.in_flight[:n].tolist(),
+            "sends": self.sends[:n].tolist(),
+            "completions": self.completions[:n].tolist(),
+            "errors": self.errors[:n].tolist(),
+            "aborts": self.aborts[:n].tolist(),
+            "output_tokens_per_second": (self.output_tokens[:n] / self.bucket).tolist(),
+            "ttft_mean": [None if np.isnan(v) else float(v) for v in ttft],
+        }
+
+
+def relative_trend(values: np.ndarray) -> Optional[float]:
+    """线性拟合的斜率乘以窗口长度再除以均值，即窗口内从头到尾的相对变化"""
+    values = values[~np.isnan(values)]
+    if len(values) < 3 or np.mean(values) == 0:
+        return None
+    slope = np.polyfit(np.arange(len(values)), values, 1)[0]
+    return float(slope * (len(values) - 1) / np.mean(values))
+
+
+def detect_steady_state(series: TimeSeries, window: slice, tolerance: float) -> Dict[str, Any]:
+    """判断测量窗口是否处于稳态：吞吐和 TTFT 都没有明显的上升或下降趋势
+
+    TTFT 持续上升通常说明服务端排队在累积，吞吐持续变化说明仍在爬升或已经开始衰退。
+    """
+    throughput = series.output_tokens[window].astype(float)
+    ttft = series.ttft_mean()[window]
+    throughput_trend = relative_trend(throughput)
+    ttft_trend = relative_trend(ttft)
+    mean = throughput.mean() if len(throughput) else 0
+    result = {
+        "steady": False,
+        "tolerance": tolerance,
+        "throughput_trend": throughput_trend,
+        "ttft_trend": ttft_trend,
+        "throughput_cv": float(throughput.std() / mean) if mean > 0 else None,
+    }
+    if throughput_trend is None:
+        result["reason"] = "measurement window too short or no completions"
+    elif abs(throughput_trend) > tolerance:
+        result["reason"] = f"throughput changed by {throughput_trend:+.0%} across the window"
+    elif ttft_trend is not None and abs(ttft_trend) > tolerance:
+        result["reason"] = f"TTFT changed by {ttft_trend:+.0%} across the window"
+    else:
+        result["steady"] = True
+    return result
+
+
+async def collect_steady_results(
+    concurrency: int,
+    duration: float,
+    warmup: float,
+    cooldown: float,
+    request_timeout: int,
+    output_tokens: int,
+    vllm_url: str,
+    api_key: str,
+    use_long_context: bool,
+    model: str,
+    progress=None,
+    progress_task=None,
+    workload: Optional[Dict[str, Any]] = None,
+    sink: Optional[RecordSink] = None,
+    transport: Optional[Dict[str, Any]] = None,
+    abort: Optional[Dict[str, Any]] = None
+) -> Tuple[RecordSink, TimeSeries, float]:
+    """在 duration 秒内始终保持 concurrency 个请求在途（每个请求完成后立即发送下一个）
+
+    只有发送于预热之后、完成于冷却之前的请求计入 sink 的统计量，所有请求都会写入记录文件。
+    返回 sink、时间序列以及实际运行时长。
+    """
+    client = await open_client(vllm_url, api_key, transport, concurrency)
+    request_source = build_workload(workload, output_tokens, (workload or {}).get("seed"))
+    abort_plan = build_abort_plan(abort)
+    sink = sink if sink is not None else RecordSink()
+    series = TimeSeries(duration + request_timeout)
+    window_end = duration - cooldown
+    in_flight = 0
+    start_mono = time.perf_counter()
+    end_mono = start_mono + duration
+
+    async def loop_worker() -> None:
+        nonlocal in_flight
+        after_abort = False
+        while time.perf_counter() < end_mono:
+            send_offset = time.perf_counter() - start_mono
+            in_flight += 1
+            record = await make_request(client, model, output_tokens, request_timeout, use_long_context, request_source,
+                                        abort_after=abort_plan.sample() if abort_plan else None)
+            in_flight -= 1
+            end_offset = time.perf_counter() - start_mono
+            if after_abort:
+                record["after_abort"] = True
+            after_abort = record["status"] == "aborted"
+            record["send_offset"] = send_offset
+            record["in_window"] = send_offset >= warmup and end_offset <= window_end
+            series.add(record, send_offset, end_offset)
+            sink.add(record, measured=record["in_window"])
+
+    async def sampler() -> None:
+        # 每秒采样在途请求数并更新进度
+        second = 0
+        while True:
+            await asyncio.sleep(max(0, start_mono + second + 0.5 - time.perf_counter()))
+            series.sample_in_flight(second + 0.5, in_flight)
+            if progress and progress_task is not None:
+                progress.update(progress_task, completed=min(second + 1, duration))
+            second += 1
+
+    sampler_task = asyncio.create_task(sampler())
+    start_lag_window()
+    try:
+        await asyncio.gather(*(loop_worker() for _ in range(concurrency)))
+    finally:
+        end_lag_window()
+        sampler_task.cancel()
+        await client.close()
+        sink.close()
+    return sink, series, time.perf_counter() - start_mono
+
+
+async def run_steady_benchmark(
+    concurrency: int,
+    duration: float,
+    request_timeout: int,
+    output_tokens: int,
+    vllm_url: str,
+    api_key: str,
+    use_long_context: bool,
+    model: str,
+    warmup: float = DEFAULT_STEADY["warmup"],
+    cooldown: float = DEFAULT_STEADY["cooldown"],
+    steady_tolerance: float = DEFAULT_STEADY["steady_tolerance"],
+    slo: Optional[Dict[str, float]] = None,
+    workload: Optional[Dict[str, Any]] = None,
+    record_file: Optional[str] = None,
+    transport: Optional[Dict[str, Any]] = None,
+    abort: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """运行按时长的闭环稳态测试，吞吐按测量窗口内完成的请求计算"""
+    with create_progress() as progress:
+        task = progress.add_task(f"[cyan]Running {concurrency} closed-loop streams for {duration:.0f}s", total=duration)
+        sink, series, total_time = await collect_steady_results(
+            concurrency, duration, warmup, cooldown, request_timeout, output_tokens,
+            vllm_url, api_key, use_long_context, model, progress, task,
+            workload=workload, sink=RecordSink(record_file, slo), transport=transport, abort=abort
+        )
+
+    window_seconds = duration - warmup - cooldown
+    window = series.window(warmup, duration - cooldown)
+    stats = sink.stats
+    summary = {
+        "total_requests": stats.successful_requests + stats.failed_requests + stats.aborted_requests,
+        "concurrency": concurrency,
+        "duration": duration,
+        "warmup": warmup,
+        "cooldown": cooldown,
+        "measurement_window": window_seconds,
+        "requests_sent": sink.count,
+        "request_timeout": request_timeout,
+        "max_output_tokens": output_tokens,
+        "use_long_context": use_long_context,
+        "workload": (workload or {}).get("type", "builtin"),
+        "model": model,
+        "total_time": total_time,
+    }
+    if record_file:
+        summary["record_file"] = record_file
+    summary.update(sink.summary(window_seconds, summary["total_requests"]))
+
+    # 吞吐按窗口内完整的秒桶计算，包括发送于预热期间但在窗口内完成的请求
+    buckets = max(1, window.stop - window.start) * series.bucket
+    summary["requests_per_second"] = float(series.completions[window].sum() / buckets)
+    summary["output_tokens_per_second"] = float(series.output_tokens[window].sum() / buckets)
+    summary["input_tokens_per_second"] = float(series.input_tokens[window].sum() / buckets)
+    summary["steady_state"] = detect_steady_state(series, window, steady_tolerance)
+    summary["timeseries"] = series.to_dict(int(math.ceil(total_time / series.bucket)))
+    return summary
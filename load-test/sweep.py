@@ -0,0 +1,329 @@
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import re
+import shlex
+import signal
+import subprocess
+import time
+import urllib.request
+from typing import List, Dict, Any, Optional, Tuple
+
+import click
+from rich.console import Console
+from rich.table import Table
+from run_benchmarks import execute_benchmark, parse_config_option, validate_benchmark_config
+
+SEARCH_MODES = ["grid", "random"]
+
+# 排名指标到结果字段的映射
+RANK_METRICS = {
+    "throughput": ("output_tokens_per_second",),
+    "requests": ("requests_per_second",),
+    "goodput": ("goodput", "requests_per_second"),
+    "goodput_tokens": ("goodput", "output_tokens_per_second"),
+}
+
+DEFAULT_SWEEP = {
+    "port": 8000,
+    "host": "127.0.0.1",
+    "health_path": "/health",
+    "search": "grid",
+    "num_samples": 10,          # random 搜索的采样点数
+    "seed": 0,
+    "startup_timeout": 900,     # 等待服务健康的最长时间（秒），包括加载模型
+    "teardown_timeout": 60,     # 发送 SIGTERM 后等待退出的时间，超时后 SIGKILL
+    "cooldown": 5,              # 同一服务上两个测试之间的间隔
+    "rank_by": "throughput",
+    "log_dir": "sweep_logs",
+}
+
+
+def validate_sweep_spec(spec: Dict[str, Any]) -> None:
+    """检查 sweep 配置，错误时抛出 ValueError"""
+    unknown = set(spec) - set(DEFAULT_SWEEP) - {"command", "params", "benchmarks"}
+    if unknown:
+        raise ValueError(f"Unknown sweep options: {', '.join(sorted(unknown))}")
+    if not spec.get("command"):
+        raise ValueError("Sweep spec requires a server 'command', e.g. \"vllm serve MODEL --port {port}\"")
+    params = spec.get("params")
+    if not isinstance(params, dict) or not params:
+        raise ValueError("Sweep spec requires 'params': {\"--flag\": [value, ...], ...}")
+    for flag, values in params.items():
+        if not isinstance(values, list) or not values:
+            raise ValueError(f"Values of '{flag}' must be a non-empty list")
+    if not spec.get("benchmarks"):
+        raise ValueError("Sweep spec requires 'benchmarks': a run_benchmarks configuration or a list of them")
+    sweep = {**DEFAULT_SWEEP, **spec}
+    if sweep["search"] not in SEARCH_MODES:
+        raise ValueError(f"Invalid search '{sweep['search']}'. Must be one of: {', '.join(SEARCH_MODES)}")
+    if sweep["rank_by"] not in RANK_METRICS:
+        raise ValueError(f"Invalid rank_by '{sweep['rank_by']}'. Must be one of: {', '.join(RANK_METRICS)}")
+    if sweep["rank_by"].startswith("goodput") and not all("slo" in b for b in benchmark_configs(spec)):
+        raise ValueError(f"rank_by '{sweep['rank_by']}' requires a per-request 'slo' in every benchmark configuration")
+    for config in benchmark_configs(spec):
+        # 每个参数组都要启动一次服务，配置错误必须在启动之前发现
+        if "search" in config:
+            raise ValueError(f"Capacity search is not supported in sweep benchmarks: {config}")
+        try:
+            validate_benchmark_config(config)
+        except click.BadParameter as e:
+            raise ValueError(e.message)
+
+
+def benchmark_configs(spec: Dict[str, Any]) -> List[Dict[str, Any]]:
+    benchmarks = spec["benchmarks"]
+    return benchmarks if isinstance(benchmarks, list) else [benchmarks]
+
+
+def sweep_points(sweep: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """展开搜索空间：grid 为全部组合；random 从组合中不重复地抽取 num_samples 个（种子固定，恢复时顺序不变）"""
+    flags = list(sweep["params"])
+    points = [dict(zip(flags, values)) for values in itertools.product(*(sweep["params"][f] for f in flags))]
+    if sweep["search"] == "random" and sweep["num_samples"] < len(points):
+        points = random.Random(sweep["seed"]).sample(points, sweep["num_samples"])
+    return points
+
+
+def point_key(sweep: Dict[str, Any], point: Dict[str, Any], model: str) -> str:
+    """状态文件中参数组的键：服务命令、测试套件和模型不同的结果不能复用"""
+    return json.dumps({"command": sweep["command"], "benchmarks": sweep["benchmarks"], "model": model, "params": point},
+                      sort_keys=True)
+
+
+def point_record_file(record_file: Optional[str], index: int) -> Optional[str]:
+    """每个参数组写自己的记录文件：records.jsonl -> records.point3.jsonl"""
+    if not record_file:
+        return None
+    root, ext = os.path.splitext(record_file)
+    return f"{root}.point{index}{ext or '.jsonl'}"
+
+
+def placeholder(flag: str) -> str:
+    """--max-num-seqs 在命令模板中写作 {max_num_seqs}"""
+    return flag.lstrip("-").replace("-", "_")
+
+
+def build_command(template: str, point: Dict[str, Any], port: int) -> List[str]:
+    """生成启动命令：模板中出现的 {占位符} 直接替换，其余参数作为命令行选项追加
+
+    只替换已知的占位符，模板中的其他花括号（如 JSON 参数）保持不变。
+    布尔值 true 只追加选项名（如 --enable-chunked-prefill），false 则不追加。
+    """
+    values = {"port": port, **{placeholder(flag): value for flag, value in point.items()}}
+    args = shlex.split(re.sub(r"\{(\w+)\}", lambda m: str(values.get(m.group(1), m.group(0))), template))
+    for flag, value in point.items():
+        if "{" + placeholder(flag) + "}" in template or value is False or value is None:
+            continue
+        args.append(flag)
+        if value is not True:
+            args.append(str(value))
+    return args
+
+
+def wait_for_health(url: str, process: subprocess.Popen, timeout: float) -> None:
+    """轮询健康检查地址直到返回 200；进程提前退出或超时抛出 RuntimeError"""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode} before becoming healthy")
+        try:
+            with urllib.request.urlopen(url, timeout=2) as response:
+                if response.status == 200:
+                    return
+        except Exception:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"Server not healthy after {timeout}s")
+
+
+def stop_server(process: subprocess.Popen, timeout: float) -> None:
+    """向整个进程组发送 SIGTERM（vLLM 会派生多个 worker 进程），超时后 SIGKILL"""
+    if process.poll() is not None:
+        return
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout)
+    except subprocess.TimeoutExpired:
+        logging.warning(f"Server did not exit within {timeout}s, killing it")
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+    except ProcessLookupError:
+        pass
+
+
+def metric(result: Dict[str, Any], path: Tuple[str, ...]) -> Optional[float]:
+    value: Any = result
+    for key in path:
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value
+
+
+def run_point(
+    sweep: Dict[str, Any],
+    index: int,
+    point: Dict[str, Any],
+    api_key: str,
+    model: str,
+    use_long_context: bool
+) -> Dict[str, Any]:
+    """启动一组参数对应的服务，等待就绪后依次运行测试套件，最后关闭服务"""
+    console = Console()
+    port, host = sweep["port"], sweep["host"]
+    command = build_command(sweep["command"], point, port)
+    os.makedirs(sweep["log_dir"], exist_ok=True)
+    log_file = os.path.join(sweep["log_dir"], f"point{index}.log")
+    entry = {"index": index, "params": point, "command": shlex.join(command), "log_file": log_file,
+             "status": "ok", "startup_time": None, "results": []}
+
+    console.print(f"[green]启动服务 {index}: {entry['command']}[/green]")
+    start = time.perf_counter()
+    with open(log_file, "w") as log:
+        # 新会话使服务及其子进程成为一个进程组，便于一并关闭
+        process = subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
+    try:
+        wait_for_health(f"http://{host}:{port}{sweep['health_path']}", process, sweep["startup_timeout"])
+        entry["startup_time"] = time.perf_counter() - start
+        console.print(f"[green]服务就绪，启动耗时 {entry['startup_time']:.1f} 秒[/green]")
+        vllm_url = f"http://{host}:{port}/v1"
+        for i, config in enumerate(benchmark_configs(sweep)):
+            if process.poll() is not None:
+                raise RuntimeError(f"Server exited with code {process.returncode} during the benchmark")
+            if config.get("record_file"):
+                config = {**config, "record_file": point_record_file(config["record_file"], index)}
+            entry["results"].append(asyncio.run(execute_benchmark(config, vllm_url, api_key, use_long_context, model)))
+            if i < len(benchmark_configs(sweep)) - 1:
+                time.sleep(sweep["cooldown"])
+    except Exception as e:
+        # 一个参数组失败（服务起不来、测试出错）只记录下来，继续下一组
+        entry["status"] = "failed"
+        entry["error"] = f"{type(e).__name__}: {e}" if not isinstance(e, RuntimeError) else str(e)
+        console.print(f"[red]参数组 {index} 失败: {e}（日志见 {log_file}）[/red]")
+    finally:
+        stop_server(process, sweep["teardown_timeout"])
+    entry["score"] = score(entry, sweep["rank_by"])
+    return entry
+
+
+def score(entry: Dict[str, Any], rank_by: str) -> Optional[float]:
+    """排名分数：测试套件中各测试的排名指标平均值"""
+    values = [metric(r, RANK_METRICS[rank_by]) for r in entry["results"]]
+    if entry["status"] != "ok" or not values or None in values:
+        return None
+    return sum(values) / len(values)
+
+
+def load_state(state_file: str) -> Dict[str, Dict[str, Any]]:
+    """读取已成功完成的参数组（每行一个），用于中断后继续；失败的参数组重新运行"""
+    if not os.path.exists(state_file):
+        return {}
+    with open(state_file, "r", encoding="utf-8") as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    return {e["key"]: e for e in entries if e.get("status") == "ok" and "key" in e}
+
+
+def rank_entries(entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """按分数从高到低排列，失败的参数组排在最后"""
+    return sorted(entries, key=lambda e: (e["score"] is None, -(e["score"] or 0)))
+
+
+def display_sweep_results(entries: List[Dict[str, Any]], rank_by: str) -> None:
+    """以表格显示排名"""
+    table = Table(title=f"Server Config Sweep (ranked by {rank_by})")
+    table.add_column("Rank", style="cyan")
+    table.add_column("Params", style="white", overflow="fold")
+    table.add_column("Startup (s)", style="yellow")
+    table.add_column("Req/s", style="yellow")
+    table.add_column("Out tok/s", style="red")
+    table.add_column("Goodput req/s", style="green")
+    table.add_column("TTFT P99 (s)", style="blue")
+    table.add_column("Score", style="bold green")
+
+    def mean(path: Tuple[str, ...]) -> Optional[float]:
+        values = [metric(r, path) for r in entry["results"]]
+        values = [v for v in values if v is not None]
+        return sum(values) / len(values) if values else None
+
+    def fmt(value: Optional[float], spec: str) -> str:
+        return format(value, spec) if value is not None else "-"
+
+    for rank, entry in enumerate(entries, 1):
+        params = " ".join(f"{flag} {value}" for flag, value in entry["params"].items())
+        if entry["status"] != "ok":
+            table.add_row("-", params, fmt(entry["startup_time"], ".1f"), "-", "-", "-", "-", f"[red]{entry['status']}[/red]")
+            continue
+        ttft = [metric(r, ("time_to_first_token", "p99")) for r in entry["results"]]
+        ttft = [v for v in ttft if v is not None]
+        table.add_row(
+            str(rank), params, fmt(entry["startup_time"], ".1f"),
+            fmt(mean(("requests_per_second",)), ".2f"), fmt(mean(("output_tokens_per_second",)), ".1f"),
+            fmt(mean(("goodput", "requests_per_second")), ".2f"), fmt(max(ttft) if ttft else None, ".3f"),
+            fmt(entry["score"], ".2f"),
+        )
+    Console().print(table)
+
+
+@click.command()
+@click.option("--spec", "spec", callback=parse_config_option, required=True, help="Sweep spec as JSON string or path to JSON file")
+@click.option("--model", type=str, required=True, help="Model name to use for benchmarking")
+@click.option("--api_key", type=str, default="EMPTY", help="API key of the launched server")
+@click.option("--use_long_context", is_flag=True, help="Use long context prompt pairs instead of short prompts")
+@click.option("--state_file", type=str, default="sweep_state.jsonl", help="Finished points are appended here; rerun to resume (failed points are retried)")
+@click.option("--output_file", type=str, default="sweep_results.json", help="Output file for the ranked results")
+@click.option("--quiet", is_flag=True, help="Reduce output verbosity")
+def main(spec: Dict[str, Any], model: str, api_key: str, use_long_context: bool, state_file: str, output_file: str,
+         quiet: bool) -> None:
+    """Sweep vLLM server flags: launch the server for each point, benchmark it, tear it down.
+
+    Spec keys:
+    - command: Server launch command; {port} and {flag_name} placeholders are filled, other params are appended as flags
+    - params: Search space, e.g. {"--max-num-seqs": [8, 16, 32], "--max-num-batched-tokens": [8192, 65536]}
+    - benchmarks: run_benchmarks configuration (or list of them) run against every point
+    - search: grid (default) or random, with num_samples and seed
+    - port / host / health_path / startup_timeout / teardown_timeout / cooldown / log_dir: (Optional)
+    - rank_by: throughput (default), requests, goodput or goodput_tokens
+
+    Interrupted sweeps resume from --state_file, skipping points that already succeeded with the same
+    command, benchmarks and model. Failed points are run again.
+    """
+    try:
+        validate_sweep_spec(spec)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    logging.getLogger().setLevel(logging.WARNING if quiet else logging.INFO)
+    logging.getLogger("openai").setLevel(logging.WARNING)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    sweep = {**DEFAULT_SWEEP, **spec}
+    console = Console()
+    points = sweep_points(sweep)
+    done = load_state(state_file)
+    keys = [point_key(sweep, point, model) for point in points]
+    console.print(f"[bold]Sweeping {len(points)} server configurations ({len([k for k in keys if k not in done])} remaining)[/bold]")
+
+    entries = []
+    for index, (point, key) in enumerate(zip(points, keys)):
+        if key in done:
+            console.print(f"[yellow]跳过已完成的参数组 {index}: {point}[/yellow]")
+            entries.append(done[key])
+            continue
+        entry = {**run_point(sweep, index, point, api_key, model, use_long_context), "key": key}
+        # 每完成一组立即追加到状态文件，中断后重新运行即可继续
+        with open(state_file, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+        entries.append(entry)
+
+    ranked = rank_entries(entries)
+    display_sweep_results(ranked, sweep["rank_by"])
+    with open(output_file, "w") as f:
+        json.dump({"rank_by": sweep["rank_by"], "points": ranked}, f, indent=2)
+    console.print(f"Sweep results saved to [bold green]{output_file}[/bold green]")
+
+
+if __name__ == "__main__":
+    main()
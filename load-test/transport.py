@@ -0,0 +1,456 @@
+import asyncio
+import json
+import logging
+import re
+import ssl
+import time
+from collections import deque
+from types import SimpleNamespace
+from typing import List, Dict, Any, Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+from openai import AsyncOpenAI
+from routing import EndpointRouter, routing_config
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+TRANSPORTS = ["openai", "lean"]
+
+# 精简传输层连接失败时可能抛出的异常（HTTP/2 客户端抛出 httpx 的异常）
+CONNECTION_ERRORS = (ConnectionError, OSError, asyncio.IncompleteReadError) + (
+    (httpx.TransportError,) if httpx is not None else ())
+
+# 开环模式无法由并发数确定连接池大小时使用的默认值
+DEFAULT_POOL_SIZE = 1024
+# prewarm 为 true 时最多预先建立的连接数
+DEFAULT_PREWARM = 256
+
+# 只用正则判断是否为内容块，只有携带 usage 的块才完整解析 JSON
+CONTENT_RE = {
+    "content": re.compile(rb'"content":\s*"[^"]'),
+    "text": re.compile(rb'"text":\s*"[^"]'),
+}
+USAGE_RE = re.compile(rb'"usage":\s*\{')
+
+
+class HTTPStatusError(Exception):
+    """服务端返回非 200 状态码"""
+
+    def __init__(self, status_code: int, body: bytes):
+        self.status_code = status_code
+        self.body = body
+        super().__init__(f"HTTP {status_code}: {body[:200].decode('utf-8', errors='replace')}")
+
+
+def validate_transport_config(config: Dict[str, Any]) -> None:
+    """检查传输层配置，错误时抛出 ValueError"""
+    kind = config.get("transport", "openai")
+    if kind not in TRANSPORTS:
+        raise ValueError(f"Invalid transport '{kind}'. Must be one of: {', '.join(TRANSPORTS)}")
+    if config.get("http2"):
+        if kind != "lean":
+            raise ValueError("'http2' requires \"transport\": \"lean\"")
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            raise ValueError("'http2' requires the 'httpx' and 'h2' packages (pip install 'httpx[http2]')")
+        if httpx is None:
+            raise ValueError("'http2' requires the 'httpx' and 'h2' packages (pip install 'httpx[http2]')")
+    if config.get("pool_size") is not None and config["pool_size"] < 1:
+        raise ValueError("'pool_size' must be >= 1")
+
+
+def transport_options(config: Dict[str, Any]) -> Dict[str, Any]:
+    """从测试配置中取出传输层相关的选项"""
+    return {
+        "type": config.get("transport", "openai"),
+        "http2": config.get("http2", False),
+        "pool_size": config.get("pool_size"),
+        "prewarm": config.get("prewarm", True),
+        "routing": config.get("routing"),
+    }
+
+
+class SSEStream:
+    """增量解析 SSE 字节流，记录每个内容块的到达时间
+
+    设置 max_chunks 时收到这么多内容块后停止解析（stopped），由调用方断开连接，模拟客户端中途离开。
+    """
+
+    def __init__(self, field: str = "content", keep_text: bool = False, max_chunks: Optional[int] = None):
+        self.content_re = CONTENT_RE[field]
+        self.field = field
+        self.keep_text = keep_text
+        self.max_chunks = max_chunks
+        self.chunk_times: List[float] = []
+        self.pieces: List[str] = []
+        self.usage = None
+        self.done = False
+        self.buffer = b""
+        self.first_byte: Optional[float] = None
+
+    def feed(self, data: bytes, now: float) -> None:
+        if self.first_byte is None:
+            self.first_byte = now
+        self.buffer += data
+        if b"\n" not in data:
+            return
+        *lines, self.buffer = self.buffer.split(b"\n")
+        for line in lines:
+            if not line.startswith(b"data:"):
+                continue
+            event = line[5:].strip()
+            if event == b"[DONE]":
+                self.done = True
+            elif self.content_re.search(event):
+                self.chunk_times.append(now)
+                if self.keep_text:
+                    choices = json.loads(event).get("choices") or [{}]
+                    piece = choices[0].get("delta", {}).get("content") if self.field == "content" else choices[0].get("text")
+                    self.pieces.append(piece or "")
+                if self.stopped:
+                    return
+            if USAGE_RE.search(event):
+                usage = json.loads(event)["usage"]
+                details = usage.get("prompt_tokens_details")
+                self.usage = SimpleNamespace(
+                    prompt_tokens=usage.get("prompt_tokens"),
+                    completion_tokens=usage.get("completion_tokens"),
+                    prompt_tokens_details=SimpleNamespace(**details) if details else None,
+                )
+
+    @property
+    def stopped(self) -> bool:
+        return self.max_chunks is not None and len(self.chunk_times) >= self.max_chunks
+
+    @property
+    def text(self) -> Optional[str]:
+        return "".join(self.pieces) if self.keep_text else None
+
+
+class Connection:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    @property
+    def usable(self) -> bool:
+        return not self.reader.at_eof() and not self.writer.is_closing()
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+class ConnectionPool:
+    """HTTP/1.1 keep-alive 连接池，同时在用的连接数不超过 size
+
+    请求超过 size 时在信号量上等待，等待时间作为 pool_wait 单独报告。
+    """
+
+    def __init__(self, host: str, port: int, ssl_context: Optional[ssl.SSLContext], size: int):
+        self.host = host
+        self.port = port
+        self.ssl_context = ssl_context
+        self.slots = asyncio.Semaphore(size)
+        self.size = size
+        self.idle: deque = deque()
+
+    async def connect(self) -> Connection:
+        reader, writer = await asyncio.open_connection(
+            self.host, self.port, ssl=self.ssl_context, limit=1 << 20,
+            server_hostname=self.host if self.ssl_context else None
+        )
+        return Connection(reader, writer)
+
+    async def acquire(self) -> Tuple[Connection, float, float, bool]:
+        """返回 (连接, 等待连接池的时间, 建立连接的时间, 是否为复用的连接)"""
+        start = time.perf_counter()
+        await self.slots.acquire()
+        pool_wait = time.perf_counter() - start
+        while self.idle:
+            conn = self.idle.pop()
+            if conn.usable:
+                return conn, pool_wait, 0.0, True
+            conn.close()
+        connect_start = time.perf_counter()
+        try:
+            conn = await self.connect()
+        except BaseException:
+            self.slots.release()
+            raise
+        return conn, pool_wait, time.perf_counter() - connect_start, False
+
+    def release(self, conn: Connection, reusable: bool) -> None:
+        if reusable and conn.usable:
+            self.idle.append(conn)
+        else:
+            conn.close()
+        self.slots.release()
+
+    async def prewarm(self, count: int) -> int:
+        """在计时开始前建立 count 个空闲连接"""
+        count = min(count, self.size) - len(self.idle)
+        if count <= 0:
+            return 0
+        conns = await asyncio.gather(*(self.connect() for _ in range(count)), return_exceptions=True)
+        opened = [c for c in conns if isinstance(c, Connection)]
+        self.idle.extend(opened)
+        if len(opened) < count:
+            logging.warning(f"Only pre-warmed {len(opened)}/{count} connections to {self.host}:{self.port}")
+        return len(opened)
+
+    def close(self) -> None:
+        while self.idle:
+            self.idle.pop().close()
+
+
+async def read_headers(reader: asyncio.StreamReader) -> Tuple[int, Dict[str, str]]:
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionResetError("Connection closed before response")
+    status = int(status_line.split(b" ", 2)[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        key, _, value = line.decode("latin-1").partition(":")
+        headers[key.strip().lower()] = value.strip()
+    return status, headers
+
+
+async def iter_body(reader: asyncio.StreamReader, headers: Dict[str, str]):
+    """按 chunked 或 content-length 读取响应体，逐块产出"""
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        while True:
+            line = await reader.readline()
+            if not line:
+                raise asyncio.IncompleteReadError(b"", None)
+            size = int(line.split(b";", 1)[0].strip(), 16)
+            if size == 0:
+                await reader.readline()
+                return
+            data = await reader.readexactly(size)
+            await reader.readexactly(2)
+            yield data
+    elif "content-length" in headers:
+        remaining = int(headers["content-length"])
+        while remaining > 0:
+            data = await reader.read(min(remaining, 1 << 16))
+            if not data:
+                raise asyncio.IncompleteReadError(b"", remaining)
+            remaining -= len(data)
+            yield data
+    else:
+        while True:
+            data = await reader.read(1 << 16)
+            if not data:
+                return
+            yield data
+
+
+class LeanClient:
+    """精简的 OpenAI 兼容流式客户端：自带连接池、按需解析 SSE 字段
+
+    不构造 pydantic 对象，连接池大小与并发数一致并可在计时前预热。
+    记录中的 ttft、latency 从请求写出时开始计算，等待连接池和建立连接的时间单独报告。
+    """
+
+    def __init__(self, base_url: str, api_key: str, pool_size: int):
+        url = urlsplit(base_url)
+        self.host = url.hostname
+        self.port = url.port or (443 if url.scheme == "https" else 80)
+        self.base_path = url.path.rstrip("/")
+        self.host_header = url.netloc
+        self.api_key = api_key
+        self.pool = ConnectionPool(self.host, self.port, ssl.create_default_context() if url.scheme == "https" else None, pool_size)
+
+    async def prewarm(self, count: int) -> int:
+        return await self.pool.prewarm(count)
+
+    def request_bytes(self, path: str, payload: Dict[str, Any]) -> bytes:
+        body = json.dumps(payload, separators=(",", ":")).encode()
+        head = (f"POST {self.base_path}{path} HTTP/1.1\r\nHost: {self.host_header}\r\n"
+                f"Authorization: Bearer {self.api_key}\r\nContent-Type: application/json\r\n"
+                f"Accept: text/event-stream\r\nContent-Length: {len(body)}\r\n\r\n")
+        return head.encode("latin-1") + body
+
+    async def stream(self, path: str, payload: Dict[str, Any], field: str = "content",
+                     keep_text: bool = False, sse: Optional[SSEStream] = None) -> Tuple[SSEStream, Dict[str, float]]:
+        """发送流式请求并读完整个响应，返回解析结果和计时
+
+        计时包括 pool_wait、connect_time，以及 send_start、acquired、sent、headers 几个时刻（perf_counter）。
+
+        传入的 sse 停止解析时立即返回，连接上还有未读完的数据，关闭而不放回池中。
+        """
+        sse = sse or SSEStream(field, keep_text)
+
+        async def consume(reader: asyncio.StreamReader, headers: Dict[str, str]) -> Tuple[SSEStream, bool]:
+            async for data in iter_body(reader, headers):
+                sse.feed(data, time.perf_counter())
+                if sse.stopped:
+                    return sse, False
+            return sse, True
+
+        return await self.exchange(path, payload, consume)
+
+    async def post(self, path: str, payload: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, float]]:
+        """发送非流式请求，返回解析后的 JSON 响应和计时"""
+        async def consume(reader: asyncio.StreamReader, headers: Dict[str, str]) -> Tuple[Dict[str, Any], bool]:
+            return json.loads(b"".join([data async for data in iter_body(reader, headers)])), True
+
+        return await self.exchange(path, payload, consume)
+
+    async def exchange(self, path: str, payload: Dict[str, Any], consume) -> Tuple[Any, Dict[str, float]]:
+        """在池中的连接上发送请求，用 consume(reader, headers) 读取 200 响应
+
+        consume 返回 (结果, 是否读完了响应)；没有读完的连接关闭而不放回池中。
+        """
+        request = self.request_bytes(path, payload)
+        for attempt in range(2):
+            conn, pool_wait, connect_time, reused = await self.pool.acquire()
+            reusable = False
+            try:
+                send_start = time.perf_counter()
+                try:
+                    conn.writer.write(request)
+                    await conn.writer.drain()
+                    sent = time.perf_counter()
+                    status, headers = await read_headers(conn.reader)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    # 复用的空闲连接可能已被服务端关闭（写入或读响应头时才发现），换新连接重试一次
+                    if reused and attempt == 0:
+                        continue
+                    raise
+                timing = {"pool_wait": pool_wait, "connect_time": connect_time, "send_start": send_start,
+                          "acquired": send_start, "sent": sent, "headers": time.perf_counter()}
+                if status != 200:
+                    body = b"".join([data async for data in iter_body(conn.reader, headers)])
+                    reusable = headers.get("connection", "").lower() != "close"
+                    raise HTTPStatusError(status, body)
+                result, complete = await consume(conn.reader, headers)
+                # 没有长度信息的响应以关闭连接结束，不能复用
+                reusable = complete and headers.get("connection", "").lower() != "close" and (
+                    "content-length" in headers or headers.get("transfer-encoding", "").lower() == "chunked")
+                return result, timing
+            finally:
+                # 超时或取消时连接上还有未读完的数据，不能放回池中
+                self.pool.release(conn, reusable)
+        raise ConnectionResetError("Connection closed before response")
+
+    async def close(self) -> None:
+        self.pool.close()
+
+
+class Http2Client:
+    """基于 httpx 的 HTTP/2 客户端，多个流复用连接，SSE 解析与 LeanClient 相同"""
+
+    def __init__(self, base_url: str, api_key: str, pool_size: int):
+        self.base_url = base_url.rstrip("/")
+        self.headers = {"Authorization": f"Bearer {api_key}", "Accept": "text/event-stream"}
+        self.client = httpx.AsyncClient(
+            http2=True, timeout=None,
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        )
+
+    async def prewarm(self, count: int) -> int:
+        results = await asyncio.gather(*(self.client.get(f"{self.base_url}/models", headers=self.headers)
+                                         for _ in range(min(count, 8))), return_exceptions=True)
+        return sum(1 for r in results if not isinstance(r, BaseException))
+
+    async def stream(self, path: str, payload: Dict[str, Any], field: str = "content",
+                     keep_text: bool = False, sse: Optional[SSEStream] = None) -> Tuple[SSEStream, Dict[str, float]]:
+        marks: Dict[str, float] = {}
+
+        async def trace(event: str, info: Dict[str, Any]) -> None:
+            if event == "connection.connect_tcp.started":
+                marks["connect_start"] = time.perf_counter()
+            elif event in ("connection.connect_tcp.complete", "connection.start_tls.complete"):
+                marks["connect_end"] = time.perf_counter()
+            elif event.endswith("send_request_headers.started"):
+                marks["send_start"] = time.perf_counter()
+            elif event.endswith("send_request_body.complete"):
+                marks["sent"] = time.perf_counter()
+
+        start = time.perf_counter()
+        async with self.client.stream("POST", self.base_url + path, json=payload, headers=self.headers,
+                                      extensions={"trace": trace}) as response:
+            marks["headers"] = time.perf_counter()
+            if response.status_code != 200:
+                raise HTTPStatusError(response.status_code, await response.aread())
+            sse = sse or SSEStream(field, keep_text)
+            async for data in response.aiter_bytes():
+                sse.feed(data, time.perf_counter())
+                # 提前退出 async with 会重置这个 HTTP/2 流，连接本身继续复用
+                if sse.stopped:
+                    break
+        send_start = marks.get("send_start", start)
+        connect_time = marks["connect_end"] - marks["connect_start"] if "connect_end" in marks else 0.0
+        return sse, {"pool_wait": max(0.0, send_start - start - connect_time), "connect_time": connect_time,
+                     "send_start": send_start, "acquired": send_start, "sent": marks.get("sent"),
+                     "headers": marks["headers"]}
+
+    async def post(self, path: str, payload: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, float]]:
+        """发送非流式请求；HTTP/2 下不单独测量连接时间"""
+        start = time.perf_counter()
+        response = await self.client.post(self.base_url + path, json=payload, headers=self.headers)
+        if response.status_code != 200:
+            raise HTTPStatusError(response.status_code, response.content)
+        return response.json(), {"pool_wait": 0.0, "connect_time": 0.0, "send_start": start}
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+def openai_http_client(pool_size: int):
+    """按 pool_size 设置连接池上限的 openai HTTP 客户端
+
+    openai 客户端默认的连接池上限可能小于并发数，请求会在客户端内部排队而被算进 TTFT。
+    Limits 取自 openai 自己的默认值的类型，openai 自带（vendored）的 httpx 和独立安装的 httpx 都适用。
+    """
+    try:
+        from openai import DefaultAsyncHttpxClient
+        from openai._base_client import DEFAULT_CONNECTION_LIMITS
+    except ImportError:
+        logging.warning(f"Cannot size the openai connection pool with this openai version; 'pool_size' ({pool_size}) is ignored "
+                        f"and requests may queue inside the client. Use the lean transport to control the pool.")
+        return None
+    limits = type(DEFAULT_CONNECTION_LIMITS)(max_connections=pool_size, max_keepalive_connections=pool_size)
+    return DefaultAsyncHttpxClient(limits=limits)
+
+
+async def open_client(
+    vllm_url: Union[str, List[str]],
+    api_key: str,
+    transport: Optional[Dict[str, Any]] = None,
+    concurrency: Optional[int] = None
+):
+    """创建并预热客户端；连接池大小默认等于并发数，开环模式下为 DEFAULT_POOL_SIZE
+
+    vllm_url 为多个端点时返回 EndpointRouter，每个端点一个客户端，预热连接平均分到各端点。
+    """
+    transport = transport or {}
+    if isinstance(vllm_url, (list, tuple)):
+        prewarm = transport.get("prewarm", True)
+        if prewarm and prewarm is not True:
+            prewarm = max(1, -(-int(prewarm) // len(vllm_url)))
+        clients = [await open_client(url, api_key, {**transport, "prewarm": prewarm}, concurrency) for url in vllm_url]
+        return EndpointRouter(list(vllm_url), clients, routing_config(transport.get("routing")))
+
+    pool_size = transport.get("pool_size") or concurrency or DEFAULT_POOL_SIZE
+    prewarm = transport.get("prewarm", True)
+    prewarm_count = 0 if not prewarm else (min(pool_size, DEFAULT_PREWARM) if prewarm is True else int(prewarm))
+
+    if transport.get("type", "openai") == "lean":
+        client = Http2Client(vllm_url, api_key, pool_size) if transport.get("http2") else LeanClient(vllm_url, api_key, pool_size)
+        if prewarm_count:
+            await client.prewarm(prewarm_count)
+        return client
+
+    client = AsyncOpenAI(base_url=vllm_url, api_key=api_key, http_client=openai_http_client(pool_size))
+    if prewarm_count:
+        await asyncio.gather(*(client.models.list() for _ in range(prewarm_count)), return_exceptions=True)
+    return client
@@ -2,10 +2,20 @@ import asyncio
 import time
 from typing import List, Dict, Any, Tuple, Optional
 import numpy as np
+import openai
 from openai import AsyncOpenAI
 import logging
 import json
 import random
+import re
+from arrivals import generate_request_times
+from workloads import Workload, build_workload
+from aborts import AbortPlan, build_abort_plan
+from stats import REQUEST_PHASES, ResultAccumulator
+from profiling import start_lag_window, end_lag_window
+from records import RecordSink
+from transport import CONNECTION_ERRORS, SSEStream, open_client
+from routing import EndpointRouter
 from rich.console import Console
 from rich.table import Table
 from rich.progress import Progress, TextColumn, BarColumn, TaskProgressColumn, TimeRemainingColumn, TimeElapsedColumn
@@ -94,71 +104,264 @@ LONG_PROMPT_PAIRS = [
     },
 ]
 
-async def process_stream(stream) -> Tuple[Optional[float], int]:
-    """处理流式响应并计算首字时间和生成的令牌数"""
-    first_token_time = None
-    total_tokens = 0
+async def process_stream(
+    stream,
+    keep_text: bool = False,
+    chunk_times: Optional[List[float]] = None,
+    max_chunks: Optional[int] = None
+) -> Tuple[List[float], Optional[Any], Optional[str], bool]:
+    """处理流式响应，记录每个内容块的到达时间以及服务端返回的 token 用量
+
+    keep_text 为 True 时同时拼接回复内容（多轮对话需要把回复加入历史）。
+    chunk_times 由调用方传入时，超时取消后仍能看到已收到的块；收到 max_chunks 个内容块后停止读取
+    （模拟客户端中途离开），此时最后一个返回值为 False。
+    """
+    chunk_times = chunk_times if chunk_times is not None else []
+    usage = None
+    pieces = [] if keep_text else None
+    # 开启 include_usage 后 finish_reason 之后还有一个 choices 为空、只携带 usage 的块，需要读到流结束
     async for chunk in stream:
-        if first_token_time is None:
-            first_token_time = time.time()
-        if chunk.choices[0].delta.content:
-            total_tokens += 1
-        if chunk.choices[0].finish_reason is not None:
-            break
-    return first_token_time, total_tokens
+        if chunk.choices and chunk.choices[0].delta.content:
+            chunk_times.append(time.perf_counter())
+            if keep_text:
+                pieces.append(chunk.choices[0].delta.content)
+            if max_chunks is not None and len(chunk_times) >= max_chunks:
+                return chunk_times, usage, "".join(pieces) if keep_text else None, False
+        if chunk.usage is not None:
+            usage = chunk.usage
+    return chunk_times, usage, "".join(pieces) if keep_text else None, True
 
 async def make_request(
-    client: AsyncOpenAI, 
+    client, 
     model: str, 
     output_tokens: int, 
     request_timeout: int, 
-    use_long_context: bool
-) -> Optional[Tuple[int, float, float, float]]:
-    """发送单个请求并返回相关指标"""
-    start_time = time.time()
-    if use_long_context:
-        prompt_pair = random.choice(LONG_PROMPT_PAIRS)
-        content = f"{prompt_pair['context']}\n\n{prompt_pair['prompt']}"
+    use_long_context: bool,
+    workload: Optional[Workload] = None,
+    spec: Optional[Dict[str, Any]] = None,
+    keep_text: bool = False,
+    abort_after: Optional[Dict[str, float]] = None
+) -> Optional[Dict[str, Any]]:
+    """发送单个请求并返回该请求的原始记录，失败的请求同样返回记录（status 为 timeout 或 error）
+
+    spec 直接给出请求内容（messages、max_tokens、extra_body），否则从 workload 或内置提示中取。
+    abort_after 为 {"after_tokens": n} 或 {"after_seconds": s} 时模拟用户中途离开，记录的 status 为 aborted。
+    超时、中途离开或任务被取消时都会关闭响应流，连接不会被放回连接池，服务端据此中止生成。
+    """
+    if spec is None and workload is not None:
+        spec = workload.next_request()
+    if spec is not None:
+        messages = spec["messages"]
+        max_tokens = spec["max_tokens"]
+        extra_body = spec.get("extra_body") or None
     else:
-        content = random.choice(SHORT_PROMPTS)
+        if use_long_context:
+            prompt_pair = random.choice(LONG_PROMPT_PAIRS)
+            content = f"{prompt_pair['context']}\n\n{prompt_pair['prompt']}"
+        else:
+            content = random.choice(SHORT_PROMPTS)
+        messages = [{"role": "user", "content": content}]
+        max_tokens = output_tokens
+        extra_body = None
 
-    try:
+    if isinstance(client, EndpointRouter):
+        # 多端点：按路由策略选出端点后用该端点的客户端发送，在途计数供 least_outstanding 使用
+        endpoint, target = client.acquire(messages)
+        try:
+            record = await make_request(target, model, output_tokens, request_timeout, use_long_context,
+                                        spec={"messages": messages, "max_tokens": max_tokens, "extra_body": extra_body},
+                                        keep_text=keep_text, abort_after=abort_after)
+        finally:
+            client.release(endpoint)
+        record["endpoint"] = client.urls[endpoint]
+        return record
+
+    # 记录中的时间戳为 Unix 时间，便于和服务端日志、其他进程的记录对齐；时长仍用单调时钟计算
+    send_time = time.time()
+    start_time = queued = time.perf_counter()
+    timing = None
+    # 各阶段的时刻（perf_counter），openai 客户端只能观测到响应头和 token 的到达
+    marks: Dict[str, Optional[float]] = {}
+    max_chunks = abort_after.get("after_tokens") if abort_after else None
+    abort_seconds = abort_after.get("after_seconds") if abort_after else None
+    timeout = min(request_timeout, abort_seconds) if abort_seconds is not None else request_timeout
+    # 已收到的内容块时间，超时或断开后用于中途离开的记录
+    chunk_times: List[float] = []
+
+    async def openai_stream() -> Tuple[List[float], Optional[Any], Optional[str], bool]:
         stream = await client.chat.completions.create(
             model=model,
-            messages=[
-                {"role": "user", "content": content}
-            ],
-            max_tokens=output_tokens,
-            stream=True
+            messages=messages,
+            max_tokens=max_tokens,
+            stream=True,
+            stream_options={"include_usage": True},
+            extra_body=extra_body
         )
-        first_token_time, total_tokens = await asyncio.wait_for(process_stream(stream), timeout=request_timeout)
+        marks["headers"] = time.perf_counter()
+        try:
+            return await process_stream(stream, keep_text, chunk_times, max_chunks)
+        finally:
+            # 提前结束或被取消时关闭响应，否则连接会一直挂着，服务端也会继续生成
+            await stream.close()
+
+    try:
+        if isinstance(client, AsyncOpenAI):
+            # 超时覆盖整个请求，包括等待响应头
+            _, usage, text, finished = await asyncio.wait_for(openai_stream(), timeout=timeout)
+        else:
+            # 精简传输层：计时从请求写出开始，等待连接池和建立连接的时间单独记录
+            payload = {"model": model, "messages": messages, "max_tokens": max_tokens, "stream": True,
+                       "stream_options": {"include_usage": True}, **(extra_body or {})}
+            sse = SSEStream(keep_text=keep_text, max_chunks=max_chunks)
+            chunk_times = sse.chunk_times
+            sse, timing = await asyncio.wait_for(client.stream("/chat/completions", payload, keep_text=keep_text, sse=sse),
+                                                 timeout=timeout)
+            usage, text, finished = sse.usage, sse.text, not sse.stopped
+            marks = {key: timing[key] for key in ("acquired", "sent", "headers")}
+            marks["first_byte"] = sse.first_byte
+            start_time = timing["send_start"]
+            send_time += timing["pool_wait"] + timing["connect_time"]
+        if not finished:
+            return aborted_record(abort_after, send_time, start_time, max_tokens, chunk_times)
         
-        end_time = time.time()
+        end_time = time.perf_counter()
         elapsed_time = end_time - start_time
-        ttft = first_token_time - start_time if first_token_time else None
+        ttft = chunk_times[0] - start_time if chunk_times else None
+        # 优先使用服务端统计的 token 数，一个块里可能包含多个 token（如投机解码）
+        total_tokens = usage.completion_tokens if usage else len(chunk_times)
         tokens_per_second = total_tokens / elapsed_time if elapsed_time > 0 else 0
-        return total_tokens, elapsed_time, tokens_per_second, ttft
+        tpot = (elapsed_time - ttft) / (total_tokens - 1) if ttft is not None and total_tokens > 1 else None
+        # 服务端开启 --enable-prompt-tokens-details 时会返回命中前缀缓存的 token 数
+        details = getattr(usage, "prompt_tokens_details", None) if usage else None
+        record = {
+            "status": "ok",
+            "send_time": send_time,
+            "first_token_time": send_time + ttft if ttft is not None else None,
+            "end_time": send_time + elapsed_time,
+            "prompt_tokens": usage.prompt_tokens if usage else None,
+            "cached_tokens": getattr(details, "cached_tokens", None) if details else None,
+            "max_tokens": max_tokens,
+            "output_tokens": total_tokens,
+            "latency": elapsed_time,
+            "tokens_per_second": tokens_per_second,
+            "ttft": ttft,
+            "tpot": tpot,
+            "inter_token_latencies": np.diff(chunk_times).tolist(),
+            "phases": request_phases(queued, marks, chunk_times),
+        }
+        if timing is not None:
+            record["pool_wait"] = timing["pool_wait"]
+            record["connect_time"] = timing["connect_time"]
+        if keep_text:
+            record["text"] = text
+        return record
 
     except asyncio.TimeoutError:
+        if abort_seconds is not None and abort_seconds < request_timeout:
+            return aborted_record(abort_after, send_time, start_time, max_tokens, chunk_times)
         logging.warning(f"Request timed out after {request_timeout} seconds")
-        return None
+        return failed_record("timeout", "Timeout", send_time, start_time, max_tokens, "timeout")
     except Exception as e:
-        logging.error(f"Error during request: {str(e)}")
-        return None
+        category = classify_error(e)
+        # 过载时负载保护错误成批出现，不逐条记为 error
+        logging.log(logging.DEBUG if category in ("rate_limited", "overloaded") else logging.ERROR,
+                    f"Error during request: {str(e)}")
+        record = failed_record("error", type(e).__name__, send_time, start_time, max_tokens, category)
+        if getattr(e, "status_code", None) is not None:
+            record["status_code"] = e.status_code
+        return record
+
+def request_phases(queued: float, marks: Dict[str, Optional[float]], chunk_times: List[float]) -> Dict[str, float]:
+    """把各阶段的时刻换算为相对进入客户端（queued）的秒数，见 REQUEST_PHASES"""
+    if chunk_times:
+        marks = {**marks, "first_token": chunk_times[0], "last_token": chunk_times[-1]}
+    phases = {"queued": 0.0}
+    phases.update({name: marks[name] - queued for name in REQUEST_PHASES[1:] if marks.get(name) is not None})
+    return phases
+
+# vLLM 拒绝超出 max_model_len 的请求时的错误信息
+CONTEXT_LENGTH_RE = re.compile(r"context length|max_model_len|maximum model length|too long", re.IGNORECASE)
+
+def classify_error(e: Exception) -> str:
+    """把请求异常归入 ERROR_CATEGORIES 中的一类"""
+    status_code = getattr(e, "status_code", None)
+    if status_code == 429:
+        return "rate_limited"
+    if status_code == 503:
+        return "overloaded"
+    if status_code is not None and status_code >= 500:
+        return "server_error"
+    if status_code is not None and status_code >= 400:
+        return "context_length" if CONTEXT_LENGTH_RE.search(str(e)) else "client_error"
+    if isinstance(e, openai.APITimeoutError):
+        return "timeout"
+    if isinstance(e, (openai.APIConnectionError,) + CONNECTION_ERRORS):
+        return "connection"
+    return "other"
+
+def aborted_record(
+    abort_after: Dict[str, float],
+    send_time: float,
+    start_time: float,
+    max_tokens: int,
+    chunk_times: List[float]
+) -> Dict[str, Any]:
+    """客户端中途离开的请求的记录，output_tokens 为离开前收到的内容块数"""
+    elapsed_time = time.perf_counter() - start_time
+    ttft = chunk_times[0] - start_time if chunk_times else None
+    return {
+        "status": "aborted",
+        "error": "ClientAbort",
+        "abort_after": abort_after,
+        "send_time": send_time,
+        "first_token_time": send_time + ttft if ttft is not None else None,
+        "end_time": send_time + elapsed_time,
+        "max_tokens": max_tokens,
+        "output_tokens": len(chunk_times),
+        "latency": elapsed_time,
+        "ttft": ttft,
+    }
+
+def failed_record(
+    status: str,
+    error: str,
+    send_time: float,
+    start_time: float,
+    max_tokens: int,
+    category: str
+) -> Dict[str, Any]:
+    """失败请求的记录，只包含时间戳、错误类型和类别"""
+    elapsed_time = time.perf_counter() - start_time
+    return {
+        "status": status,
+        "error": error,
+        "category": category,
+        "send_time": send_time,
+        "first_token_time": None,
+        "end_time": send_time + elapsed_time,
+        "max_tokens": max_tokens,
+        "latency": elapsed_time,
+    }
 
 async def worker(
-    client: AsyncOpenAI, 
+    client, 
     semaphore: asyncio.Semaphore, 
     queue: asyncio.Queue, 
-    results: List[Tuple[int, float, float, float]], 
+    sink: RecordSink, 
     model: str, 
     output_tokens: int, 
     request_timeout: int, 
     use_long_context: bool,
     progress_task=None,
-    progress=None
+    progress=None,
+    workload: Optional[Workload] = None,
+    abort_plan: Optional[AbortPlan] = None
 ) -> None:
-    """工作线程函数，处理队列中的请求"""
+    """工作线程函数，处理队列中的请求
+
+    上一个请求中途离开后立即发出的请求标记 after_abort，其 TTFT 反映服务端回收槽位的速度。
+    """
+    after_abort = False
     while True:
         async with semaphore:
             task_id = await queue.get()
@@ -166,10 +369,13 @@ async def worker(
                 queue.task_done()
                 break
             logging.debug(f"Starting request {task_id}")
-            result = await make_request(client, model, output_tokens, request_timeout, use_long_context)
-            if result:
-                results.append(result)
-            else:
+            result = await make_request(client, model, output_tokens, request_timeout, use_long_context, workload,
+                                        abort_after=abort_plan.sample() if abort_plan else None)
+            if after_abort:
+                result["after_abort"] = True
+            after_abort = result["status"] == "aborted"
+            sink.add(result)
+            if result["status"] not in ("ok", "aborted"):
                 logging.warning(f"Request {task_id} failed")
             queue.task_done()
             logging.debug(f"Finished request {task_id}")
@@ -185,7 +391,38 @@ def calculate_percentile(values: List[float], percentile: int, reverse: bool = F
         return np.percentile(values, 100 - percentile)
     return np.percentile(values, percentile)
 
-async def run_benchmark(
+def distribution_stats(values: List[float], percentiles: Tuple[int, ...] = (50, 90, 95, 99)) -> Dict[str, Optional[float]]:
+    """计算平均值、各百分位数和最大值"""
+    stats = {"average": float(np.mean(values)) if len(values) else 0}
+    for p in percentiles:
+        stats[f"p{p}"] = calculate_percentile(values, p)
+    stats["max"] = float(np.max(values)) if len(values) else None
+    return stats
+
+def summarize_results(
+    results: List[Dict[str, Any]], 
+    total_elapsed_time: float, 
+    slo: Optional[Dict[str, float]] = None, 
+    total_requests: Optional[int] = None
+) -> Dict[str, Any]:
+    """根据原始请求记录计算汇总指标（记录已在内存中时使用，否则直接用 RecordSink 的统计量）"""
+    stats = ResultAccumulator(slo)
+    for record in results:
+        stats.add(record)
+    return stats.summary(total_elapsed_time, total_requests)
+
+def create_progress(console: Optional[Console] = None) -> Progress:
+    """创建统一样式的进度条"""
+    return Progress(
+        TextColumn("[bold blue]{task.description}"),
+        BarColumn(),
+        TaskProgressColumn(),
+        TimeRemainingColumn(),
+        TimeElapsedColumn(),
+        console=console or Console()
+    )
+
+async def collect_concurrent_results(
     num_requests: int, 
     concurrency: int, 
     request_timeout: int, 
@@ -193,99 +430,96 @@ async def run_benchmark(
     vllm_url: str, 
     api_key: str, 
     use_long_context: bool, 
-    model: str
-) -> Dict[str, Any]:
-    """运行并发基准测试"""
-    client = AsyncOpenAI(base_url=vllm_url, api_key=api_key)
+    model: str,
+    progress=None,
+    progress_task=None,
+    workload: Optional[Dict[str, Any]] = None,
+    sink: Optional[RecordSink] = None,
+    transport: Optional[Dict[str, Any]] = None,
+    abort: Optional[Dict[str, Any]] = None
+) -> Tuple[RecordSink, float, float]:
+    """以固定并发发送请求，记录交给 sink，返回 sink 以及开始、结束时间"""
+    client = await open_client(vllm_url, api_key, transport, concurrency)
+    request_source = build_workload(workload, output_tokens, (workload or {}).get("seed"))
+    abort_plan = build_abort_plan(abort)
     semaphore = asyncio.Semaphore(concurrency)
     queue = asyncio.Queue()
-    results = []
+    sink = sink if sink is not None else RecordSink()
 
-    # 创建进度条
-    with Progress(
-        TextColumn("[bold blue]{task.description}"),
-        BarColumn(),
-        TaskProgressColumn(),
-        TimeRemainingColumn(),
-        TimeElapsedColumn(),
-        console=Console()
-    ) as progress:
-        task = progress.add_task(f"[cyan]Processing {num_requests} requests", total=num_requests)
-        
-        # 向队列中添加任务
-        for i in range(num_requests):
-            await queue.put(i)
-        
-        # 添加哨兵值以停止工作线程
-        for _ in range(concurrency):
-            await queue.put(None)
-
-        # 创建工作线程任务
-        workers = [
-            asyncio.create_task(
-                worker(client, semaphore, queue, results, model, output_tokens, request_timeout, use_long_context, task, progress)
-            ) for _ in range(concurrency)
-        ]
-
-        start_time = time.time()
-        
-        # 等待所有任务完成
+    # 向队列中添加任务
+    for i in range(num_requests):
+        await queue.put(i)
+    
+    # 添加哨兵值以停止工作线程
+    for _ in range(concurrency):
+        await queue.put(None)
+
+    # 创建工作线程任务
+    workers = [
+        asyncio.create_task(
+            worker(client, semaphore, queue, sink, model, output_tokens, request_timeout, use_long_context,
+                   progress_task, progress, request_source, abort_plan)
+        ) for _ in range(concurrency)
+    ]
+
+    start_lag_window()
+    start_time = time.time()
+    
+    # 等待所有任务完成
+    try:
         await queue.join()
         await asyncio.gather(*workers)
+    finally:
+        end_lag_window()
+        await client.close()
+        sink.close()
 
-    end_time = time.time()
+    return sink, start_time, time.time()
+
+async def run_benchmark(
+    num_requests: int, 
+    concurrency: int, 
+    request_timeout: int, 
+    output_tokens: int, 
+    vllm_url: str, 
+    api_key: str, 
+    use_long_context: bool, 
+    model: str,
+    slo: Optional[Dict[str, float]] = None,
+    workload: Optional[Dict[str, Any]] = None,
+    record_file: Optional[str] = None,
+    transport: Optional[Dict[str, Any]] = None,
+    abort: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """运行并发基准测试"""
+    # 创建进度条
+    with create_progress() as progress:
+        task = progress.add_task(f"[cyan]Processing {num_requests} requests", total=num_requests)
+        sink, start_time, end_time = await collect_concurrent_results(
+            num_requests, concurrency, request_timeout, output_tokens,
+            vllm_url, api_key, use_long_context, model, progress, task,
+            workload=workload, sink=RecordSink(record_file, slo),
+            transport=transport, abort=abort
+        )
 
     # 计算指标
     total_elapsed_time = end_time - start_time
-    total_tokens = sum(tokens for tokens, _, _, _ in results if tokens is not None)
-    latencies = [elapsed_time for _, elapsed_time, _, _ in results if elapsed_time is not None]
-    tokens_per_second_list = [tps for _, _, tps, _ in results if tps is not None]
-    ttft_list = [ttft for _, _, _, ttft in results if ttft is not None]
-
-    successful_requests = len(results)
-    requests_per_second = successful_requests / total_elapsed_time if total_elapsed_time > 0 else 0
-    avg_latency = sum(latencies) / len(latencies) if latencies else 0
-    avg_tokens_per_second = sum(tokens_per_second_list) / len(tokens_per_second_list) if tokens_per_second_list else 0
-    avg_ttft = sum(ttft_list) / len(ttft_list) if ttft_list else 0
-    
-    # 计算百分位数
-    percentiles = [50, 95, 99]
-    latency_percentiles = [calculate_percentile(latencies, p) for p in percentiles]
-    tps_percentiles = [calculate_percentile(tokens_per_second_list, p, reverse=True) for p in percentiles]
-    ttft_percentiles = [calculate_percentile(ttft_list, p) for p in percentiles]
-    
-    return {
+    summary = {
         "total_requests": num_requests,
-        "successful_requests": successful_requests,
         "concurrency": concurrency,
         "request_timeout": request_timeout,
         "max_output_tokens": output_tokens,
         "use_long_context": use_long_context,
+        "workload": (workload or {}).get("type", "builtin"),
         "model": model,
         "total_time": total_elapsed_time,
-        "requests_per_second": requests_per_second,
-        "total_output_tokens": total_tokens,
-        "latency": {
-            "average": avg_latency,
-            "p50": latency_percentiles[0],
-            "p95": latency_percentiles[1],
-            "p99": latency_percentiles[2]
-        },
-        "tokens_per_second": {
-            "average": avg_tokens_per_second,
-            "p50": tps_percentiles[0],
-            "p95": tps_percentiles[1],
-            "p99": tps_percentiles[2]
-        },
-        "time_to_first_token": {
-            "average": avg_ttft,
-            "p50": ttft_percentiles[0],
-            "p95": ttft_percentiles[1],
-            "p99": ttft_percentiles[2]
-        }
     }
+    if record_file:
+        summary["record_file"] = record_file
+    summary.update(sink.summary(total_elapsed_time, num_requests))
+    return summary
 
-async def distributed_request_benchmark(
+async def collect_distributed_results(
     num_requests: int, 
     duration: int, 
     spread_mode: str, 
@@ -293,124 +527,134 @@ async def distributed_request_benchmark(
     vllm_url: str, 
     api_key: str, 
     use_long_context: bool, 
-    model: str
-) -> Dict[str, Any]:
-    """运行分布式请求调度基准测试"""
-    client = AsyncOpenAI(base_url=vllm_url, api_key=api_key)
-    results = []
+    model: str,
+    progress=None,
+    progress_task=None,
+    request_times: Optional[List[float]] = None,
+    workload: Optional[Dict[str, Any]] = None,
+    sink: Optional[RecordSink] = None,
+    transport: Optional[Dict[str, Any]] = None,
+    abort: Optional[Dict[str, Any]] = None,
+    request_timeout: Optional[float] = None
+) -> Tuple[RecordSink, float, float]:
+    """按发送计划开环调度请求，记录交给 sink，返回 sink 以及开始、结束时间
+
+    使用单调时钟上的绝对截止时间调度，事件循环的延迟不会在请求之间累积；
+    计划内的请求即使晚于 duration 发出也不会被丢弃，而是记录其调度滞后。
+    request_timeout 默认为 duration。
+    """
+    client = await open_client(vllm_url, api_key, transport)
+    request_source = build_workload(workload, output_tokens, (workload or {}).get("seed"))
+    abort_plan = build_abort_plan(abort)
+    sink = sink if sink is not None else RecordSink()
     tasks = []
     
     # 生成请求时间点
-    if spread_mode == 'uniform':
-        request_times = np.random.uniform(0, duration, num_requests)
-    elif spread_mode == 'normal':
-        request_times = np.random.normal(duration / 2, duration / 6, num_requests)
-        request_times = np.clip(request_times, 0, duration)
-    elif spread_mode == 'exponential':
-        request_times = np.random.exponential(scale=duration / 3, size=num_requests)
-        request_times = np.clip(request_times, 0, duration)
-    else:
-        raise ValueError(f"Unknown spread mode: {spread_mode}")
+    if request_times is None:
+        request_times = generate_request_times(num_requests, duration, spread_mode)
     
-    request_times = sorted(request_times)
+    async def scheduled_request(intended: float, actual: float) -> Dict[str, Any]:
+        record = await make_request(client, model, output_tokens, request_timeout or duration, use_long_context, request_source,
+                                    abort_after=abort_plan.sample() if abort_plan else None)
+        record["intended_send"] = intended
+        record["actual_send"] = actual
+        record["schedule_lag"] = actual - intended
+        # 请求完成时立即交给 sink，而不是等全部请求结束后再按顺序收集
+        sink.add(record)
+        return record
+
+    logging.debug(f"Starting distributed benchmark with {len(request_times)} requests over {duration} seconds")
     
+    start_lag_window()
     start_time = time.time()
-    end_time = start_time + duration
+    start_mono = time.perf_counter()
     
-    logging.debug(f"Starting distributed benchmark with {num_requests} requests over {duration} seconds")
-    
-    # 创建进度条 - 使用单一的console对象
-    console = Console()
-    with Progress(
-        TextColumn("[bold blue]{task.description}"),
-        BarColumn(),
-        TaskProgressColumn(),
-        TimeRemainingColumn(),
-        TimeElapsedColumn(),
-        console=console
-    ) as progress:
-        progress_task_id = progress.add_task(f"[cyan]Running {spread_mode} distribution test", total=num_requests)
+    # 先调度所有请求
+    for req_time in request_times:
+        deadline = start_mono + req_time
+        wait_time = deadline - time.perf_counter()
+        if wait_time > 0:
+            await asyncio.sleep(wait_time)
         
-        # 先调度所有请求
-        for i, req_time in enumerate(request_times):
-            wait_time = req_time - (time.time() - start_time)
-            if wait_time > 0:
-                await asyncio.sleep(wait_time)
-            
-            if time.time() >= end_time:
-                logging.debug(f"Duration {duration}s reached, stopping after {i} requests")
-                break
-                
-            task = asyncio.create_task(make_request(client, model, output_tokens, duration, use_long_context))
-            tasks.append(task)
-            
-            # 更新进度条
-            progress.update(progress_task_id, advance=1)
-    
-        # 等待所有请求完成
+        actual = time.perf_counter() - start_mono
+        task = asyncio.create_task(scheduled_request(float(req_time), actual))
+        tasks.append(task)
+        
+        # 更新进度条
+        if progress and progress_task is not None:
+            progress.update(progress_task, advance=1)
+
+    # 等待所有请求完成
+    try:
         for i, task in enumerate(tasks):
             try:
                 result = await task
-                if result:
-                    results.append(result)
-                else:
+                if result["status"] != "ok":
                     logging.debug(f"Request {i} failed")
             except asyncio.CancelledError:
                 logging.debug(f"Request {i} was cancelled")
             except Exception as e:
                 logging.error(f"Error in request {i}: {str(e)}")
+    finally:
+        end_lag_window()
+        await client.close()
+        sink.close()
+    
+    return sink, start_time, time.time()
+
+async def distributed_request_benchmark(
+    num_requests: int, 
+    duration: int, 
+    spread_mode: str, 
+    output_tokens: int, 
+    vllm_url: str, 
+    api_key: str, 
+    use_long_context: bool, 
+    model: str,
+    request_times: Optional[List[float]] = None,
+    slo: Optional[Dict[str, float]] = None,
+    workload: Optional[Dict[str, Any]] = None,
+    record_file: Optional[str] = None,
+    transport: Optional[Dict[str, Any]] = None,
+    abort: Optional[Dict[str, Any]] = None,
+    request_timeout: Optional[float] = None,
+    sink: Optional[RecordSink] = None
+) -> Dict[str, Any]:
+    """运行分布式请求调度基准测试，sink 可以替换为同时做额外统计的 RecordSink 子类"""
+    if request_times is None:
+        request_times = generate_request_times(num_requests, duration, spread_mode)
+    num_requests = len(request_times)
+
+    # 创建进度条 - 使用单一的console对象
+    with create_progress() as progress:
+        progress_task_id = progress.add_task(f"[cyan]Running {spread_mode} distribution test", total=num_requests)
+        sink, start_time, final_time = await collect_distributed_results(
+            num_requests, duration, spread_mode, output_tokens,
+            vllm_url, api_key, use_long_context, model, progress, progress_task_id,
+            request_times=request_times, workload=workload,
+            sink=sink if sink is not None else RecordSink(record_file, slo),
+            transport=transport, abort=abort, request_timeout=request_timeout
+        )
     
-    final_time = time.time()
     actual_duration = final_time - start_time
     
     # 计算指标（与并发模式类似）
-    total_tokens = sum(tokens for tokens, _, _, _ in results if tokens is not None)
-    latencies = [elapsed_time for _, elapsed_time, _, _ in results if elapsed_time is not None]
-    tokens_per_second_list = [tps for _, _, tps, _ in results if tps is not None]
-    ttft_list = [ttft for _, _, _, ttft in results if ttft is not None]
-
-    successful_requests = len(results)
-    requests_per_second = successful_requests / actual_duration if actual_duration > 0 else 0
-    avg_latency = sum(latencies) / len(latencies) if latencies else 0
-    avg_tokens_per_second = sum(tokens_per_second_list) / len(tokens_per_second_list) if tokens_per_second_list else 0
-    avg_ttft = sum(ttft_list) / len(ttft_list) if ttft_list else 0
-    
-    percentiles = [50, 95, 99]
-    latency_percentiles = [calculate_percentile(latencies, p) for p in percentiles]
-    tps_percentiles = [calculate_percentile(tokens_per_second_list, p, reverse=True) for p in percentiles]
-    ttft_percentiles = [calculate_percentile(ttft_list, p) for p in percentiles]
-    
-    return {
+    summary = {
         "total_requests": num_requests,
-        "successful_requests": successful_requests,
         "spread_mode": spread_mode,
         "planned_duration": duration,
         "actual_duration": actual_duration,
-        "request_timeout": duration,
+        "offered_rate": num_requests / duration if duration > 0 else 0,
+        "request_timeout": request_timeout or duration,
         "max_output_tokens": output_tokens,
         "use_long_context": use_long_context,
+        "workload": (workload or {}).get("type", "builtin"),
         "model": model,
-        "requests_per_second": requests_per_second,
-        "total_output_tokens": total_tokens,
-        "latency": {
-            "average": avg_latency,
-            "p50": latency_percentiles[0],
-            "p95": latency_percentiles[1],
-            "p99": latency_percentiles[2]
-        },
-        "tokens_per_second": {
-            "average": avg_tokens_per_second,
-            "p50": tps_percentiles[0],
-            "p95": tps_percentiles[1],
-            "p99": tps_percentiles[2]
-        },
-        "time_to_first_token": {
-            "average": avg_ttft,
-            "p50": ttft_percentiles[0],
-            "p95": ttft_percentiles[1],
-            "p99": ttft_percentiles[2]
-        }
     }
+    if record_file:
+        summary["record_file"] = record_file
+    summary.update(sink.summary(actual_duration, num_requests))
+    return summary
 
 def print_results(results: Dict[str, Any]) -> None:
     """打印单个测试结果的详细信息"""
@@ -434,27 +678,182 @@ def print_results(results: Dict[str, Any]) -> None:
     if "spread_mode" in results:
         table.add_row("Distribution Mode", results["spread_mode"])
         table.add_row("Test Duration", f"{results['actual_duration']:.2f}s")
+        table.add_row("Offered Rate", f"{results['offered_rate']:.2f} req/s")
+    if "measurement_window" in results:
+        table.add_row("Measurement Window", f"{results['warmup']}s - {results['duration'] - results['cooldown']}s "
+                      f"({results['requests_sent']} sent)")
+        steady = results["steady_state"]
+        table.add_row("Steady State", "yes" if steady["steady"] else f"no ({steady.get('reason')})")
+    if "schedule_lag" in results:
+        table.add_row("Schedule Lag (p99)", f"{results['schedule_lag']['p99'] * 1000:.2f}ms")
+        table.add_row("Schedule Lag (max)", f"{results['schedule_lag']['max'] * 1000:.2f}ms")
     
+    if "ttft_by_turn" in results:
+        for turn, stats in results["ttft_by_turn"].items():
+            table.add_row(f"TTFT turn {turn} (p50/p95)", f"{stats['p50']:.4f}s / {stats['p95']:.4f}s")
+        cache = results["ttft_by_prefix_cache"]
+        for key in ("cached", "uncached"):
+            if cache[key]["max"] is not None:
+                table.add_row(f"TTFT {key} prefix, {cache['source']} (p50/p95)",
+                              f"{cache[key]['p50']:.4f}s / {cache[key]['p95']:.4f}s")
+        if "prefix_cache_hit_rate" in results:
+            table.add_row("Prefix Cache Hit Rate", f"{results['prefix_cache_hit_rate'] * 100:.2f}%")
+
+    for key, label in [("pool_wait", "Client Pool Wait"), ("connect_time", "Client Connect Time")]:
+        if key in results:
+            table.add_row(f"{label} (p50/p99)", f"{results[key]['p50'] * 1000:.2f}ms / {results[key]['p99'] * 1000:.2f}ms")
+
+    if "client_workers" in results:
+        for w in results["client_workers"]:
+            lag = w.get("loop_lag")
+            table.add_row(f"Worker {w['worker']} Client CPU", f"{w['cpu_percent']:.1f}% ({w['successful_requests']} ok)"
+                          + (f", loop lag p99 {lag['p99'] * 1000:.1f}ms" if lag and lag["p99"] is not None else ""))
+
+    if "phase_breakdown" in results:
+        # 每个阶段距上一个已观测阶段的时间
+        for phase, stats in results["phase_breakdown"].items():
+            table.add_row(f"Phase -> {phase} (p50/p99)", f"{stats['p50'] * 1000:.2f}ms / {stats['p99'] * 1000:.2f}ms")
+    if "client_profile" in results and (results["client_profile"].get("loop_lag") or {}).get("p99") is not None:
+        lag = results["client_profile"]["loop_lag"]
+        table.add_row("Client Loop Lag (p99/max)", f"{lag['p99'] * 1000:.2f}ms / {lag['max'] * 1000:.2f}ms")
+    if "trustworthy" in results:
+        table.add_row("Trustworthy", "yes" if results["trustworthy"] else f"[bold red]no ({results['untrustworthy_reason']})[/bold red]")
+
+    if "agents" in results:
+        for a in results["agents"]:
+            lag = a.get("loop_lag")
+            table.add_row(f"Agent {a['agent']}", f"{a['successful_requests']} ok, clock offset {a['clock_offset'] * 1000:+.1f}ms "
+                          f"(rtt {a['rtt'] * 1000:.1f}ms), CPU {a['cpu_percent']:.1f}%"
+                          + (f", loop lag p99 {lag['p99'] * 1000:.1f}ms" if lag and lag["p99"] is not None else ""))
+        table.add_row("Agent Start Spread", f"{results['start_spread'] * 1000:.1f}ms")
+
+    if "endpoints" in results:
+        # 每个端点（副本）的成功请求数、吞吐和 TTFT
+        for url, stats in results["endpoints"].items():
+            ttft = stats["time_to_first_token"]["p95"]
+            table.add_row(f"Endpoint {url}", f"{stats['successful_requests']} ok, {stats['requests_per_second']:.2f} req/s"
+                          + (f", TTFT p95 {ttft:.4f}s" if ttft is not None else ""))
+        if results["routing"]["load_imbalance"] is not None:
+            table.add_row("Load Imbalance (max/mean)", f"{results['routing']['load_imbalance']:.2f}")
+
+    if "errors" in results:
+        for error, count in sorted(results["errors"].items(), key=lambda e: -e[1]):
+            table.add_row(f"Errors ({error})", str(count))
+        for category, count in results.get("error_categories", {}).items():
+            table.add_row(f"Error Category ({category})", str(count))
+
+    if "abort" in results:
+        abort = results["abort"]
+        table.add_row("Aborted Requests", f"{abort['aborted_requests']} ({abort['tokens_received_before_abort']} tokens received)")
+        table.add_row("Received Tokens per Second", f"{abort['received_tokens_per_second']:.2f}")
+        if abort["ttft_after_abort"]:
+            table.add_row("TTFT after Abort (p50/p99)", f"{abort['ttft_after_abort']['p50']:.4f}s / {abort['ttft_after_abort']['p99']:.4f}s")
+        if abort["wasted_tokens"] is not None:
+            table.add_row("Server Wasted Tokens", f"{abort['wasted_tokens']:.0f} ({abort['wasted_fraction']:.1%} of generated)")
+        if "baseline" in abort:
+            for key, label in [("useful_throughput_ratio", "Useful Throughput vs Baseline"),
+                               ("ttft_p99_ratio", "TTFT p99 vs Baseline"),
+                               ("tpot_p50_ratio", "TPOT p50 vs Baseline"),
+                               ("ttft_after_abort_p50_ratio", "TTFT after Abort vs Baseline p50")]:
+                if abort[key] is not None:
+                    table.add_row(label, f"{abort[key]:.2f}x")
+
+    if "overload" in results:
+        overload = results["overload"]
+        buildup, recovery = overload["queue_buildup"], overload["recovery"]
+        for phase, stats in overload["phases"].items():
+            ttft = stats["time_to_first_token"]["p50"]
+            table.add_row(f"Phase {phase} ({stats['start']:.0f}-{stats['end']:.0f}s)",
+                          f"{stats['requests_per_second']:.2f} req/s, error rate {stats['error_rate']:.1%}, "
+                          f"TTFT p50 {ttft:.3f}s" if ttft is not None else f"error rate {stats['error_rate']:.1%}")
+        if buildup["ttft_slope"] is not None:
+            table.add_row("TTFT Growth during Burst", f"{buildup['ttft_slope']:+.3f}s per second")
+        if buildup["peak_ttft_p50"] is not None:
+            table.add_row("Peak TTFT p50", f"{buildup['peak_ttft_p50']:.3f}s at {buildup['peak_ttft_time']:+.0f}s from burst start")
+        table.add_row("Peak In-flight", str(buildup["peak_in_flight"]))
+        table.add_row("Time to Recover", f"{recovery['time_to_recover']:.0f}s after the burst" if recovery["recovered"] else "not recovered")
+
+    for name, stats in results.get("classes", {}).items():
+        ttft, tpot = stats["time_to_first_token"], stats["time_per_output_token"]
+        row = f"{stats['successful_requests']}/{stats['total_requests']} ok, {stats['requests_per_second']:.2f} req/s"
+        if ttft["p50"] is not None:
+            row += f", TTFT p50/p99 {ttft['p50']:.3f}s/{ttft['p99']:.3f}s"
+        if tpot["p50"] is not None:
+            row += f", TPOT p50/p99 {tpot['p50'] * 1000:.1f}ms/{tpot['p99'] * 1000:.1f}ms"
+        if "goodput" in stats:
+            row += f", SLO {stats['goodput']['attainment']:.1%}"
+        table.add_row(f"Class {name}", row)
+        interference = stats.get("interference")
+        if interference:
+            table.add_row(f"Class {name} vs Alone", ", ".join(
+                f"{label} {interference[key]:.2f}x" for key, label in
+                [("ttft_p99_ratio", "TTFT p99"), ("tpot_p50_ratio", "TPOT p50"), ("tpot_p99_ratio", "TPOT p99")]
+                if interference[key] is not None))
+
+    if "batch" in results:
+        batch = results["batch"]
+        table.add_row("Batch", f"{batch['num_prompts']} prompts, {batch['prompts_per_request']} per request, n={batch['n']}, "
+                      f"{'streaming' if batch['stream'] else 'non-streaming'}, {batch['max_in_flight']} in flight")
+        if results["prompts_per_request"] < batch["prompts_per_request"]:
+            table.add_row("Prompts per Request", f"{results['prompts_per_request']:.2f} (only prompts with the same max_tokens "
+                          f"and extra_body share a request)")
+        table.add_row("Time to Drain", f"{results['time_to_drain']:.2f}s (tail {results['drain_tail']:.2f}s after the last send)")
+        table.add_row("Sequences per Second", f"{results['sequences_per_second']:.2f}")
+        completion = results["completion_time"]
+        if completion["p50"] is not None:
+            table.add_row("Completion Time (p50/p90/p99)",
+                          f"{completion['p50']:.2f}s / {completion['p90']:.2f}s / {completion['p99']:.2f}s")
+
     table.add_row("Requests per Second", f"{results['requests_per_second']:.2f}")
+    if "goodput" in results:
+        goodput = results["goodput"]
+        # 混合负载的 SLO 按类别给出
+        table.add_row("SLO", "; ".join(
+            f"{k}: " + ", ".join(f"{m} <= {t}s" for m, t in v.items()) if isinstance(v, dict) else f"{k} <= {v}s"
+            for k, v in goodput["slo"].items()))
+        table.add_row("SLO Attainment", f"{goodput['attainment'] * 100:.2f}%")
+        for key, attainment in goodput["attainment_by_metric"].items():
+            table.add_row(f"SLO Attainment ({key})", f"{attainment * 100:.2f}%")
+        table.add_row("Goodput (req/s)", f"{goodput['requests_per_second']:.2f}")
+        table.add_row("Goodput (output tok/s)", f"{goodput['output_tokens_per_second']:.2f}")
+
+    if "server_metrics" in results:
+        server = results["server_metrics"]["summary"]
+        for key, label, fmt in [
+            ("peak_running", "Server Peak Running", "{:.0f}"),
+            ("peak_waiting", "Server Peak Waiting", "{:.0f}"),
+            ("max_kv_cache_usage", "Server Max KV Cache Usage", "{:.1%}"),
+            ("preemptions", "Server Preemptions", "{:.0f}"),
+            ("prefix_cache_hit_rate", "Server Prefix Cache Hit Rate", "{:.1%}"),
+            ("avg_batch_tokens", "Server Avg Batch Tokens", "{:.1f}"),
+        ]:
+            if server.get(key) is not None:
+                table.add_row(label, fmt.format(server[key]))
+
     table.add_row("Total Output Tokens", str(results["total_output_tokens"]))
+    table.add_row("Total Input Tokens", str(results["total_input_tokens"]))
+    table.add_row("Input Tokens per Second", f"{results['input_tokens_per_second']:.2f}")
+    table.add_row("Output Tokens per Second", f"{results['output_tokens_per_second']:.2f}")
     
-    # 添加延迟信息
-    table.add_row("Latency (avg)", f"{results['latency']['average']:.4f}s")
-    table.add_row("Latency (p50)", f"{results['latency']['p50']:.4f}s")
-    table.add_row("Latency (p95)", f"{results['latency']['p95']:.4f}s")
-    table.add_row("Latency (p99)", f"{results['latency']['p99']:.4f}s")
-    
-    # 添加生成速度信息
-    table.add_row("Tokens per Second (avg)", f"{results['tokens_per_second']['average']:.2f}")
-    table.add_row("Tokens per Second (p50)", f"{results['tokens_per_second']['p50']:.2f}")
-    table.add_row("Tokens per Second (p95)", f"{results['tokens_per_second']['p95']:.2f}")
-    table.add_row("Tokens per Second (p99)", f"{results['tokens_per_second']['p99']:.2f}")
+    # 添加延迟、生成速度和首字时间信息（没有成功请求时跳过）
+    for key, label, fmt in [
+        ("latency", "Latency", "{:.4f}s"),
+        ("tokens_per_second", "Tokens per Second", "{:.2f}"),
+        ("time_to_first_token", "Time to First Token", "{:.4f}s"),
+    ]:
+        stats = results[key]
+        if stats["p50"] is None:
+            continue
+        for p in ["average", "p50", "p95", "p99"]:
+            table.add_row(f"{label} ({'avg' if p == 'average' else p})", fmt.format(stats[p]))
     
-    # 添加首字时间信息
-    table.add_row("Time to First Token (avg)", f"{results['time_to_first_token']['average']:.4f}s")
-    table.add_row("Time to First Token (p50)", f"{results['time_to_first_token']['p50']:.4f}s")
-    table.add_row("Time to First Token (p95)", f"{results['time_to_first_token']['p95']:.4f}s")
-    table.add_row("Time to First Token (p99)", f"{results['time_to_first_token']['p99']:.4f}s")
+    # 添加解码速度信息（TPOT 和 token 间延迟）
+    for key, label in [("time_per_output_token", "TPOT"), ("inter_token_latency", "ITL")]:
+        stats = results[key]
+        if stats["max"] is None:
+            continue
+        for p in ["p50", "p90", "p95", "p99", "max"]:
+            table.add_row(f"{label} ({p})", f"{stats[p] * 1000:.2f}ms")
     
     console.print(table)
     
@@ -462,4 +861,7 @@ def print_results(results: Dict[str, Any]) -> None:
     print(json.dumps(results, indent=2))
 
 # 主函数被 run_benchmarks.py 中的统一接口替代，但保留外部导入的函数
-__all__ = ['run_benchmark', 'distributed_request_benchmark', 'print_results']
+__all__ = [
+    'run_benchmark', 'distributed_request_benchmark', 'print_results',
+    'collect_concurrent_results', 'collect_distributed_results', 'summarize_results',
+]
@@ -0,0 +1,264 @@
+import json
+import logging
+import math
+import os
+import random
+from array import array
+from typing import List, Dict, Any, Optional, Union
+
+# 合成提示使用的常见英文单词，带前导空格时在主流 BPE 分词器中基本都是单个 token
+SYNTHETIC_WORDS = (
+    "the of and to in is that for it as was with be by on not he this are or his from at which but "
+    "have an they you were her she there been one all we their has would when if so no will can more "
+    "other what time up out about into than them only some could new these two may first then do any "
+    "like my now over such our man me even most made after also did many before must through back years "
+    "where much your way well down should because each just those people how too little state good very "
+    "make world still own see men work long get here between both life being under never day same another "
+    "know while last might us great old year off come since against go came right used take three"
+).split()
+
+WORKLOAD_TYPES = ["builtin", "jsonl", "sharegpt", "synthetic"]
+
+
+def sample_length(spec: Union[int, Dict[str, Any]], rng: random.Random) -> int:
+    """按长度分布采样：整数表示固定值，或 {"dist": "fixed|uniform|lognormal", ...}"""
+    if isinstance(spec, int):
+        return spec
+    dist = spec.get("dist", "fixed")
+    if dist == "fixed":
+        n = spec["value"]
+    elif dist == "uniform":
+        n = rng.randint(spec["min"], spec["max"])
+    elif dist == "lognormal":
+        # mean 为分布的期望值，sigma 为对数空间的标准差
+        sigma = spec.get("sigma", 0.5)
+        n = int(rng.lognormvariate(math.log(spec["mean"]) - sigma * sigma / 2, sigma))
+    else:
+        raise ValueError(f"Unknown length distribution: {dist}")
+    return int(min(max(n, spec.get("min", 1)), spec.get("max", n)))
+
+
+def validate_length(spec: Any, name: str) -> None:
+    """检查长度分布配置，缺少字段或类型不对时抛出 ValueError 而不是 KeyError / TypeError"""
+    try:
+        sample_length(spec, random.Random(0))
+    except (KeyError, TypeError, AttributeError):
+        raise ValueError(f"Invalid '{name}' {spec!r}, expected an integer or {{\"dist\": \"fixed|uniform|lognormal\", ...}}")
+
+
+class JsonlIndex:
+    """JSONL 文件的行偏移索引，只在内存中保存每行的起始位置，按需 seek 读取
+
+    每行只占 8 字节索引，数百万行的数据集也不需要整体加载到内存。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.offsets = array("q")
+        with open(path, "rb") as f:
+            pos = 0
+            for line in f:
+                if line.strip():
+                    self.offsets.append(pos)
+                pos += len(line)
+        if not self.offsets:
+            raise ValueError(f"Dataset {path} is empty")
+        self.file = open(path, "rb")
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def read(self, index: int) -> Dict[str, Any]:
+        self.file.seek(self.offsets[index])
+        return json.loads(self.file.readline())
+
+
+class Workload:
+    """负载来源基类：每次调用 next_request 返回一个请求描述
+
+    请求描述包含 messages、max_tokens，以及可选的 extra_body（如 min_tokens / ignore_eos）。
+    """
+
+    def __init__(self, config: Dict[str, Any], output_tokens: int, seed: Optional[int] = None):
+        self.config = config
+        self.output_tokens = output_tokens
+        self.rng = random.Random(seed)
+
+    def next_request(self) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def output_spec(self, reference_len: Optional[int] = None) -> Dict[str, Any]:
+        """确定输出长度；配置了 output_len 时用 min_tokens + ignore_eos 强制生成指定长度"""
+        if "output_len" in self.config:
+            n = sample_length(self.config["output_len"], self.rng)
+            return {"max_tokens": n, "extra_body": {"min_tokens": n, "ignore_eos": True}}
+        if reference_len is not None and self.config.get("use_reference_output_len", True):
+            n = max(1, min(reference_len, self.output_tokens))
+            return {"max_tokens": n, "extra_body": {"min_tokens": n, "ignore_eos": True}}
+        return {"max_tokens": self.output_tokens, "extra_body": {}}
+
+
+class DatasetWorkload(Workload):
+    """从 JSONL 数据集中随机或顺序采样提示"""
+
+    def __init__(self, config: Dict[str, Any], output_tokens: int, seed: Optional[int] = None):
+        super().__init__(config, output_tokens, seed)
+        self.index = JsonlIndex(config["path"])
+        self.sampling = config.get("sampling", "random")
+        self.position = self.rng.randrange(len(self.index)) if config.get("random_start") else 0
+
+    def next_entry(self) -> Dict[str, Any]:
+        """读取下一条可用样本，跳过无法解析的行"""
+        for _ in range(len(self.index)):
+            if self.sampling == "sequential":
+                i = self.position % len(self.index)
+                self.position += 1
+            else:
+                i = self.rng.randrange(len(self.index))
+            try:
+                entry = self.index.read(i)
+            except json.JSONDecodeError:
+                continue
+            if self.accept(entry):
+                return entry
+        raise ValueError(f"No usable entries in dataset {self.index.path}")
+
+    def accept(self, entry: Dict[str, Any]) -> bool:
+        return True
+
+
+class JsonlWorkload(DatasetWorkload):
+    """普通 JSONL 数据集，每行一个对象，prompt_field 指定提示字段"""
+
+    PROMPT_FIELDS = ("prompt", "text", "question", "input", "body")
+
+    def accept(self, entry: Dict[str, Any]) -> bool:
+        return isinstance(entry, dict) and self.prompt_of(entry) is not None
+
+    def prompt_of(self, entry: Dict[str, Any]) -> Optional[str]:
+        fields = [self.config["prompt_field"]] if "prompt_field" in self.config else self.PROMPT_FIELDS
+        for field in fields:
+            if entry.get(field):
+                return str(entry[field])
+        return None
+
+    def next_request(self) -> Dict[str, Any]:
+        entry = self.next_entry()
+        reference = entry.get(self.config["output_len_field"]) if "output_len_field" in self.config else None
+        return {"messages": [{"role": "user", "content": self.prompt_of(entry)}], **self.output_spec(reference)}
+
+
+class ShareGPTWorkload(Workload):
+    """回放 ShareGPT 格式的对话：发送某个助手回复之前的全部历史，输出长度参考原回复
+
+    JSONL（每行一个对话）按偏移索引懒加载；JSON 数组格式需要整体读入内存。
+    """
+
+    ROLES = {"human": "user", "user": "user", "gpt": "assistant", "assistant": "assistant",
+             "chatgpt": "assistant", "bard": "assistant", "bing": "assistant", "system": "system"}
+
+    def __init__(self, config: Dict[str, Any], output_tokens: int, seed: Optional[int] = None):
+        super().__init__(config, output_tokens, seed)
+        path = config["path"]
+        if path.endswith(".json"):
+            logging.warning(f"Loading {path} fully into memory; convert it to JSONL for lazy sampling")
+            with open(path, "r") as f:
+                self.entries = [e for e in json.load(f) if len(e.get("conversations", [])) >= 2]
+            self.index = None
+        else:
+            self.index = JsonlIndex(path)
+            self.entries = None
+        self.turns = config.get("turns", "first")
+
+    def sample_conversation(self) -> List[Dict[str, str]]:
+        for _ in range(1000):
+            if self.entries is not None:
+                entry = self.rng.choice(self.entries)
+            else:
+                try:
+                    entry = self.index.read(self.rng.randrange(len(self.index)))
+                except json.JSONDecodeError:
+                    continue
+            messages = [
+                {"role": self.ROLES.get(turn.get("from", turn.get("role")), "user"),
+                 "content": turn.get("value", turn.get("content", ""))}
+                for turn in entry.get("conversations", entry.get("messages", []))
+            ]
+            # 至少需要一个用户提问和一个助手回复
+            if any(m["role"] == "assistant" for m in messages[1:]):
+                return messages
+        raise ValueError(f"No usable conversations in {self.config['path']}")
+
+    def next_request(self) -> Dict[str, Any]:
+        messages = self.sample_conversation()
+        replies = [i for i, m in enumerate(messages) if m["role"] == "assistant" and i > 0]
+        target = replies[0] if self.turns == "first" else self.rng.choice(replies)
+        # 没有分词器时按约 4 个字符一个 token 估计原回复长度
+        reference_len = max(1, len(messages[target]["content"]) // 4)
+        return {"messages": messages[:target], **self.output_spec(reference_len)}
+
+
+class SyntheticWorkload(Workload):
+    """生成指定输入 token 长度的随机提示，每个请求内容不同以避免命中前缀缓存
+
+    未配置 tokenizer 时每个单词按 1 个 token 计；配置后使用 transformers 分词器精确截断。
+    """
+
+    def __init__(self, config: Dict[str, Any], output_tokens: int, seed: Optional[int] = None):
+        super().__init__(config, output_tokens, seed)
+        self.tokenizer = None
+        if config.get("tokenizer"):
+            try:
+                from transformers import AutoTokenizer
+            except ImportError:
+                raise ValueError("Synthetic workload with 'tokenizer' requires the 'transformers' package")
+            self.tokenizer = AutoTokenizer.from_pretrained(config["tokenizer"])
+
+    def make_prompt(self, num_tokens: int) -> str:
+        words = self.rng.choices(SYNTHETIC_WORDS, k=num_tokens)
+        text = " " + " ".join(words)
+        if self.tokenizer is None:
+            return text
+        ids = self.tokenizer.encode(text, add_special_tokens=False)
+        while len(ids) < num_tokens:
+            ids += self.tokenizer.encode(" " + " ".join(self.rng.choices(SYNTHETIC_WORDS, k=num_tokens - len(ids))),
+                                         add_special_tokens=False)
+        return self.tokenizer.decode(ids[:num_tokens])
+
+    def next_request(self) -> Dict[str, Any]:
+        input_len = sample_length(self.config.get("input_len", 512), self.rng)
+        request = {"messages": [{"role": "user", "content": self.make_prompt(input_len)}], "input_len": input_len}
+        if "output_len" not in self.config:
+            # 合成负载默认也强制输出长度，保证 decode 负载可控
+            return {**request, "max_tokens": self.output_tokens,
+                    "extra_body": {"min_tokens": self.output_tokens, "ignore_eos": True}}
+        return {**request, **self.output_spec()}
+
+
+def validate_workload_config(workload: Dict[str, Any]) -> None:
+    """检查 workload 配置，错误时抛出 ValueError"""
+    kind = workload.get("type")
+    if kind not in WORKLOAD_TYPES:
+        raise ValueError(f"Invalid workload type '{kind}'. Must be one of: {', '.join(WORKLOAD_TYPES)}")
+    if kind in ("jsonl", "sharegpt"):
+        if "path" not in workload:
+            raise ValueError(f"Workload type '{kind}' requires 'path'")
+        if not os.path.exists(workload["path"]):
+            raise ValueError(f"Workload dataset not found: {workload['path']}")
+    for key in ("input_len", "output_len"):
+        if key in workload:
+            validate_length(workload[key], f"workload.{key}")
+
+
+def build_workload(workload: Optional[Dict[str, Any]], output_tokens: int, seed: Optional[int] = None) -> Optional[Workload]:
+    """根据配置创建负载来源，builtin 或未配置时返回 None（使用内置提示）"""
+    if not workload or workload.get("type", "builtin") == "builtin":
+        return None
+    kind = workload["type"]
+    if kind == "jsonl":
+        return JsonlWorkload(workload, output_tokens, seed)
+    if kind == "sharegpt":
+        return ShareGPTWorkload(workload, output_tokens, seed)
+    if kind == "synthetic":
+        return SyntheticWorkload(workload, output_tokens, seed)
+    raise ValueError(f"Invalid workload type '{kind}'")